@@ -5,16 +5,77 @@
 """
 from tkinter import *
 
+class substring_filter():
+    """
+    Case insensitive substring search over a list of strings. Lowercase values are computed once,
+    a query that extends the previous query only searches the previous matches
+    """
+
+    def __init__(self, values=()):
+        self.set_values(values)
+
+    def set_values(self, values):
+        """
+        Set the strings that are searched, a list of fields is searched as the fields joined by commas
+        """
+        self.__lower_values__ = [(value if isinstance(value, str) else ",".join(map(str, value))).lower() for value in values]
+        self.__all__ = list(range(len(self.__lower_values__)))
+        self.__query__ = ''
+        self.__matches__ = self.__all__
+
+    def filter(self, query) -> list[int]:
+        """
+        Get the indices of values that contain query, in the order of values
+        """
+        query = query.lower()
+
+        if query == '':
+            matches = self.__all__
+        else:
+            #narrow the previous matches when the query was extended
+            if self.__query__ != '' and self.__query__ in query:
+                candidates = self.__matches__
+            else:
+                candidates = self.__all__
+
+            lower_values = self.__lower_values__
+            matches = [i for i in candidates if query in lower_values[i]]
+
+        self.__query__ = query
+        self.__matches__ = matches
+        return matches
+
 class Searchbox(Frame):
     """
     Custom tkinter widget for searching a listbox widget when typing in the entry widget. Triggers "<<SearchboxSelect>>" when an item is selected.
     """
+    MAX_LISTBOX_CHANGES = 64    #more separate changes than this rebuilds the listbox instead
+    VIRTUAL_MARGIN = 20         #rows rendered above and below the visible rows in virtual mode
     
-    def __init__(self, parent, values, *args, **kwargs):
+    def __init__(self, parent, values, *args, debounce=100, virtual=False, search=None, search_values=None, **kwargs):
         """
-        Custom tkinter widget for searching a listbox widget when typing in the entry widget
+        Custom tkinter widget for searching a listbox widget when typing in the entry widget.
+        The list is filtered once typing pauses for debounce milliseconds.
+        virtual only puts the visible rows and a small margin in the listbox, the scrollbar covers every match.
+        Used for very large lists.
+        search filters the values, any object with set_values(values) and filter(query) -> indices such as fuzzy_index.
+        Defaults to a substring_filter. search_values are searched instead of values, same order as values
         """
         Frame.__init__(self,parent, *args, **kwargs)
+
+        self.debounce = debounce
+        self.virtual = virtual
+        self.__filter_id__ = None
+        self.__search__ = search if search != None else substring_filter()
+        self.__shown__ = []     #indices of values shown in the listbox, None when unknown
+        self.__shown_ordered__ = True   #shown indices are in the order of values
+
+        #virtual mode
+        self.__matches__ = []       #indices of every value that matches the search
+        self.__first__ = 0          #match shown in the top row of the listbox
+        self.__window_start__ = 0   #match in the first listbox row
+        self.__selected__ = None    #index in values of the selected item
+        self.__match_set__ = None   #matches as a set, built when the selection is checked
         
         #Define entry
         self.Entry = Entry(self) 
@@ -22,14 +83,19 @@ class Searchbox(Frame):
         self.Entry.bind("<Button-1>", self.__clear_selected__) 
         
         #set the values of the listbox
-        self.values = values
         self.Listbox = Listbox(self) 
         self.Listbox.bind('<<ListboxSelect>>', self.__save_selected__)
-        self.update(self.values) 
 
-        #attach scrollbar to listbox
-        self.scroll = Scrollbar(self, command= self.Listbox.yview)
-        self.Listbox['yscrollcommand'] = self.scroll.set
+        #attach scrollbar to listbox, in virtual mode the scrollbar moves through all matches instead
+        if self.virtual == True:
+            self.scroll = Scrollbar(self, command=self.__scroll__)
+            self.Listbox.bind('<MouseWheel>', self.__mouse_wheel__)
+            self.Listbox.bind('<Button-4>', self.__mouse_wheel__)
+            self.Listbox.bind('<Button-5>', self.__mouse_wheel__)
+        else:
+            self.scroll = Scrollbar(self, command= self.Listbox.yview)
+            self.Listbox['yscrollcommand'] = self.scroll.set
+        self.set_values(values, search_values)
 
         #layout
         self.Entry.grid(column=0,row=0, sticky='nsew') 
@@ -37,40 +103,186 @@ class Searchbox(Frame):
         self.scroll.grid(column=1, row=1, sticky='ns')
 
 
-    def filter_list(self, event):
+    def filter_list(self, event=None):
         '''
         Filter the elements in the list to only
-        show elements that contain the text entered
+        show elements that contain the text entered.
+        Waits until typing pauses before filtering
         ''' 
-        
-        #Get text in entry widget
-        entry_text = event.widget.get() 
-        
-        #Set to full list when text is empty
-        if entry_text == '': 
-            new_list = self.values 
-        
-        #Filter list
-        else: 
-            new_list = [] 
-            for item in self.values: 
-                if entry_text.lower() in item.lower(): 
-                    new_list.append(item)                 
-    
-        self.update(new_list) 
-    
+        if self.__filter_id__ != None:
+            self.after_cancel(self.__filter_id__)
+        self.__filter_id__ = self.after(self.debounce, self.__apply_filter__)
+
+    def apply_filter(self):
+        '''
+        Filter the list with the text in the entry widget now instead of waiting for typing to pause
+        '''
+        if self.__filter_id__ != None:
+            self.after_cancel(self.__filter_id__)
+        self.__apply_filter__()
+
+    def __apply_filter__(self):
+        '''
+        Filter the list with the text in the entry widget
+        '''
+        self.__filter_id__ = None
+        matches = self.__search__.filter(self.Entry.get())
+        self.__show__(matches)
     
     def update(self, filtered_data):
         '''
         update data in listbox 
         ''' 
 
+        state = self.__enable_listbox__()
+
         #Empty list
         self.Listbox.delete(0, 'end') 
     
         #Populate list with filtered elements
-        for item in filtered_data: 
-            self.Listbox.insert('end', item)
+        self.Listbox.insert('end', *filtered_data)
+        self.__shown__ = None
+
+        self.Listbox.config(state=state)
+
+    def __show__(self, indices: list[int]):
+        '''
+        Show the values at indices in the listbox. Only rows that changed are deleted or inserted,
+        the listbox is rebuilt when the changes are too scattered to be cheaper
+        '''
+        if self.virtual == True:
+            #the selection is checked against the new matches when it is read
+            self.__matches__ = indices
+            self.__match_set__ = None
+            self.__first__ = 0
+            self.__render_window__()
+            self.__scroll_to__(0)
+            return
+
+        #ranked searches do not keep the order of values, the rows can not be compared
+        ordered = all(indices[i] < indices[i + 1] for i in range(len(indices) - 1))
+        if self.__shown__ == None or ordered == False or self.__shown_ordered__ == False:
+            self.update([self.values[i] for i in indices])
+            self.__shown__ = indices
+            self.__shown_ordered__ = ordered
+            return
+
+        #find runs of rows to delete and insert, listbox rows are in the same order as values
+        old = self.__shown__
+        changes = []    #(row, number of rows to delete, indices to insert)
+        row = 0
+        i = 0
+        j = 0
+        while i < len(old) or j < len(indices):
+            #run of rows that are no longer shown
+            if j == len(indices) or (i < len(old) and old[i] < indices[j]):
+                start = i
+                while i < len(old) and (j == len(indices) or old[i] < indices[j]):
+                    i += 1
+                changes.append((row, i - start, None))
+
+            #run of rows that are now shown
+            elif i == len(old) or indices[j] < old[i]:
+                start = j
+                while j < len(indices) and (i == len(old) or indices[j] < old[i]):
+                    j += 1
+                changes.append((row, 0, indices[start:j]))
+                row += j - start
+
+            #row is unchanged
+            else:
+                i += 1
+                j += 1
+                row += 1
+
+        if len(changes) > self.MAX_LISTBOX_CHANGES:
+            self.update([self.values[i] for i in indices])
+        else:
+            state = self.__enable_listbox__()
+            for row, delete_count, inserted in changes:
+                if delete_count > 0:
+                    self.Listbox.delete(row, row + delete_count - 1)
+                else:
+                    self.Listbox.insert(row, *[self.values[k] for k in inserted])
+            self.Listbox.config(state=state)
+
+        self.__shown__ = indices
+        self.__shown_ordered__ = True
+
+    def __enable_listbox__(self) -> str:
+        """
+        A disabled listbox ignores inserts and deletes, enable it while rows change. Returns the state to restore
+        """
+        state = self.Listbox.cget('state')
+        if state != 'normal':
+            self.Listbox.config(state='normal')
+        return state
+
+    def __visible_rows__(self) -> int:
+        """
+        Number of rows the listbox shows at once
+        """
+        height = int(self.Listbox.cget('height'))
+        return height if height > 0 else 10
+
+    def __render_window__(self):
+        """
+        Put the visible matches and a margin around them in the listbox, virtual mode only
+        """
+        start = max(self.__first__ - self.VIRTUAL_MARGIN, 0)
+        end = min(self.__first__ + self.__visible_rows__() + self.VIRTUAL_MARGIN, len(self.__matches__))
+        self.__window_start__ = start
+        self.__shown__ = self.__matches__[start:end]
+
+        state = self.__enable_listbox__()
+        self.Listbox.delete(0, 'end')
+        self.Listbox.insert('end', *[self.values[i] for i in self.__shown__])
+
+        #keep the selection when it is rendered again
+        if self.__selected__ != None and self.__selected__ in self.__shown__:
+            self.Listbox.selection_set(self.__shown__.index(self.__selected__))
+        self.Listbox.config(state=state)
+
+    def __scroll_to__(self, first):
+        """
+        Show the matches starting at first, a new window is only rendered when the visible rows leave the rendered rows
+        """
+        visible = self.__visible_rows__()
+        total = len(self.__matches__)
+        first = max(min(first, total - visible), 0)
+        self.__first__ = first
+
+        if first < self.__window_start__ or first + min(visible, total) > self.__window_start__ + len(self.__shown__):
+            self.__render_window__()
+        self.Listbox.yview(first - self.__window_start__)
+
+        if total == 0:
+            self.scroll.set(0, 1)
+        else:
+            self.scroll.set(first / total, min(first + visible, total) / total)
+
+    def __scroll__(self, *args):
+        """
+        Scrollbar command in virtual mode: ("moveto", fraction) or ("scroll", count, "units" or "pages")
+        """
+        if args[0] == 'moveto':
+            first = int(float(args[1]) * len(self.__matches__))
+        else:
+            count = int(args[1])
+            if args[2] == 'pages':
+                count *= self.__visible_rows__()
+            first = self.__first__ + count
+        self.__scroll_to__(first)
+
+    def __mouse_wheel__(self, event):
+        """
+        Scroll through all matches in virtual mode, the listbox only scrolling its own rows is prevented
+        """
+        if event.num == 4 or event.delta > 0:
+            self.__scroll__('scroll', -3, 'units')
+        else:
+            self.__scroll__('scroll', 3, 'units')
+        return "break"
     
     def __clear_selected__(self,event):
         """
@@ -78,24 +290,32 @@ class Searchbox(Frame):
         """
         self.Entry.delete(0, 'end')
         self.Listbox.selection_clear(0, 'end')
+        self.__selected__ = None
     
     def __save_selected__(self, event):
         """
         Update the entry with the selected listbox item, triggers "<<SearchboxSelect>>" event
         """
         selected_list = event.widget.curselection()
+        if len(selected_list) == 0:
+            self.__selected__ = None    #cleared by tk, for example by a click on empty space
         for i in selected_list:
             self.Entry.delete(0, 'end')
             self.Entry.insert(0, self.Listbox.get(i))
+            if self.__shown__ != None:
+                self.__selected__ = self.__shown__[i]
         self.event_generate("<<SearchboxSelect>>")
 
 
-    def set_values (self, new_values=[]):
+    def set_values (self, new_values=[], search_values=None):
         '''
-        Set the default values of the searchbox
+        Set the default values of the searchbox. search_values are searched instead of the values, same order as new_values
         '''
         self.values = new_values 
-        self.update(new_values)
+        self.__search__.set_values(new_values if search_values == None else search_values)
+        self.__shown__ = None
+        self.__selected__ = None
+        self.__show__(self.__search__.filter(''))
     
     def curselection(self):
         """
@@ -110,6 +330,10 @@ class Searchbox(Frame):
         """
         Get the selected item
         """
+        if self.virtual == True:
+            index = self.get_selected_index()
+            return self.values[index] if index != None else None
+
         filtered_index = self.curselection()
         if (filtered_index != None):
             selected_item = self.Listbox.get(filtered_index)
@@ -124,14 +348,35 @@ class Searchbox(Frame):
         """
         Returns the index of the selected item in the ENTIRE list
         """
-        selected_item = self.get_selected()
-        
-        if(selected_item != None):
-            index = self.values.index(selected_item)
-            return index
-        else:
+        #the selected row may be scrolled out of the rendered rows in virtual mode
+        if self.virtual == True:
+            self.__sync_selected__()
+            return self.__selected__
+
+        filtered_index = self.curselection()
+        if (filtered_index == None):
             return None
+
+        if (self.__shown__ != None):
+            return self.__shown__[filtered_index]
+        
+        selected_item = self.get_selected()
+        return self.values.index(selected_item)
     
+    def __sync_selected__(self):
+        """
+        Forget the selection in virtual mode when it is no longer a match, or when tk deselected its rendered row
+        """
+        if self.__selected__ == None:
+            return
+        if self.__match_set__ == None:
+            self.__match_set__ = set(self.__matches__)
+        if self.__selected__ not in self.__match_set__:
+            self.__selected__ = None
+        elif self.__selected__ in self.__shown__:
+            if self.__shown__.index(self.__selected__) not in self.Listbox.curselection():
+                self.__selected__ = None
+
     def get_entry_text(self):
         """
         Gets the text in the entry widget
@@ -8,6 +8,7 @@ from tkinter import ttk
 
 from peripherals.as5600 import as5600
 from peripherals.openscale import openscale
+from peripherals import instrumentation
 
 class tk_indicator(Frame):
     '''
@@ -50,6 +51,15 @@ class tk_indicator(Frame):
         #create moving box
         self.rect = self.canvas.create_rectangle(box_start_coords,box_end_coords, fill='green')
 
+        #last rendered state of the moving box, Tk is only called when it changes
+        self.__rendered_fill__ = 'green'
+        self.__rendered_coords__ = None
+
+        #render statistics
+        self.updates_issued = 0     #updates that changed the canvas
+        self.updates_skipped = 0    #updates where nothing moved at pixel resolution
+        self.tk_calls = 0
+
         #layout
         self.low_label.grid(column=0, row=0)
         self.high_label.grid(column=4, row=0)
@@ -92,11 +102,13 @@ class tk_indicator(Frame):
         #Move and resize box to new position on canvas
         self.canvas.coords(self.error_rect, box_start_coords, 0, box_end_coords, self.height)
     
-    def update(self, new_value, target_value) -> None:
+    def update(self, new_value, target_value) -> bool:
         '''
         Calculate the error between the new value and the target value
-        then display it to the user
+        then display it to the user. Returns true when the canvas was changed,
+        nothing is sent to Tk when the box did not change color or move by a pixel
         '''
+        started = instrumentation.start()
         max = self.width
         min = 0
         origin = self.width/2
@@ -120,12 +132,51 @@ class tk_indicator(Frame):
 
         #Change color of box if error is greater then 1 error margin
         if ((num_error_margin_off <= 1) and (num_error_margin_off >= -1) ):
-            self.canvas.itemconfig(self.rect, fill='green')
+            fill = 'green'
         else:
-            self.canvas.itemconfig(self.rect, fill='red')
+            fill = 'red'
+
+        #snap to pixels
+        coords = (round(box_start_coords), round(box_end_coords))
+
+        changed = False
+        if fill != self.__rendered_fill__:
+            self.canvas.itemconfig(self.rect, fill=fill)
+            self.__rendered_fill__ = fill
+            self.tk_calls += 1
+            changed = True
         
         #set new box location
-        self.canvas.coords(self.rect, box_start_coords, 0, box_end_coords, self.height)
+        if coords != self.__rendered_coords__:
+            self.canvas.coords(self.rect, coords[0], 0, coords[1], self.height)
+            self.__rendered_coords__ = coords
+            self.tk_calls += 1
+            changed = True
+
+        if changed:
+            self.updates_issued += 1
+        else:
+            self.updates_skipped += 1
+        instrumentation.stop("tk_indicator.update", started)
+        return changed
+
+    def get_render_stats(self) -> dict:
+        """
+        Get the number of updates that changed the canvas, updates that were skipped, and Tk calls made by update
+        """
+        return {
+            "updates_issued": self.updates_issued,
+            "updates_skipped": self.updates_skipped,
+            "tk_calls": self.tk_calls,
+        }
+
+    def reset_render_stats(self):
+        """
+        Set the render statistics back to 0
+        """
+        self.updates_issued = 0
+        self.updates_skipped = 0
+        self.tk_calls = 0
 
 def move_box():
     indicator.update(sensor.linear_position(), -10)
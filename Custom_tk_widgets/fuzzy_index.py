@@ -0,0 +1,274 @@
+"""
+    Description: ranked fuzzy search over every field of a list of records, can replace substring_filter in a Searchbox
+"""
+import bisect
+import re
+
+class fuzzy_index():
+    """
+    Search index over records of text fields, for example patient.get_data(). A record can also be a string of comma separated fields.
+    Each query word must match a field of the record, matches are ranked:
+        exact field > field starts with the word > field contains the word > field is one typo away from the word.
+    Typos are only matched for words that no field starts with
+    The index is built incrementally, set_values only indexes records that changed since the last values
+    """
+
+    EXACT = 4
+    PREFIX = 3
+    SUBSTRING = 2
+    TYPO = 1
+
+    def __init__(self, values=()):
+        self.__records__ = []           #lowercase fields of each record by record id, None once removed
+        self.__values__ = None          #last values passed to set_values
+        self.__keys__ = []              #copy of each value by index, compared to find changed values
+        self.__order__ = []             #record id by index in values
+        self.__positions__ = {}         #record id -> index in values
+        self.__postings__ = {}          #term -> ids of records with the term
+        self.__sorted_terms__ = []      #every term sorted, prefix search
+        self.__grams__ = {}             #1 to 3 characters -> terms containing them, substring search
+        self.__deletes__ = {}           #term with one character deleted -> terms, typo search
+        self.set_values(values)
+
+    def set_values(self, values):
+        """
+        Set the records that are searched, filter returns indices into values.
+        Values are compared to the last values, the unchanged values at the start and end keep their records
+        and only the values between them are removed and indexed again. Passing the same list again does nothing
+        """
+        if values is self.__values__:
+            return
+        self.__values__ = values
+
+        old = self.__keys__
+        limit = min(len(old), len(values))
+        start = 0
+        while start < limit and values[start] == old[start]:
+            start += 1
+        end = 0
+        while end < limit - start and values[len(values) - 1 - end] == old[len(old) - 1 - end]:
+            end += 1
+
+        for record_id in self.__order__[start:len(old) - end]:
+            self.__remove_record__(record_id)
+
+        changed = values[start:len(values) - end]
+        self.__order__[start:len(old) - end] = [self.__index_record__(value) for value in changed]
+        self.__keys__[start:len(old) - end] = [self.__copy_value__(value) for value in changed]
+
+        #values after the change moved
+        for position in range(start, len(values)):
+            self.__positions__[self.__order__[position]] = position
+
+    def add(self, value):
+        """
+        Index one more record, it is found at the index after the last value
+        """
+        record_id = self.__index_record__(value)
+        self.__positions__[record_id] = len(self.__order__)
+        self.__order__.append(record_id)
+        self.__keys__.append(self.__copy_value__(value))
+        self.__values__ = None
+
+    def __len__(self):
+        return len(self.__positions__)
+
+    def filter(self, query) -> list[int]:
+        """
+        Get the indices of values matching every word of query, best matches first.
+        Equally ranked matches are in the order of values
+        """
+        words = [word for word in re.split(r"[\s,]+", query.lower()) if word != '']
+        if len(words) == 0:
+            return sorted(self.__positions__.values())
+
+        #records matching every word, combined from each word's tiers of (score, record ids) with set intersections.
+        #tiers of a word never share records, so each record is in one combination
+        combinations = [(0, None)]
+        for word in words:
+            combined = []
+            for total, ids in combinations:
+                for score, word_ids in self.__match_word__(word):
+                    matched = word_ids if ids == None else ids & word_ids
+                    if len(matched) > 0:
+                        combined.append((total + score, matched))
+            combinations = combined
+
+        by_score = {}
+        for total, ids in combinations:
+            by_score.setdefault(total, []).append(ids)
+
+        ranked = []
+        for total in sorted(by_score, reverse=True):
+            ranked += sorted(map(self.__positions__.__getitem__, set().union(*by_score[total])))
+        return ranked
+
+    def __copy_value__(self, value):
+        """
+        Copy of a value kept to compare to the next values, lists can be changed by the caller
+        """
+        return value if isinstance(value, str) else tuple(value) if isinstance(value, tuple) else list(value)
+
+    def __fields__(self, value) -> tuple:
+        """
+        Lowercase fields of a record
+        """
+        if isinstance(value, str):
+            value = value.split(",")
+        return tuple(str(field).strip().lower() for field in value)
+
+    def __terms__(self, fields) -> set:
+        """
+        Searchable terms of a record, every field and every word of a field with more than one word
+        """
+        terms = set()
+        for field in fields:
+            if field == '':
+                continue
+            terms.add(field)
+            terms.update(word for word in field.split() if word != '')
+        return terms
+
+    def __index_record__(self, value) -> int:
+        fields = self.__fields__(value)
+        record_id = len(self.__records__)
+        self.__records__.append(fields)
+
+        for term in self.__terms__(fields):
+            postings = self.__postings__.get(term)
+            if postings == None:
+                postings = self.__postings__[term] = set()
+                self.__index_term__(term)
+            postings.add(record_id)
+        return record_id
+
+    def __remove_record__(self, record_id):
+        fields = self.__records__[record_id]
+        self.__records__[record_id] = None
+        self.__positions__.pop(record_id, None)
+
+        for term in self.__terms__(fields):
+            postings = self.__postings__[term]
+            postings.discard(record_id)
+            if len(postings) == 0:
+                del self.__postings__[term]
+                self.__remove_term__(term)
+
+    def __index_term__(self, term):
+        bisect.insort(self.__sorted_terms__, term)
+        for gram in self.__get_grams__(term):
+            self.__grams__.setdefault(gram, set()).add(term)
+        for variant in self.__get_deletes__(term):
+            self.__deletes__.setdefault(variant, set()).add(term)
+
+    def __remove_term__(self, term):
+        index = bisect.bisect_left(self.__sorted_terms__, term)
+        del self.__sorted_terms__[index]
+        for gram in self.__get_grams__(term):
+            self.__discard__(self.__grams__, gram, term)
+        for variant in self.__get_deletes__(term):
+            self.__discard__(self.__deletes__, variant, term)
+
+    def __discard__(self, index, key, term):
+        """
+        Remove term from the set of key, the key is removed when its set is empty
+        """
+        terms = index[key]
+        terms.discard(term)
+        if len(terms) == 0:
+            del index[key]
+
+    def __get_grams__(self, term) -> set:
+        """
+        Every 1, 2 and 3 characters of the term. Words shorter than 3 characters are looked up directly, longer words by their 3 character grams
+        """
+        return {term[i:i + length] for length in (1, 2, 3) for i in range(len(term) - length + 1)}
+
+    def __get_trigrams__(self, word) -> set:
+        return {word[i:i + 3] for i in range(len(word) - 2)}
+
+    def __get_deletes__(self, term) -> set:
+        """
+        The term with each character deleted, two terms one typo apart share a variant
+        """
+        return {term[:i] + term[i + 1:] for i in range(len(term))} | {term}
+
+    def __match_word__(self, word) -> list[tuple[int, set]]:
+        """
+        Records matching a query word as tiers of (score, record ids), best tier first. Each record is only in its best tier
+        """
+        found = {}      #term -> score
+
+        #prefix, terms starting with word are next to each other in the sorted terms
+        start = bisect.bisect_left(self.__sorted_terms__, word)
+        end = bisect.bisect_left(self.__sorted_terms__, word + '\uffff', start)
+        for term in self.__sorted_terms__[start:end]:
+            found[term] = self.EXACT if term == word else self.PREFIX
+
+        #substring, terms containing a short word are indexed, longer words must have every 3 characters in the term
+        if len(word) < 3:
+            candidates = self.__grams__.get(word, ())
+        else:
+            trigrams = sorted((self.__grams__.get(trigram, set()) for trigram in self.__get_trigrams__(word)), key=len)
+            candidates = set.intersection(*trigrams)
+        for term in candidates:
+            if term not in found and word in term:
+                found[term] = self.SUBSTRING
+
+        #one typo, an inserted, deleted, replaced or swapped character. Only when no field starts with the word
+        if len(word) >= 3 and len(found) == 0:
+            for variant in self.__get_deletes__(word):
+                for term in self.__deletes__.get(variant, ()):
+                    if term not in found and self.__one_typo__(word, term):
+                        found[term] = self.TYPO
+
+        tiers = []
+        seen = set()
+        for score in (self.EXACT, self.PREFIX, self.SUBSTRING, self.TYPO):
+            ids = set()
+            for term, term_score in found.items():
+                if term_score == score:
+                    ids |= self.__postings__[term]
+            ids -= seen
+            if len(ids) > 0:
+                tiers.append((score, ids))
+                seen |= ids
+        return tiers
+
+    def __one_typo__(self, a, b) -> bool:
+        """
+        Check if a and b differ by one inserted, deleted, replaced or swapped character
+        """
+        if abs(len(a) - len(b)) > 1:
+            return False
+        i = 0
+        while i < min(len(a), len(b)) and a[i] == b[i]:
+            i += 1
+        if len(a) == len(b):
+            if a[i + 1:] == b[i + 1:]:
+                return True
+            return i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+        if len(a) > len(b):
+            return a[i + 1:] == b[i:]
+        return a[i:] == b[i + 1:]
+
+
+if __name__ == "__main__":
+    #time queries on a synthetic registry, run with "python -m Custom_tk_widgets.fuzzy_index" from the repository root
+    import time
+    from benchmarks import synthetic_data
+
+    records = synthetic_data.patient_rows(100000)
+    start = time.perf_counter()
+    index = fuzzy_index(records)
+    print("indexed %d records in %.0f ms" % (len(records), (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    index.set_values(records + synthetic_data.patient_rows(10, seed=1))
+    print("added 10 records in %.1f ms" % ((time.perf_counter() - start) * 1000))
+
+    for query in ("msk 00123", "mks,00123", "00123", "knee 0012 003", "acl"):
+        start = time.perf_counter()
+        for i in range(100):
+            matches = index.filter(query)
+        print("%-16s %6d matches, %.3f ms" % (query, len(matches), (time.perf_counter() - start) * 10))
@@ -0,0 +1,89 @@
+"""
+    Description: cached application settings from config.csv, reloaded when the file changes
+"""
+import os
+
+import csv_processor
+
+class app_config():
+    """
+    Parses config.csv into typed, named fields. The file is only parsed again when its modification time changes.
+    Each line of the file is: name, value
+    """
+
+    #name -> (type, default value), also the order used when writing a new config file
+    FIELDS = {
+        "position_error_margin": (float, 0.3),
+        "position_display_sensitivity": (float, 50),
+        "force_error_margin": (float, 0.1),
+        "force_display_sensitivity": (float, 30),
+        "encoder_calibration": (float, -1.8122e-05),
+        "encoder_model": (str, ""),     #multi-point calibration from calibrate_as5600.py, replaces encoder_calibration when set
+        "scan_flush_every": (int, 1),
+        "scan_format": (str, "csv"),
+        "record_trace": (int, 0),      #1 records the sensor trajectory of first scans to patient_scan_data/traces/
+        "instrumentation": (int, 0),
+        "storage": (str, "files"),
+    }
+
+    def __init__(self, filename):
+        """
+        Load the config file, a file with the default settings is created if it is missing
+        """
+        self.filename = filename
+        self.__mtime__ = None
+
+        if csv_processor.create_csv_if_missing(self.filename):
+            default_config = []
+            for name, (field_type, default) in self.FIELDS.items():
+                default_config.append([name, default])
+            csv_processor.write_lines(self.filename, default_config)
+
+        self.reload()
+
+    def reload(self):
+        """
+        Parse the config file. Missing or invalid settings use their default value
+        """
+        self.__mtime__ = os.stat(self.filename).st_mtime_ns
+
+        values = {}
+        for name, (field_type, default) in self.FIELDS.items():
+            values[name] = field_type(default)
+
+        for line in csv_processor.get_lines(self.filename):
+            if (len(line) < 2 or line[0] not in self.FIELDS):
+                continue
+
+            name = line[0]
+            field_type = self.FIELDS[name][0]
+            try:
+                values[name] = field_type(line[1])
+            except ValueError as error:
+                print("invalid config value for " + name + ", using default")
+                print(error)
+
+        #publish as attributes, config.position_error_margin etc.
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def refresh(self) -> bool:
+        """
+        Reload the config file if it was modified since it was last parsed. Returns true when settings were reloaded
+        """
+        try:
+            mtime = os.stat(self.filename).st_mtime_ns
+        except OSError:
+            return False
+
+        if (mtime == self.__mtime__):
+            return False
+
+        self.reload()
+        return True
+
+    def get(self, name):
+        """
+        Get a setting by name
+        """
+        return getattr(self, name)
@@ -3,6 +3,8 @@
     Date: Wed Jul 17 12:40:48 AM MDT 2024
     Description: Application to control ultrasound scans to allow for repeatability
 """
+import time
+
 #Import tkinter
 from tkinter import *
 from tkinter import ttk
@@ -10,15 +12,25 @@ from tkinter import messagebox
 from tkinter import font
 from Custom_tk_widgets.canvas_indicator import tk_indicator
 from Custom_tk_widgets.Searchbox import Searchbox
+from Custom_tk_widgets.fuzzy_index import fuzzy_index
 
 #Import sensors
 from peripherals.as5600 import as5600
 from peripherals.openscale import openscale
 from peripherals.button import button
+from peripherals import simulation
+from peripherals.runtime import peripheral_runtime
+from peripherals import instrumentation
+from peripherals.calibration_table import calibration_table
 
 #Import file processors
 from patient_filewriter import patient_filewriter
+from patient_database import patient_database
 import csv_processor
+from app_config import app_config
+from trace_recorder import trace_recorder
+from tk_event_queue import tk_event_queue
+from frame_scheduler import frame_scheduler
 
 from patient import patient
 
@@ -29,6 +41,7 @@ Global patient information
 current_patient: patient = None
 main_patients_list = None
 patients_string_list = None
+patients_search_list = None     #all fields of each patient, searched by the patient searchbox
 
 
 """
@@ -36,8 +49,9 @@ Scanning globals
 """
 image_count = 0
 first_scan_start_pos = 0
-repeat_scan_expected = []
-timerID = None
+repeat_scan_positions = []     #target position of each image, columns of repeat_scan_view for binary scan data
+repeat_scan_forces = []        #target force of each image
+repeat_scan_view = None        #memory mapped scan data of the repeat scan, closed when the scan stops
 
 def testSelected():
     '''
@@ -60,7 +74,7 @@ def testSelected():
                     widget.delete(0,"end")
     #Repeat scan
     else:
-        patient_searchbox.set_values(patients_string_list) #update searchbox list
+        patient_searchbox.set_values(patients_string_list, patients_search_list) #update searchbox list
         
         #hide first scan and show repeat scan frames
         return_patient_frame.grid(column=0,row=1)
@@ -157,6 +171,10 @@ def start_new_scan():
     current_patient = patient_file_helper.add_patient(current_patient)
     patient_file_helper.create_patient_file(current_patient)
 
+    #record the full trajectory of the first scan when enabled in config.csv
+    if config.record_trace == 1:
+        scan_trace.start(patient_file_helper.get_trace_filename(current_patient))
+
     #disable patient data widgets
     patient_study_entry.config(state="disabled")
     patient_id_entry.config(state="disabled")
@@ -167,79 +185,128 @@ def start_new_scan():
             if(type(widget) == Entry):
                 widget.config(state="disabled")
 
-    first_scan_timer()
+    scan_frames.start(first_scan_timer)
 
-def first_scan_timer():
+def first_scan_timer() -> bool:
     """
-    Display the position error for the first scan
+    Display the position error for the first scan, called by scan_frames. Returns true when the display changed
     """
-    global timerID, image_count, first_scan_start_pos
+    global image_count, first_scan_start_pos
     #get data
+    position_sample = encoder.samples.latest()
     current_position = encoder.get_position()
     target_position = first_scan_start_pos - float(interval_entry.get()) * image_count
 
     #Update UI
-    position_indicator_bar.update(current_position, target_position)
+    changed = position_indicator_bar.update(current_position, target_position)
+    if changed:
+        record_display_latency("sensor_to_pixel.position", position_sample)
+    return changed
+
+def record_display_latency(stage, sample):
+    """
+    Record the age of the sensor sample shown by an indicator bar that just moved, sample is from sample_buffer.latest()
+    """
+    if sample != None:
+        instrumentation.record_age(stage, sample[0])
 
-    #loop timer
-    timerID = root.after(50, first_scan_timer)
+def get_aligned_sensor_data(timestamp) -> tuple[float, float, float]:
+    """
+    Interpolate position and force at a time.monotonic() timestamp from the recent sensor samples.
+    Returns (position, force, alignment error), the alignment error is the largest distance in seconds
+    from the timestamp to a sample used by either interpolation. Falls back to the newest values with an unknown (nan) error when there are no samples
+    """
+    position_result = encoder.get_position_at(timestamp) if timestamp != None else None
+    force_result = load_cell.get_force_at(timestamp) if timestamp != None else None
+
+    if position_result == None or force_result == None:
+        return encoder.get_position(), load_cell.get_force(), float("nan")
 
-def record_scan_data():
+    position, position_gap = position_result
+    force, force_gap = force_result
+    return position, force, max(position_gap, force_gap)
+
+def record_scan_data(edge_time):
     """
-    Save current sensor data to patient data file
+    Save sensor data at the instant the button was pressed to patient data file.
+    Row is position, force, alignment error in milliseconds
     """
     global current_patient
 
-    #Format data
-    str_speed = "{:.2f}".format(encoder.get_position())
-    str_force = "{:.2f}".format(load_cell.get_force())
+    position, force, alignment_error = get_aligned_sensor_data(edge_time)
 
-    #Save data
-    patient_file_helper.save_patient_scan_data(current_patient, [str_speed,str_force])
+    #Save data, csv files keep 2 decimals, binary files keep full precision
+    patient_file_helper.save_patient_scan_data(current_patient, [position, force, alignment_error * 1000])
 
 def start_repeat_scan():
     """
     Get the patient scan data and save to global, start reading data
     """
     #Get data from file
-    global current_patient, repeat_scan_expected, timerID
+    global current_patient, repeat_scan_positions, repeat_scan_forces, repeat_scan_view
 
-    repeat_scan_expected = patient_file_helper.get_patient_scan_data(current_patient)
+    #binary scan data is read through the memory map without parsing, csv values are converted to floats once
+    repeat_scan_view = patient_file_helper.get_patient_scan_view(current_patient)
+    if repeat_scan_view != None and repeat_scan_view.channel_count >= 2:
+        repeat_scan_positions = repeat_scan_view.column(0)
+        repeat_scan_forces = repeat_scan_view.column(1)
+    else:
+        rows = patient_file_helper.get_patient_scan_data(current_patient)
+        repeat_scan_positions = [float(line[0]) for line in rows]
+        repeat_scan_forces = [float(line[1]) for line in rows]
     
     patient_searchbox.disable()
-    image_counter_label.config(text="Image count: 0/%d" % len(repeat_scan_expected))
+    image_counter_label.config(text="Image count: 0/%d" % len(repeat_scan_forces))
 
     #update status indicator
     status_indicator.config(bg='orange')
     status_indicator.itemconfig(status_text, text="Repeat Scan in progress")
 
     #start displaying error and waiting for user to press button
-    timerID = root.after(1, repeat_scan_timer)
+    scan_frames.start(repeat_scan_timer)
         
 
-def repeat_scan_timer():
+def repeat_scan_timer() -> bool:
     """
-    Read the current target and display error for each sensor. image_count is incremented when GPIO button is pressed
+    Read the current target and display error for each sensor, called by scan_frames. Returns true when the display changed.
+    image_count is incremented when GPIO button is pressed
     """
-    global image_count, repeat_scan_expected, timerID
+    global image_count
 
     #end test once all scan data is complete
-    if (image_count+1 > len(repeat_scan_expected)):
+    if (image_count+1 > len(repeat_scan_forces)):
         stop_scan()
-        return
+        return False
 
     #get data
+    force_sample = load_cell.samples.latest()
+    position_sample = encoder.samples.latest()
     current_force = load_cell.get_force()
     current_speed = encoder.get_position()
-    target_force = float(repeat_scan_expected[image_count][1])
-    target_speed = float(repeat_scan_expected[image_count][0])
+    target_force = repeat_scan_forces[image_count]
+    target_speed = repeat_scan_positions[image_count]
 
     #Update UI
-    force_indicator_bar.update(current_force, target_force)
-    position_indicator_bar.update(current_speed, target_speed)
+    force_changed = force_indicator_bar.update(current_force, target_force)
+    position_changed = position_indicator_bar.update(current_speed, target_speed)
+    if force_changed:
+        record_display_latency("sensor_to_pixel.force", force_sample)
+    if position_changed:
+        record_display_latency("sensor_to_pixel.position", position_sample)
+    return force_changed or position_changed
+
+def release_repeat_targets():
+    """
+    Clear the repeat scan targets and close the memory map they were read from
+    """
+    global repeat_scan_positions, repeat_scan_forces, repeat_scan_view
 
-    #loop timer
-    timerID = root.after(50, repeat_scan_timer)
+    #columns are views of the map, released before it is closed
+    repeat_scan_positions = []
+    repeat_scan_forces = []
+    if repeat_scan_view != None:
+        repeat_scan_view.close()
+        repeat_scan_view = None
 
 def request_stop_scan():
     """
@@ -254,13 +321,16 @@ def stop_scan():
     """
     Stop the scan
     """
-    global timerID, image_count, current_patient, patients_string_list, main_patients_list
+    global image_count, current_patient, patients_string_list, main_patients_list, patients_search_list
 
-    if timerID is not None:
+    if scan_frames.is_running():
 
         #stop displaying sensor error
-        root.after_cancel(timerID)
-        timerID = None
+        scan_frames.stop()
+
+        #wait for queued and buffered scan data to be written, then close the patient file
+        close_scan_data()
+        scan_trace.stop()
 
         #Update scan control buttons
         start_btn.config(state='normal')
@@ -287,22 +357,23 @@ def stop_scan():
             #Get updated patient list
             main_patients_list = patient_file_helper.get_patients()
             patients_string_list = patient_file_helper.get_patients_ui()
+            patients_search_list = [a_patient.get_data() for a_patient in main_patients_list]
         
         #stop repeat scan
         else:
             #Enable patient selection
             patient_searchbox.enable()
-            patient_searchbox.set_values(patients_string_list) #update searchbox list
+            patient_searchbox.set_values(patients_string_list, patients_search_list) #update searchbox list
             
             #Display messagebox based on how scan was terminated
-            if (image_count+1 > len(repeat_scan_expected)):
+            if (image_count+1 > len(repeat_scan_forces)):
                 messagebox.showinfo("", "Scan Complete")
             else:
                 messagebox.showinfo("", "Scan Stopped")
 
         #Clear scan data
         image_count = 0
-        repeat_scan_expected.clear()
+        release_repeat_targets()
     
         #Enable scan select radio buttons
         first_scan_select.config(state="normal")
@@ -312,13 +383,21 @@ def stop_scan():
         status_indicator.config(bg='yellow')
         status_indicator.itemconfig(status_text, text="Idle")
 
-def save_image():
+def button_pressed():
     """
-    Save or increment data for scans. Called by GPIO button
+    Called by GPIO button on the peripheral thread, the press is handled by save_image on the tkinter main loop.
+    The edge time is read now, a later press would replace it before the event is handled
     """
-    global image_count, timerID
+    ui_events.post(save_image, save_button.get_edge_time())
+
+def save_image(edge_time=None):
+    """
+    Save or increment data for scans. Runs on the tkinter main loop, posted by button_pressed.
+    edge_time is the time.monotonic() time of the button press
+    """
+    global image_count
 
-    if (timerID == None):
+    if (scan_frames.is_running() == False):
         print("invalid press, returned")
         return
 
@@ -326,11 +405,11 @@ def save_image():
 
     #First scan
     if(selected_scan.get() == 0):
-        record_scan_data()
+        record_scan_data(edge_time)
         image_counter_label.config(text="Image count: %d" % (image_count))
     #Repeat scan
     else:
-        image_counter_label.config(text="Image count: %d/%d" % (image_count, len(repeat_scan_expected)))
+        image_counter_label.config(text="Image count: %d/%d" % (image_count, len(repeat_scan_forces)))
 
 def update_pos(event):
     """
@@ -382,46 +461,126 @@ def undo_image():
         image_counter_label.config(text="Image count: %d" % (image_count))
     #Repeat scan
     else:
-        image_counter_label.config(text="Image count: %d/%d" % (image_count, len(repeat_scan_expected)))
+        image_counter_label.config(text="Image count: %d/%d" % (image_count, len(repeat_scan_forces)))
 
 
+def config_timer():
+    """
+    Apply changes to config.csv while the application is running
+    """
+    if config.refresh():
+        apply_encoder_calibration()
+        scan_writer_pool.flush_every = config.scan_flush_every
+        force_indicator_bar.set_error_margin(config.force_error_margin)
+        force_indicator_bar.set_UI_sensitivity(config.force_display_sensitivity)
+        position_indicator_bar.set_error_margin(config.position_error_margin)
+        position_indicator_bar.set_UI_sensitivity(config.position_display_sensitivity)
+        if config.instrumentation == 1:
+            instrumentation.enable()
+        else:
+            instrumentation.disable()
+
+    root.after(1000, config_timer)
+
+def apply_encoder_calibration():
+    """
+    Use the multi-point calibration model from config when there is one, otherwise the linear calibration factor
+    """
+    encoder.linear_calibration_factor = config.encoder_calibration * -1
+    if config.encoder_model == "":
+        encoder.set_calibration(None)
+        return
+    try:
+        encoder.set_calibration(calibration_table(config.encoder_model, scale=-1))
+    except ValueError as error:
+        print(error)
+        print("using the linear encoder calibration")
+        encoder.set_calibration(None)
 
 def on_closing():
     """
     Close peripherals before destroying application 
     """
+    save_button.set_callbacks()
+    ui_events.stop()
+    scan_trace.stop()
+    sensor_runtime.stop()
     encoder.close()
     load_cell.close()
     save_button.close()
+    if simulated_hardware != None:
+        simulated_hardware.close()
+    close_scan_data()     #waits for queued writes
+    if instrumentation.enabled:
+        save_instrumentation()
     root.destroy()
 
+def close_scan_data():
+    """
+    Write all queued scan data and close the data files, tell the user when a write failed
+    """
+    try:
+        patient_file_helper.close()
+    except Exception as error:
+        print(error)
+        messagebox.showerror("Error", "Scan data could not be saved, check the storage device. Saved images may be missing:\n%s" % error)
+
+def save_instrumentation():
+    """
+    Save the stage timings of this session to the instrumentation directory as json and csv
+    """
+    csv_processor.create_directory_if_missing("./instrumentation/")
+    session = "./instrumentation/session_" + time.strftime("%Y%m%d_%H%M%S")
+    instrumentation.dump_json(session + ".json")
+    instrumentation.dump_csv(session + ".csv")
+
 if __name__ == "__main__":    
     messagebox.showinfo("Reset Position", "Please move scanner to the bottom of rail then press ok")
     
-    #Config file
-    new_config = csv_processor.create_csv_if_missing("./config.csv")
-    if(new_config):
-        default_config = [
-            ["position_error_margin", 0.3],
-            ["position_display_sensitivity", 50],
-            ["force_error_margin", 0.1],
-            ["force_display_sensitivity", 30]
-            ["encoder_calibration", -1.8122e-05]
-        ]
-        for config in default_config:
-            csv_processor.append_csv("./config.csv", config)
-
-    #Create sensors
-    encoder = as5600()
-    encoder.linear_calibration_factor = float(csv_processor.get_line(5, "./config.csv")[1]) * -1
-    load_cell = openscale()
-    save_button = button(pin=7)
-    save_button.set_callbacks(falling=save_image)
-
-    #Get patients list
-    patient_file_helper = patient_filewriter("./patients.csv", "./patient_scan_data/")
+    #Config file, parsed once and reloaded when modified
+    config = app_config("./config.csv")
+
+    #time each stage from sensor read to display, saved when the application closes
+    if config.instrumentation == 1:
+        instrumentation.enable()
+
+    #Create sensors, ULTRASOUND_SIMULATION replaces the hardware with simulated sensors
+    #sensors do not start their own threads, they are all read by the peripheral runtime
+    if simulation.enabled():
+        simulated_hardware = simulation.simulated_hardware()
+        load_cell = openscale(serial_port=simulated_hardware.serial_port, start=False)
+        encoder = as5600(bus=simulated_hardware.encoder_bus, start=False)
+        save_button = button(pin=7, edge_detect=True, gpio=simulated_hardware.gpio, start=False)
+        simulated_hardware.start_presses(7)
+    else:
+        simulated_hardware = None
+        load_cell = openscale(start=False)
+        encoder = as5600(start=False)
+        save_button = button(pin=7, edge_detect=True, start=False)
+    apply_encoder_calibration()
+    sensor_runtime = peripheral_runtime(encoder, load_cell, save_button).start()
+
+    #streams every sensor sample to a trace file during first scans, written on its own thread
+    scan_trace = trace_recorder(encoder, load_cell)
+
+    #scan data files stay open while scanning, rows are flushed to disk every scan_flush_every rows (0 flushes on scan stop)
+    scan_writer_pool = csv_processor.csv_writer_pool(flush_every=config.scan_flush_every)
+
+    #Get patients list, storage is "files" (csv or binary files) or "sqlite"
+    if config.storage == "sqlite":
+        #existing csv patients are migrated the first time the database is used
+        patient_file_helper = patient_database("./patients.db", "./patient_scan_data/", migrate_from="./patients.csv")
+    else:
+        #file writes run on a worker thread so a slow sd card does not freeze the ui
+        scan_format = config.scan_format
+        if scan_format not in patient_filewriter.SCAN_FORMATS:
+            messagebox.showerror("Error", "Invalid scan_format '%s' in config.csv, scan data is saved as csv" % scan_format)
+            scan_format = "csv"
+        patient_file_helper = patient_filewriter("./patients.csv", "./patient_scan_data/", journal_scan_data=True, writer_pool=scan_writer_pool,
+                                                 scan_format=scan_format, write_behind=True)
     main_patients_list = patient_file_helper.get_patients()
     patients_string_list = patient_file_helper.get_patients_ui()
+    patients_search_list = [a_patient.get_data() for a_patient in main_patients_list]
 
     #Initialize Tkinter
     root = Tk()
@@ -469,7 +628,9 @@ if __name__ == "__main__":
 
     #return_patient_frame
     select_patient_label = ttk.Label(return_patient_frame, text="Select Patient")
-    patient_searchbox = Searchbox(return_patient_frame, values=patients_string_list, width=20)
+    #searches every patient field with typo tolerance, best matches first
+    patient_searchbox = Searchbox(return_patient_frame, values=patients_string_list, virtual=True,
+                                  search=fuzzy_index(), search_values=patients_search_list, width=20)
     patient_searchbox.Listbox.config(font=("Arial", 10), height=4)
     patient_searchbox.bind("<<SearchboxSelect>>", update_pos)
     patient_listbox = Listbox(return_patient_frame)
@@ -494,14 +655,14 @@ if __name__ == "__main__":
         #force indicator, get parameters from config file
     force_indicator_bar = tk_indicator(indicator_frame,200,50,5)
     force_indicator_bar.config_labels("Too Soft", "Too Hard", 10)
-    force_indicator_bar.set_error_margin(float(csv_processor.get_line(3, "./config.csv")[1]))
-    force_indicator_bar.set_UI_sensitivity(float(csv_processor.get_line(4, "./config.csv")[1]))
+    force_indicator_bar.set_error_margin(config.force_error_margin)
+    force_indicator_bar.set_UI_sensitivity(config.force_display_sensitivity)
 
         #postion indicator, get parameters from config file
     position_indicator_bar = tk_indicator(indicator_frame,200,50,5)
     position_indicator_bar.config_labels("<-Head", "Foot->", 10)
-    position_indicator_bar.set_error_margin(float(csv_processor.get_line(1, "./config.csv")[1]))
-    position_indicator_bar.set_UI_sensitivity(float(csv_processor.get_line(2, "./config.csv")[1]))
+    position_indicator_bar.set_error_margin(config.position_error_margin)
+    position_indicator_bar.set_UI_sensitivity(config.position_display_sensitivity)
 
     #scan_control_frame
     start_btn = ttk.Button(scan_control_frame, text='Start scan', command=start_scan)
@@ -580,4 +741,14 @@ if __name__ == "__main__":
     status_indicator.grid()
 
     testSelected()
+    root.after(1000, config_timer)
+
+    #redraws the indicators while scanning, faster while the probe moves and slower while it is still
+    scan_frames = frame_scheduler(root)
+
+    #sensor threads never use tkinter directly, button presses are passed to the main loop
+    ui_events = tk_event_queue(root)
+    ui_events.start()
+    save_button.set_callbacks(falling=button_pressed)
+
     root.mainloop()
\ No newline at end of file
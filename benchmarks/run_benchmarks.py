@@ -0,0 +1,244 @@
+"""
+    Description: times the storage, search and rendering hot paths on synthetic data.
+                 Run "python -m benchmarks.run_benchmarks" from the repository root, results are saved in benchmarks/results
+                 and compared to the previous run
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import csv_processor
+from patient import patient
+from patient_filewriter import patient_filewriter
+from Custom_tk_widgets.Searchbox import substring_filter
+from benchmarks import synthetic_data
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+REGISTRY_SIZES = [1000, 10000, 100000]
+SCAN_SIZES = [10, 500, 5000]
+QUICK_REGISTRY_SIZES = [1000]
+QUICK_SCAN_SIZES = [10, 500]
+
+#typed one character at a time, every prefix is filtered like a keystroke
+SEARCH_QUERY = "msk,0001"
+
+
+def measure(function, setup=None, repeat=5, number=1) -> dict:
+    """
+    Time function. setup runs before each repeat and is not timed, function is called number times per repeat.
+    Returns the median and best time of one call in milliseconds
+    """
+    times = []
+    for i in range(repeat):
+        if setup != None:
+            setup()
+        start = time.perf_counter()
+        for j in range(number):
+            function()
+        times.append((time.perf_counter() - start) / number)
+
+    times.sort()
+    return {"median_ms": times[len(times) // 2] * 1000, "best_ms": times[0] * 1000, "calls": repeat * number}
+
+def get_tk_root():
+    """
+    Hidden tkinter root window, None when there is no display
+    """
+    try:
+        from tkinter import Tk, TclError
+    except ImportError:
+        return None
+    try:
+        root = Tk()
+    except TclError:
+        return None
+    root.withdraw()
+    return root
+
+
+def benchmark_csv_processor(work_dir, scan_sizes) -> dict:
+    results = {}
+    for rows in scan_sizes:
+        filename = os.path.join(work_dir, "scan_%d.csv" % rows)
+        synthetic_data.write_scan_file(filename, rows)
+        new_row = synthetic_data.scan_rows(1, seed=1)[0]
+        restore = lambda: synthetic_data.write_scan_file(filename, rows)
+
+        results["csv_processor.get_lines[%d rows]" % rows] = measure(lambda: csv_processor.get_lines(filename), repeat=7)
+        results["csv_processor.append_csv[%d rows]" % rows] = measure(lambda: csv_processor.append_csv(filename, new_row), restore, number=50)
+        results["csv_processor.remove_line[%d rows]" % rows] = measure(lambda: csv_processor.remove_line(filename, rows // 2 + 1), restore)
+    return results
+
+def benchmark_patient_filewriter(work_dir, registry_sizes) -> dict:
+    results = {}
+    for count in registry_sizes:
+        patients_filename = os.path.join(work_dir, "patients_%d.csv" % count)
+        data_dir = os.path.join(work_dir, "patient_scan_data_%d/" % count)
+        synthetic_data.write_registry(patients_filename, count)
+
+        results["patient_filewriter.load[%d patients]" % count] = measure(lambda: patient_filewriter(patients_filename, data_dir), repeat=3)
+
+        writer = patient_filewriter(patients_filename, data_dir)
+        results["patient_filewriter.get_patients[%d patients]" % count] = measure(writer.get_patients, number=10)
+
+        added = [0]
+        def add_patient():
+            added[0] += 1
+            writer.add_patient(patient("BENCH", "%05d" % (added[0] % 50), "1", "2", "3", "4"))
+        results["patient_filewriter.add_patient[%d patients]" % count] = measure(add_patient, number=50)
+    return results
+
+def benchmark_search(root, registry_sizes) -> dict:
+    """
+    Time typing SEARCH_QUERY into the filter, and into a Searchbox when a display is available
+    """
+    results = {}
+    prefixes = [SEARCH_QUERY[:i] for i in range(1, len(SEARCH_QUERY) + 1)]
+
+    for count in registry_sizes:
+        values = synthetic_data.patient_strings(count)
+        search = substring_filter(values)
+
+        def type_query():
+            for prefix in prefixes:
+                search.filter(prefix)
+        results["substring_filter.filter[%d patients]" % count] = measure(type_query, lambda: search.filter(''))
+
+        if root == None:
+            continue
+
+        from Custom_tk_widgets.Searchbox import Searchbox
+        searchbox = Searchbox(root, values)
+
+        def type_into_searchbox():
+            for prefix in prefixes:
+                searchbox.Entry.delete(0, 'end')
+                searchbox.Entry.insert(0, prefix)
+                searchbox.filter_list()
+                #run the debounced filter now instead of waiting for the main loop
+                searchbox.apply_filter()
+        def clear_searchbox():
+            searchbox.Entry.delete(0, 'end')
+            searchbox.apply_filter()
+        results["Searchbox.filter_list[%d patients]" % count] = measure(type_into_searchbox, clear_searchbox, repeat=3)
+        searchbox.destroy()
+    return results
+
+def benchmark_indicator(root) -> dict:
+    """
+    Time tk_indicator.update fed by a simulated encoder, one update per encoder read
+    """
+    from peripherals import simulation
+    from peripherals.as5600 import as5600
+    from Custom_tk_widgets.canvas_indicator import tk_indicator
+
+    results = {}
+    profiles = {
+        "static": simulation.static_profile(0),
+        "sweep": simulation.sweep_profile(20000, 2),
+    }
+    for name, profile in profiles.items():
+        encoder = as5600(linear_calibration=-1.8122e-05, bus=simulation.fake_as5600_bus(profile, noise=2), start=False)
+        indicator = tk_indicator(root, 300, 100, 10)
+        indicator.set_error_margin(0.3)
+        indicator.set_UI_sensitivity(50)
+
+        results["tk_indicator.update[%s]" % name] = measure(lambda: indicator.update(encoder.get_position(), 0),
+                                                             encoder.poll, repeat=500)
+        stats = indicator.get_render_stats()
+        results["tk_indicator.update[%s]" % name]["skipped_fraction"] = stats["updates_skipped"] / max(stats["updates_issued"] + stats["updates_skipped"], 1)
+
+        indicator.destroy()
+        encoder.close()
+    return results
+
+
+def save_results(results, filename=None) -> str:
+    """
+    Save results as json in RESULTS_DIR, named by the time of the run
+    """
+    if filename == None:
+        csv_processor.create_directory_if_missing(RESULTS_DIR)
+        filename = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d_%H%M%S") + ".json")
+
+    with open(filename, 'w') as file:
+        json.dump(results, file, indent=1)
+    return filename
+
+def latest_results(exclude=None) -> str:
+    """
+    Get the newest results file in RESULTS_DIR, None when there is none
+    """
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    filenames = sorted(name for name in os.listdir(RESULTS_DIR) if name.endswith(".json"))
+    filenames = [os.path.join(RESULTS_DIR, name) for name in filenames]
+    filenames = [name for name in filenames if name != exclude]
+    return filenames[-1] if len(filenames) > 0 else None
+
+def print_comparison(results, previous, threshold):
+    """
+    Print every benchmark with the change from a previous run, changes slower than threshold are flagged
+    """
+    previous_benchmarks = previous["benchmarks"] if previous != None else {}
+    width = max(len(name) for name in results["benchmarks"])
+
+    regressions = 0
+    for name, result in results["benchmarks"].items():
+        line = "%-*s %10.4f ms" % (width, name, result["median_ms"])
+        if name in previous_benchmarks:
+            change = result["median_ms"] / previous_benchmarks[name]["median_ms"] - 1
+            line += "  %+7.1f%%" % (change * 100)
+            if change > threshold:
+                line += "  SLOWER"
+                regressions += 1
+        print(line)
+
+    if previous != None:
+        print("%d benchmarks slower than %d%% compared to %s" % (regressions, threshold * 100, previous["time"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark storage, search and rendering")
+    parser.add_argument("--quick", action="store_true", help="small registries and scan files only")
+    parser.add_argument("--compare", help="results file to compare to, defaults to the previous run")
+    parser.add_argument("--output", help="results file to write, defaults to benchmarks/results/<time>.json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown flagged as a regression, 0.2 is 20%%")
+    args = parser.parse_args()
+
+    registry_sizes = QUICK_REGISTRY_SIZES if args.quick else REGISTRY_SIZES
+    scan_sizes = QUICK_SCAN_SIZES if args.quick else SCAN_SIZES
+
+    benchmarks = {}
+    root = get_tk_root()
+    with tempfile.TemporaryDirectory() as work_dir:
+        benchmarks.update(benchmark_csv_processor(work_dir, scan_sizes))
+        benchmarks.update(benchmark_patient_filewriter(work_dir, registry_sizes))
+    benchmarks.update(benchmark_search(root, registry_sizes))
+    if root != None:
+        benchmarks.update(benchmark_indicator(root))
+        root.destroy()
+    else:
+        print("no display, Searchbox and tk_indicator benchmarks skipped")
+
+    results = {
+        "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "benchmarks": benchmarks,
+    }
+
+    compare_filename = args.compare if args.compare != None else latest_results()
+    previous = None
+    if compare_filename != None:
+        with open(compare_filename) as file:
+            previous = json.load(file)
+
+    print_comparison(results, previous, args.threshold)
+    print("results saved to " + save_results(results, args.output))
@@ -0,0 +1,55 @@
+"""
+    Description: generates patient registries and scan data files of any size for the benchmarks
+"""
+import random
+
+import csv_processor
+
+STUDIES = ["MSK", "KNEE", "ACL", "SHLD", "HIP", "ANKL", "ELBW", "WRST"]
+POSITIONS = ["1", "2", "3", "4", "5", "6"]
+HEADER = ["Study","ID","Leg_Pos","Scanner_Pos","Foot_Pos", "Angle_Pos", "Iteration"]
+
+def patient_rows(count, seed=0) -> list[list[str]]:
+    """
+    Rows of a patients file in the order they would be scanned. About a third of the patients are scanned more than once
+    """
+    generator = random.Random(seed)
+    rows = []
+    scans = {}
+    while len(rows) < count:
+        study = generator.choice(STUDIES)
+        id = "%05d" % generator.randrange(max(count // 2, 1))
+        iteration = scans.get((study, id), 0) + 1
+        scans[(study, id)] = iteration
+        rows.append([study, id] + [generator.choice(POSITIONS) for i in range(4)] + ["%03d" % iteration])
+    return rows
+
+def write_registry(filename, count, seed=0):
+    """
+    Write a patients file with count patients
+    """
+    csv_processor.write_lines(filename, [HEADER] + patient_rows(count, seed))
+
+def scan_rows(count, seed=0) -> list[list[str]]:
+    """
+    Rows of a scan data file: position, force, alignment error. Positions step down the rail like a real scan
+    """
+    generator = random.Random(seed)
+    rows = []
+    for i in range(count):
+        position = -0.5 * i + generator.gauss(0, 0.05)
+        force = 2.5 + generator.gauss(0, 0.2)
+        rows.append(["{:.2f}".format(position), "{:.2f}".format(force), "{:.2f}".format(generator.uniform(0, 10))])
+    return rows
+
+def write_scan_file(filename, count, seed=0):
+    """
+    Write a csv scan data file with count rows
+    """
+    csv_processor.write_lines(filename, scan_rows(count, seed))
+
+def patient_strings(count, seed=0) -> list[str]:
+    """
+    Searchbox values for a registry of count patients, same format as patient_registry.get_patients_ui
+    """
+    return [row[0] + "," + row[1] + "," + row[6] for row in sorted(patient_rows(count, seed), key=lambda row: row[0].lower() + row[1].lower())]
@@ -1,10 +1,23 @@
 """
     Author: Tevin Poudrier
     Date: Thu Jul 25 11:42:37 PM MDT 2024
-    Description: Get calibration factor for as5600 for any linear rail
+    Description: Get calibration factor for as5600 for any linear rail.
+                 Records any number of reference positions and fits a multi-point calibration model for config.csv
 """
+import time
 
 from peripherals.as5600 import as5600
+from peripherals import calibration_table
+
+def read_raw_position(reads = 20) -> float:
+    """
+    Average raw position over reads samples, reduces encoder noise at a reference point
+    """
+    total = 0
+    for i in range(reads):
+        total += encoder.get_raw_position()
+        time.sleep(encoder.max_poll_interval)
+    return total / reads
 
 encoder = as5600()
 
@@ -15,13 +28,51 @@ input("")
 print("Home set at encoder raw position: " + str(encoder.get_raw_position()))
 encoder.set_home()
 
-print("Move platform to top of linear rail and press enter")
-input("")
+#reference points, distance from home measured by the user at each raw position
+raw_positions = [0.0]
+distances = [0.0]
+
+print("Move platform to reference points up the rail, enter the distance from the bottom at each point.")
+print("Use the same unit for every point, the top of the rail should be the last point. Enter nothing when done")
+while True:
+    entry = input("Distance at point %d (enter to finish):   " % (len(distances) + 1))
+    if entry == "":
+        if len(distances) < 2:
+            print("At least one point is needed")
+            continue
+        break
+    try:
+        distance = float(entry)
+    except ValueError:
+        print("Invalid distance")
+        continue
 
-raw_end_position = encoder.get_raw_position()
-print("End set at encoder raw position: " + str(raw_end_position))
+    raw_positions.append(read_raw_position())
+    distances.append(distance)
+    print("Point %d at encoder raw position: %.1f" % (len(distances), raw_positions[-1]))
 
-distance = float( input("Enter distance from start to end of linear rail:   "))
+raw_end_position = raw_positions[-1]
+distance = distances[-1]
 
 print("Your calibration factor is: " + str(distance/raw_end_position))
-print("\t can be represented by %f/%f" % (distance,raw_end_position))
\ No newline at end of file
+print("\t can be represented by %f/%f" % (distance,raw_end_position))
+
+if len(distances) < 3:
+    print("Record 3 or more points for a multi-point calibration")
+else:
+    #compare the linear factor to least squares fits, the fit with the smallest error should be used
+    models = {
+        "linear": "piecewise 0:0 %r:%r" % (raw_end_position, distance),
+        "polynomial": calibration_table.fit_polynomial(raw_positions, distances, degree=min(3, len(distances) - 2)),
+        "piecewise": calibration_table.fit_piecewise(raw_positions, distances, segments=len(distances) // 2),
+    }
+    print("\nMaximum error at the reference points:")
+    for name, model in models.items():
+        residuals = calibration_table.get_residuals(model, raw_positions, distances)
+        print("\t%-10s %f" % (name, max(abs(residual) for residual in residuals)))
+
+    print("\nTo use a fit, add one of these lines to config.csv:")
+    for name in ("polynomial", "piecewise"):
+        print("encoder_model," + models[name])
+
+encoder.close()
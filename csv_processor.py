@@ -4,6 +4,7 @@
     Description: static methods to help with reading and writing data to csv files
 """
 import csv
+import io
 import os
 
 def create_csv_if_missing(file_path) -> bool:
@@ -27,13 +28,15 @@ def create_directory_if_missing(dir_path) -> bool:
     else:
         return False
 
-def append_csv(filename, data:list):
+def append_csv(filename, data:list) -> int:
     '''
-    Append data to file as a new line
+    Append data to file as a new line. Returns the byte offset the new line starts at
     '''
     with open(filename, 'a', newline='') as file:
+        offset = file.tell()
         writer = csv.writer(file, delimiter=',', quoting=csv.QUOTE_NONE)
         writer.writerow(data)
+        return offset
 
 def get_lines(filename) -> list[list[str]]:
     """
@@ -69,10 +72,35 @@ def remove_line(filename, index):
         print(error)
         return
     
-    #Clear file and add lines back in without the removed line
-    clear(filename)
-    for line in prev_list:
-        append_csv(filename, line)
+    #Rewrite file without the removed line
+    write_lines(filename, prev_list)
+
+def write_lines(filename, lines: list[list]):
+    """
+    Replace all data in the file with lines, file is opened once
+    """
+    with open(filename, 'w', newline='') as file:
+        writer = csv.writer(file, delimiter=',', quoting=csv.QUOTE_NONE)
+        writer.writerows(lines)
+
+def get_line_offsets(filename) -> list[int]:
+    """
+    Get the byte offset that each line in the file starts at
+    """
+    offsets = []
+    offset = 0
+    with open(filename, 'rb') as file:
+        for line in file:
+            offsets.append(offset)
+            offset += len(line)
+    return offsets
+
+def truncate(filename, offset):
+    """
+    Remove all data in the file after the byte offset
+    """
+    with open(filename, 'r+b') as file:
+        file.truncate(offset)
 
 def clear(filename):
     """
@@ -81,5 +109,131 @@ def clear(filename):
     open(filename, 'w').close()
 
 
+class pooled_file():
+    """
+    Open handle of a file in a csv_writer_pool
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'ab')
+        self.offset = self.file.tell()  #end of file, includes buffered bytes
+        self.unflushed_rows = 0
+
+class csv_writer_pool():
+    """
+    Keeps one open, buffered handle per file so appending a row does not open and close the file.
+    flush_every sets how often rows are written to disk: 1 flushes every row, N flushes every N rows,
+    0 only flushes when flush() or close() is called. fsync also forces flushed data onto the storage device
+    """
+
+    def __init__(self, flush_every=1, fsync=False):
+        """
+        Create an empty pool, files are opened the first time they are appended to
+        """
+        self.flush_every = flush_every
+        self.fsync = fsync
+
+        self.__files__ = {}     #filename -> pooled_file
+
+        #rows are formatted once in memory then written as bytes
+        self.__row_buffer__ = io.StringIO()
+        self.__writer__ = csv.writer(self.__row_buffer__, delimiter=',', quoting=csv.QUOTE_NONE)
+
+    def append(self, filename, data: list) -> int:
+        """
+        Append data to file as a new line. Returns the byte offset the new line starts at
+        """
+        #format row
+        self.__row_buffer__.seek(0)
+        self.__row_buffer__.truncate()
+        self.__writer__.writerow(data)
+        row = self.__row_buffer__.getvalue().encode()
+
+        return self.append_bytes(filename, row)
+
+    def append_bytes(self, filename, row: bytes) -> int:
+        """
+        Append an already formatted row to file. Returns the byte offset the row starts at
+        """
+        pooled = self.__files__.get(filename)
+        if (pooled == None):
+            pooled = pooled_file(filename)
+            self.__files__[filename] = pooled
+
+        offset = pooled.offset
+        pooled.file.write(row)
+        pooled.offset += len(row)
+        pooled.unflushed_rows += 1
+
+        if (self.flush_every > 0 and pooled.unflushed_rows >= self.flush_every):
+            self.__flush_file__(pooled)
+
+        return offset
+
+    def truncate(self, filename, offset):
+        """
+        Remove all data in the file after the byte offset
+        """
+        pooled = self.__files__.get(filename)
+        if (pooled == None):
+            truncate(filename, offset)
+            return
+
+        pooled.file.flush()
+        pooled.file.truncate(offset)
+        pooled.offset = offset
+        pooled.unflushed_rows = 0
+        if (self.fsync == True):
+            os.fsync(pooled.file.fileno())
+
+    def flush(self, filename=None):
+        """
+        Write buffered rows of filename to disk, flushes every open file when filename is None
+        """
+        for pooled in self.__select__(filename):
+            self.__flush_file__(pooled)
+
+    def close(self, filename=None):
+        """
+        Flush and close filename, closes every open file when filename is None
+        """
+        for pooled in self.__select__(filename):
+            self.__flush_file__(pooled)
+            pooled.file.close()
+
+        if (filename == None):
+            self.__files__.clear()
+        else:
+            self.__files__.pop(filename, None)
+
+    def is_open(self, filename) -> bool:
+        """
+        Check if the pool has an open handle for filename
+        """
+        return filename in self.__files__
+
+    def __select__(self, filename) -> list[pooled_file]:
+        """
+        Get the pooled files matching filename, all pooled files when filename is None
+        """
+        if (filename == None):
+            return list(self.__files__.values())
+        elif (filename in self.__files__):
+            return [self.__files__[filename]]
+        else:
+            return []
+
+    def __flush_file__(self, pooled: pooled_file):
+        """
+        Write buffered rows to disk
+        """
+        if (pooled.unflushed_rows == 0):
+            return
+        pooled.file.flush()
+        if (self.fsync == True):
+            os.fsync(pooled.file.fileno())
+        pooled.unflushed_rows = 0
+
+
 if __name__ == "__main__":
     remove_line("./MSK_99_001.csv", 1)
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+    Description: runs display updates on the tkinter main loop at a rate that follows how much the display is changing
+"""
+import time
+
+class frame_scheduler():
+    """
+    Calls a tick function on the tkinter main loop. The tick returns true when it changed the display
+    (for example tk_indicator.update moved the box by a pixel). Changing frames run at the fastest interval,
+    after idle_frames unchanged frames the interval doubles up to max_interval.
+    Time spent in the tick is taken from the wait so frames stay evenly spaced
+    """
+
+    def __init__(self, root, min_interval=20, max_interval=200, idle_frames=5):
+        """
+        Intervals are in milliseconds
+        """
+        self.root = root
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_frames = idle_frames
+
+        self.interval = min_interval
+        self.__tick__ = None
+        self.__after_id__ = None
+        self.__next_frame__ = 0
+        self.__unchanged__ = 0
+
+        self.reset_stats()
+
+    def start(self, tick, delay=1):
+        """
+        Start calling tick, replaces the tick of a running scheduler. delay is milliseconds before the first frame
+        """
+        self.stop()
+        self.__tick__ = tick
+        self.interval = self.min_interval
+        self.__unchanged__ = 0
+        self.__next_frame__ = time.monotonic() + delay / 1000
+        self.__after_id__ = self.root.after(delay, self.__run__)
+
+    def stop(self):
+        """
+        Stop calling tick, safe to call from inside the tick
+        """
+        if self.__after_id__ != None:
+            self.root.after_cancel(self.__after_id__)
+            self.__after_id__ = None
+        self.__tick__ = None
+
+    def is_running(self) -> bool:
+        return self.__tick__ != None
+
+    def get_stats(self) -> dict:
+        """
+        Get the number of frames, frames that changed the display, tick times in seconds and the current interval in milliseconds
+        """
+        mean_tick_time = self.__total_tick_time__ / self.frames if self.frames > 0 else 0.0
+        return {
+            "frames": self.frames,
+            "changed_frames": self.changed_frames,
+            "mean_tick_time": mean_tick_time,
+            "max_tick_time": self.max_tick_time,
+            "interval": self.interval,
+        }
+
+    def reset_stats(self):
+        self.frames = 0
+        self.changed_frames = 0
+        self.max_tick_time = 0.0
+        self.__total_tick_time__ = 0.0
+
+    def __run__(self):
+        """
+        Run one frame and schedule the next, runs on the main loop
+        """
+        self.__after_id__ = None
+        tick = self.__tick__
+        if tick == None:
+            return
+
+        started = time.monotonic()
+        changed = tick()
+        now = time.monotonic()
+
+        self.frames += 1
+        self.__total_tick_time__ += now - started
+        self.max_tick_time = max(self.max_tick_time, now - started)
+
+        #tick stopped or replaced the scheduler
+        if self.__tick__ != tick or self.__after_id__ != None:
+            return
+
+        #speed up while the display changes, back off while it is idle
+        if changed:
+            self.changed_frames += 1
+            self.__unchanged__ = 0
+            self.interval = self.min_interval
+        else:
+            self.__unchanged__ += 1
+            if self.__unchanged__ >= self.idle_frames:
+                self.interval = min(self.interval * 2, self.max_interval)
+
+        #next frame is one interval after this frame was due, a late frame does not cause a burst to catch up
+        self.__next_frame__ = max(self.__next_frame__ + self.interval / 1000, now)
+        delay = max(round((self.__next_frame__ - now) * 1000), 1)
+        self.__after_id__ = self.root.after(delay, self.__run__)
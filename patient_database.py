@@ -0,0 +1,273 @@
+"""
+    Description: sqlite storage for patients and scan data, same methods as patient_filewriter.
+                 Run "python patient_database.py [patients file] [data directory] [database file]" to migrate csv files to a database
+"""
+import math
+import os
+import sqlite3
+import sys
+
+import csv_processor
+import scan_binary
+from patient import patient
+from patient_registry import patient_registry
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_key INTEGER PRIMARY KEY,
+    study TEXT NOT NULL,
+    id TEXT NOT NULL,
+    leg_pos TEXT,
+    scanner_pos TEXT,
+    foot_pos TEXT,
+    angle_pos TEXT,
+    iteration INTEGER NOT NULL,
+    sort_key TEXT NOT NULL,
+    UNIQUE (study, id, iteration)
+);
+CREATE INDEX IF NOT EXISTS patients_sorted ON patients (sort_key, patient_key);
+
+CREATE TABLE IF NOT EXISTS scan_rows (
+    patient_key INTEGER NOT NULL REFERENCES patients (patient_key),
+    image INTEGER NOT NULL,
+    position REAL,
+    force REAL,
+    alignment_ms REAL,
+    PRIMARY KEY (patient_key, image)
+) WITHOUT ROWID;
+"""
+
+class patient_database():
+    """
+    Stores patients and scan data in one sqlite database instead of csv files.
+    Can be used in place of patient_filewriter. Scan rows are numbered per patient starting at 1,
+    saving and removing a row are transactions so an interrupted write never leaves a partial row
+    """
+
+    def __init__(self, database_file, data_dir, migrate_from=None):
+        """
+        Open or create the database. data_dir is still used for trajectory traces.
+        migrate_from is a patients file, it is migrated with its scan data when the database has no patients
+        """
+        self.database_filename = database_file
+        self.dir_data = data_dir
+        csv_processor.create_directory_if_missing(self.dir_data)
+
+        self.connection = sqlite3.connect(self.database_filename)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")    #wal is synced at checkpoints, a power loss can not corrupt the database
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+
+        self.__keys__ = {}      #(study, id, iteration) -> patient_key
+
+        if migrate_from != None and os.path.isfile(migrate_from) and self.get_patient_count() == 0:
+            self.migrate_csv(migrate_from, self.dir_data)
+
+    def add_patient(self, new_patient: patient):
+        '''
+        add patient to the database, the iteration is one more than the number of saved scans of the same study and id,
+        the same rule as patient_filewriter
+        '''
+        with self.connection:
+            count = self.connection.execute("SELECT COUNT(*) FROM patients WHERE study = ? AND id = ?",
+                                            (new_patient.study, new_patient.id)).fetchone()[0]
+            new_patient.set_iteration(count + 1) #start from 1 not 0
+            if self.__insert_patient__(new_patient, ignore=True) == None:
+                #a migrated patients file can skip iterations, the counted iteration is then already used
+                maximum = self.connection.execute("SELECT MAX(iteration) FROM patients WHERE study = ? AND id = ?",
+                                                  (new_patient.study, new_patient.id)).fetchone()[0]
+                new_patient.set_iteration(maximum + 1)
+                self.__insert_patient__(new_patient)
+
+        new_patient.generate_filename(self.dir_data)
+        return new_patient
+
+    def create_patient_file(self, patient: patient):
+        """
+        Scan data is stored in the database, only sets the patient filename used for traces
+        """
+        patient.filename = self.dir_data + patient.to_string() + ".csv"
+
+    def get_trace_filename(self, patient: patient) -> str:
+        """
+        Get the trajectory trace file name of the patient, traces are kept in a traces directory inside the data directory
+        """
+        trace_dir = self.dir_data + "traces/"
+        csv_processor.create_directory_if_missing(trace_dir)
+        return trace_dir + patient.to_string() + "_trace" + scan_binary.EXTENSION
+
+    def get_patients(self) -> list[patient]:
+        '''
+        Get list of patients that have been scanned, sorted by study and id
+        '''
+        patients = []
+        for row in self.connection.execute("SELECT study, id, leg_pos, scanner_pos, foot_pos, angle_pos, iteration "
+                                           "FROM patients ORDER BY sort_key, patient_key"):
+            a_patient = patient(*row[:6])
+            a_patient.set_iteration(row[6])
+            a_patient.generate_filename(self.dir_data)
+            patients.append(a_patient)
+        return patients
+
+    def get_patients_ui(self) -> list[str]:
+        """
+        Gets a list of all patients represented as strings, intended for ui displays
+        """
+        return [study + "," + id + "," + "%03d" % iteration for study, id, iteration in
+                self.connection.execute("SELECT study, id, iteration FROM patients ORDER BY sort_key, patient_key")]
+
+    def get_patient_count(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM patients").fetchone()[0]
+
+    def sort(self, list):
+        """
+        Sort based on study and id
+        """
+        return patient_registry.sort_key(list)
+
+    def save_patient_scan_data(self, patient:patient, data):
+        """
+        Save a row of scan data (position, force, alignment error) as the patient's next image
+        """
+        values = (list(data[:3]) + [None] * 3)[:3]
+        with self.connection:
+            self.connection.execute("INSERT INTO scan_rows (patient_key, image, position, force, alignment_ms) "
+                                    "SELECT ?, COALESCE(MAX(image), 0) + 1, ?, ?, ? FROM scan_rows WHERE patient_key = ?",
+                                    (self.__get_key__(patient), *values, self.__get_key__(patient)))
+
+    def remove_patient_scan_data(self, patient:patient, line_index):
+        """
+        Remove the image at line_index from the patient's scan data. Index starts at 1, following images move down by one
+        """
+        key = self.__get_key__(patient)
+        with self.connection:
+            removed = self.connection.execute("DELETE FROM scan_rows WHERE patient_key = ? AND image = ?", (key, line_index)).rowcount
+            if removed == 0:
+                print("unable to remove line " + str(line_index))
+                return
+            #rows are updated in primary key order, each image moves into the number freed by the one before it
+            self.connection.execute("UPDATE scan_rows SET image = image - 1 WHERE patient_key = ? AND image > ?", (key, line_index))
+
+    def get_patient_scan_data(self, patient:patient) -> list[list]:
+        """
+        Get all rows of scan data of the patient as floats, missing values are nan
+        """
+        rows = self.connection.execute("SELECT position, force, alignment_ms FROM scan_rows WHERE patient_key = ? ORDER BY image",
+                                       (self.__get_key__(patient),))
+        return [[math.nan if value == None else value for value in row] for row in rows]
+
+    def get_patient_scan_view(self, patient:patient):
+        """
+        Scan data is not memory mapped from a database, always None
+        """
+        return None
+
+    def close_patient_file(self, patient:patient):
+        """
+        Every row is committed when it is saved, nothing to close
+        """
+        pass
+
+    def flush(self):
+        """
+        Every row is committed when it is saved, nothing to write
+        """
+        pass
+
+    def close(self):
+        """
+        Move the write ahead log into the database file. The database stays open for the next scan
+        """
+        self.connection.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def migrate_csv(self, patients_filename, data_dir) -> tuple[int, int, int]:
+        """
+        Copy every patient of a patients file and their csv or binary scan data into the database in one transaction.
+        A patient with the same study, id and iteration as an earlier line is skipped and reported.
+        Returns (patients migrated, scan rows migrated, duplicate patients skipped)
+        """
+        lines = csv_processor.get_lines(patients_filename)[1:]     #ignore header
+        scan_rows = 0
+        duplicates = 0
+
+        with self.connection:
+            for line in lines:
+                a_patient = patient(line[0], line[1], line[2], line[3], line[4], line[5])
+                a_patient.set_iteration(int(line[6]))
+                key = self.__insert_patient__(a_patient, ignore=True)
+                if key == None:
+                    print("duplicate patient " + a_patient.to_string() + " not migrated")
+                    duplicates += 1
+                    continue
+
+                filename = os.path.join(data_dir, a_patient.to_string() + ".csv")
+                binary_filename = scan_binary.scan_filename(filename)
+                if os.path.isfile(binary_filename):
+                    rows = scan_binary.get_rows(binary_filename)
+                elif os.path.isfile(filename):
+                    rows = csv_processor.get_lines(filename)
+                else:
+                    continue
+
+                values = []
+                for image, row in enumerate(rows, 1):
+                    values.append((key, image, *[self.__to_float__(value) for value in (list(row[:3]) + [None] * 3)[:3]]))
+                self.connection.executemany("INSERT INTO scan_rows (patient_key, image, position, force, alignment_ms) VALUES (?, ?, ?, ?, ?)", values)
+                scan_rows += len(values)
+
+        return len(lines) - duplicates, scan_rows, duplicates
+
+    def __insert_patient__(self, a_patient: patient, ignore=False) -> int:
+        """
+        Insert a patient row, must be called inside a transaction. Returns the patient key.
+        ignore returns None instead of raising when the study, id and iteration are already saved
+        """
+        data = a_patient.get_data()
+        cursor = self.connection.execute("INSERT " + ("OR IGNORE " if ignore else "") +
+                                         "INTO patients (study, id, leg_pos, scanner_pos, foot_pos, angle_pos, iteration, sort_key) "
+                                         "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                         (*data[:6], int(data[6]), patient_registry.sort_key(data)))
+        if cursor.rowcount == 0:
+            return None
+        self.__keys__[(a_patient.study, a_patient.id, int(a_patient.iteration))] = cursor.lastrowid
+        return cursor.lastrowid
+
+    def __get_key__(self, a_patient: patient) -> int:
+        """
+        Get the patient key of a patient, uses the unique (study, id, iteration) index
+        """
+        compare_key = (a_patient.study, a_patient.id, int(a_patient.iteration))
+        key = self.__keys__.get(compare_key)
+        if key == None:
+            row = self.connection.execute("SELECT patient_key FROM patients WHERE study = ? AND id = ? AND iteration = ?", compare_key).fetchone()
+            if row == None:
+                raise KeyError("patient " + a_patient.to_string() + " is not in the database")
+            key = row[0]
+            self.__keys__[compare_key] = key
+        return key
+
+    def __to_float__(self, value):
+        """
+        Convert a csv value to a float, None when it is empty or invalid
+        """
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return None
+        return None if math.isnan(value) else value
+
+
+if __name__ == "__main__":
+    patients_filename = sys.argv[1] if len(sys.argv) > 1 else "./patients.csv"
+    data_dir = sys.argv[2] if len(sys.argv) > 2 else "./patient_scan_data/"
+    database_filename = sys.argv[3] if len(sys.argv) > 3 else "./patients.db"
+
+    database = patient_database(database_filename, data_dir)
+    if database.get_patient_count() > 0:
+        print(database_filename + " already has patients, not migrated")
+        sys.exit(1)
+
+    patient_count, row_count, duplicate_count = database.migrate_csv(patients_filename, data_dir)
+    database.close()
+    print("migrated %d patients and %d scan rows to %s, %d duplicate patients skipped" % (patient_count, row_count, database_filename, duplicate_count))
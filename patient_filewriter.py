@@ -3,15 +3,35 @@
     Date: Wed Jul 17 12:40:48 AM MDT 2024
     Description: file writing for the patient object
 """
+import os
+import queue
+import struct
+import threading
+
 import csv_processor
+import scan_binary
 from patient import patient
+from patient_registry import patient_registry
+from peripherals import instrumentation
+from scan_journal import scan_journal
 
 class patient_filewriter():
 
-    def __init__(self, patient_file, data_dir):
+    SCAN_FORMATS = ("csv", "binary")
+
+    def __init__(self, patient_file, data_dir, journal_scan_data=False, writer_pool: csv_processor.csv_writer_pool = None, scan_format="csv", write_behind=False):
         """
-        Create patient file and storage directory if needed
+        Create patient file and storage directory if needed.
+        journal_scan_data tracks line offsets of scan data files so undo truncates instead of rewriting the file.
+        writer_pool keeps scan data files open between saves, close() must be called when done.
+        scan_format is "csv" or "binary", binary saves new scan data in .scan files (see scan_binary). Other formats raise ValueError.
+        Scan data is read from the .scan file whenever one exists, so converted csv files are read without parsing.
+        write_behind runs all file writes in order on a worker thread, methods return before the disk is written.
+        Scan data saved since the patient file was created is read from memory, flush() waits for all writes.
+        The first write that failed on the worker is raised by the next flush() or close()
         """
+        if scan_format not in self.SCAN_FORMATS:
+            raise ValueError("unknown scan format '%s', use one of %s" % (scan_format, ", ".join(self.SCAN_FORMATS)))
         
         self.patients_filename = patient_file
         self.dir_data = data_dir
@@ -22,92 +42,275 @@ class patient_filewriter():
 
         csv_processor.create_directory_if_missing(self.dir_data)
 
+        #Parse patients file once, kept up to date by add_patient
+        self.registry = patient_registry(self.patients_filename, self.dir_data)
+
+        self.writer_pool = writer_pool
+        self.scan_format = scan_format
+        self.__scan_channels__ = {}     #binary filename -> number of channels
+
+        self.journal = None
+        if journal_scan_data == True:
+            self.journal = scan_journal(self.writer_pool)
+
+        self.write_behind = write_behind
+        self.__commands__ = None
+        self.__mirror__ = {}    #filename -> rows of files created while writing behind, read instead of the file
+        self.__error__ = None   #first exception raised on the worker since the last flush or close
+        if self.write_behind == True:
+            self.__commands__ = queue.Queue()
+            self.__worker__ = threading.Thread(target=self.__write_worker__, name="patient_filewriter", daemon=True)
+            self.__worker__.start()
+
     def create_patient_file(self, patient: patient):
         """
         Creates patient data file
         """
         filename = self.dir_data + patient.to_string() + ".csv"
         patient.filename = filename
-        open(filename, 'x', newline='')
-    
+        if self.write_behind == True:
+            self.__mirror__[filename] = []
+        self.__submit__(self.__create_patient_file__, filename, self.scan_format)
+
+    def __create_patient_file__(self, filename, scan_format):
+        if scan_format == "binary":
+            if scan_binary.create(scan_binary.scan_filename(filename)) == False:
+                raise FileExistsError(scan_binary.scan_filename(filename))
+        else:
+            open(filename, 'x', newline='')
+
+    def get_trace_filename(self, patient: patient) -> str:
+        """
+        Get the trajectory trace file name of the patient, traces are kept in a traces directory inside the data directory
+        """
+        trace_dir = self.dir_data + "traces/"
+        csv_processor.create_directory_if_missing(trace_dir)
+        return trace_dir + patient.to_string() + "_trace" + scan_binary.EXTENSION
+
     def add_patient(self, new_patient: patient):
         '''
         add patient to list, check if duplicates exist and increment iteration counter
 
         '''
-        prev_patients = self.get_patients()
-
-        #Remove iteration number to simplify counting iterations
-        compare_list = []
-        for prev_patient in prev_patients:
-            compare_list.append(prev_patient.get_compare_data())
-        
         #Add iteration number to patient
-        iteration = compare_list.count(new_patient.get_compare_data())
+        iteration = self.registry.get_iteration_count(new_patient)
         new_patient.set_iteration(iteration + 1) #start from 1 not 0
         new_patient.generate_filename(self.dir_data)
         
-        csv_processor.append_csv(self.patients_filename, new_patient.get_data())
+        self.__submit__(csv_processor.append_csv, self.patients_filename, new_patient.get_data())
+        self.registry.insert(new_patient)
 
         return new_patient
 
-    def get_patients(self) -> list[patient]:
+    def get_patients(self) -> tuple[patient, ...]:
         '''
-        Get list of patients that have been scanned.
-        Parses patients stored in txt file to patient objects
+        Get patients that have been scanned, sorted by study and id.
+        Served from the registry as a read only tuple, the patients file is not reparsed
         '''  
-        lines = csv_processor.get_lines(self.patients_filename)
-        
-        #Ignore header
-        lines = lines[1:]
-
-        lines.sort(key=self.sort)
-
-        #Convert to list of patients
-        list = []
-        for item in lines:
-            a_patient = patient(item[0], item[1], item[2], item[3], item[4], item[5])
-            a_patient.set_iteration(int(item[6]))
-            a_patient.generate_filename(self.dir_data)
-            list.append(a_patient)
-        
-        return list
+        return self.registry.get_patients()
     
     def sort(self, list):
         """
         Sort based on study and id
         """
-        return list[0].lower() + list[1].lower()
+        return patient_registry.sort_key(list)
     
     def save_patient_scan_data(self, patient:patient, data):
         """
-        Save data to patient file
+        Save data to patient file. Csv files keep 2 decimals of float values, binary files keep full precision
         """
-        csv_processor.append_csv(patient.filename, data)
+        if patient.filename in self.__mirror__:
+            self.__mirror__[patient.filename].append(self.__mirror_row__(data))
+        self.__submit__(self.__save_patient_scan_data__, patient, self.scan_format, data)
+
+    def __save_patient_scan_data__(self, patient:patient, scan_format, data):
+        started = instrumentation.start()
+        if scan_format == "binary":
+            filename = scan_binary.scan_filename(patient.filename)
+            row = scan_binary.encode_row(data, self.__get_scan_channels__(filename))
+            if self.writer_pool != None:
+                self.writer_pool.append_bytes(filename, row)
+            else:
+                with open(filename, 'ab') as file:
+                    file.write(row)
+            instrumentation.stop("file.append", started)
+            return
+
+        data = self.__csv_row__(data)
+        if self.journal != None:
+            self.journal.append(patient.filename, data)
+        elif self.writer_pool != None:
+            self.writer_pool.append(patient.filename, data)
+        else:
+            csv_processor.append_csv(patient.filename, data)
+        instrumentation.stop("file.append", started)
     
     def remove_patient_scan_data(self, patient:patient, line_index):
         """
         Remove a line of data from the patient's data file
         """
-        csv_processor.remove_line(patient.filename, line_index)
+        rows = self.__mirror__.get(patient.filename)
+        if rows != None and 1 <= line_index <= len(rows):
+            rows.pop(line_index - 1)
+        self.__submit__(self.__remove_patient_scan_data__, patient, self.scan_format, line_index)
+
+    def __remove_patient_scan_data__(self, patient:patient, scan_format, line_index):
+        binary_filename = scan_binary.scan_filename(patient.filename)
+        if scan_format == "binary" or os.path.isfile(binary_filename):
+            self.__remove_binary_row__(binary_filename, line_index)
+        elif self.journal != None:
+            self.journal.remove(patient.filename, line_index)
+        else:
+            if self.writer_pool != None:
+                self.writer_pool.close(patient.filename)
+            csv_processor.remove_line(patient.filename, line_index)
     
-    def get_patient_scan_data(self, patient:patient) -> list[str]:
+    def get_patient_scan_data(self, patient:patient) -> list[list]:
         """
-        Get all datalines from patient file
+        Get all datalines from patient file. Lines from csv files are strings, lines from binary files are floats
         """
+        rows = self.__mirror__.get(patient.filename)
+        if rows != None:
+            return [list(row) for row in rows]
+
+        binary_filename = scan_binary.scan_filename(patient.filename)
+        self.__wait__()
+
+        if os.path.isfile(binary_filename):
+            return scan_binary.get_rows(binary_filename)
         return csv_processor.get_lines(patient.filename)
+
+    def get_patient_scan_view(self, patient:patient) -> scan_binary.scan_view:
+        """
+        Memory map the patient's binary scan data, columns are read without parsing. None when there is no binary file.
+        The view must be closed when done
+        """
+        self.__wait__()
+        binary_filename = scan_binary.scan_filename(patient.filename)
+        if not os.path.isfile(binary_filename):
+            return None
+        return scan_binary.scan_view(binary_filename)
     
-    def get_patients_ui(self) ->list[str]:
+    def get_patients_ui(self) -> tuple[str, ...]:
         """
-        Gets a list of all patients represented as strings, intended for ui displays
+        Gets all patients represented as strings, intended for ui displays. Read only tuple shared until a patient is added
         """
-        patients = self.get_patients()
+        return self.registry.get_patients_ui()
 
-        str_list = []
-        for patient in patients:
-            str_list.append(patient.study + "," + patient.id + "," + patient.iteration)
-        
-        return str_list
+    def close_patient_file(self, patient:patient):
+        """
+        Write any buffered scan data and close the patient's data file
+        """
+        if self.writer_pool != None:
+            self.__submit__(self.writer_pool.close, patient.filename)
+
+    def flush(self):
+        """
+        Write all queued and buffered data to disk, returns once it is written.
+        Raises the first exception of a queued write that failed, the failed data is not on disk
+        """
+        self.__wait__()
+        self.__raise_error__()
+
+    def close(self):
+        """
+        Write any queued or buffered scan data and close all open data files, returns once it is written.
+        Raises the first exception of a queued write that failed, the files are still closed
+        """
+        if self.writer_pool != None:
+            self.__submit__(self.writer_pool.close)
+        if self.__commands__ != None:
+            self.__commands__.join()
+        self.__mirror__ = {}
+        self.__raise_error__()
+
+    def __wait__(self):
+        """
+        Write all queued and buffered data to disk, a failed write is kept for the next flush() or close()
+        """
+        if self.writer_pool != None:
+            self.__submit__(self.writer_pool.flush)
+        if self.__commands__ != None:
+            self.__commands__.join()
+
+    def __raise_error__(self):
+        """
+        Raise the failure recorded by the worker once. Rows in memory may not match the files, so files are read from now on
+        """
+        error = self.__error__
+        if error != None:
+            self.__error__ = None
+            self.__mirror__ = {}
+            raise error
+
+    def __submit__(self, function, *args):
+        """
+        Run a file operation, queued for the worker thread when writing behind
+        """
+        if self.__commands__ == None:
+            function(*args)
+        else:
+            self.__commands__.put((function, args))
+
+    def __write_worker__(self):
+        """
+        Run queued file operations in order. A failed operation is reported, recorded for flush() and close(),
+        and the following ones still run
+        """
+        while True:
+            function, args = self.__commands__.get()
+            try:
+                function(*args)
+            except Exception as error:
+                print("file operation " + function.__name__ + " failed")
+                print(error)
+                if self.__error__ == None:
+                    self.__error__ = error
+            finally:
+                self.__commands__.task_done()
+
+    def __mirror_row__(self, data) -> list:
+        """
+        The row as get_patient_scan_data would read it back from the file
+        """
+        if self.scan_format == "binary":
+            channel_count = len(scan_binary.DEFAULT_CHANNELS)
+            return list(struct.unpack("<%dd" % channel_count, scan_binary.encode_row(data, channel_count)))
+        return ["" if value == None else str(value) for value in self.__csv_row__(data)]
+
+    def __csv_row__(self, data) -> list:
+        """
+        Format float values with 2 decimals for csv files
+        """
+        return ["{:.2f}".format(value) if isinstance(value, float) else value for value in data]
+
+    def __get_scan_channels__(self, filename) -> int:
+        """
+        Get the number of channels in a binary scan file, the header is only read once
+        """
+        channels = self.__scan_channels__.get(filename)
+        if channels == None:
+            channels = len(scan_binary.read_header(filename)[0])
+            self.__scan_channels__[filename] = channels
+        return channels
+
+    def __remove_binary_row__(self, filename, line_index):
+        """
+        Remove a row from a binary scan file, the last row is removed by truncating the file
+        """
+        if self.writer_pool != None:
+            self.writer_pool.flush(filename)
+
+        channels, header_size = scan_binary.read_header(filename)
+        row_size = 8 * len(channels)
+        row_count = (os.path.getsize(filename) - header_size) // row_size
+
+        if line_index == row_count and self.writer_pool != None:
+            self.writer_pool.truncate(filename, header_size + (row_count - 1) * row_size)
+        else:
+            if self.writer_pool != None:
+                self.writer_pool.close(filename)
+            scan_binary.remove_row(filename, line_index)
     
 if __name__ == "__main__":
     writer = patient_filewriter("./patients.csv", "./patient_scan_data")
@@ -0,0 +1,118 @@
+"""
+    Description: in-memory index of the patients file, loaded once and updated as patients are added
+"""
+import bisect
+
+import csv_processor
+from patient import patient
+
+class patient_registry():
+    """
+    Sorted index of all patients keyed by (study, id). The patients file is only parsed once,
+    new patients are inserted in sorted position instead of reparsing the file
+    """
+
+    def __init__(self, patient_file, data_dir):
+        """
+        Load the patients file into the index
+        """
+        self.patients_filename = patient_file
+        self.dir_data = data_dir
+
+        self.__keys__ = []          #sort keys, parallel to __patients__
+        self.__patients__ = []      #patient objects sorted by study and id
+        self.__ui_strings__ = []    #"study,id,iteration" strings, parallel to __patients__
+        self.__iterations__ = {}    #(study, id) -> number of saved iterations
+        self.__patients_view__ = None   #read only copies returned by the getters, rebuilt after the next change
+        self.__ui_view__ = None
+
+        self.load()
+
+    @staticmethod
+    def sort_key(row) -> str:
+        """
+        Sort based on study and id, row is a line from the patients file
+        """
+        return row[0].lower() + row[1].lower()
+
+    def load(self):
+        """
+        Parse the patients file and rebuild the index
+        """
+        lines = csv_processor.get_lines(self.patients_filename)
+
+        #Ignore header
+        lines = lines[1:]
+
+        #stable sort, patients with the same study and id stay in file order
+        lines.sort(key=self.sort_key)
+
+        self.__keys__ = []
+        self.__patients__ = []
+        self.__ui_strings__ = []
+        self.__iterations__ = {}
+        self.__patients_view__ = None
+        self.__ui_view__ = None
+
+        for item in lines:
+            a_patient = patient(item[0], item[1], item[2], item[3], item[4], item[5])
+            a_patient.set_iteration(int(item[6]))
+            a_patient.generate_filename(self.dir_data)
+
+            self.__keys__.append(self.sort_key(item))
+            self.__patients__.append(a_patient)
+            self.__ui_strings__.append(self.__ui_string__(a_patient))
+            self.__count__(a_patient)
+
+    def get_iteration_count(self, a_patient: patient) -> int:
+        """
+        Get the number of saved iterations with the same study and id as a_patient
+        """
+        return self.__iterations__.get(tuple(a_patient.get_compare_data()), 0)
+
+    def insert(self, new_patient: patient):
+        """
+        Add a patient to the index in sorted position. Does not write to the patients file
+        """
+        key = self.sort_key(new_patient.get_data())
+
+        #insert after patients with an equal key, same order as a full reload
+        index = bisect.bisect_right(self.__keys__, key)
+        self.__keys__.insert(index, key)
+        self.__patients__.insert(index, new_patient)
+        self.__ui_strings__.insert(index, self.__ui_string__(new_patient))
+        self.__count__(new_patient)
+        self.__patients_view__ = None
+        self.__ui_view__ = None
+
+    def get_patients(self) -> tuple[patient, ...]:
+        """
+        Get all patients sorted by study and id. The tuple is shared between calls until a patient is added
+        """
+        if self.__patients_view__ == None:
+            self.__patients_view__ = tuple(self.__patients__)
+        return self.__patients_view__
+
+    def get_patients_ui(self) -> tuple[str, ...]:
+        """
+        Get all patients represented as strings, same order as get_patients(). The tuple is shared between calls until a patient is added
+        """
+        if self.__ui_view__ == None:
+            self.__ui_view__ = tuple(self.__ui_strings__)
+        return self.__ui_view__
+
+    def __len__(self):
+        return len(self.__patients__)
+
+    def __count__(self, a_patient: patient):
+        """
+        Increment the iteration counter for a patient
+        """
+        compare_key = tuple(a_patient.get_compare_data())
+        self.__iterations__[compare_key] = self.__iterations__.get(compare_key, 0) + 1
+
+    def __ui_string__(self, a_patient: patient) -> str:
+        """
+        String representation of a patient for ui displays
+        """
+        return a_patient.study + "," + a_patient.id + "," + a_patient.iteration
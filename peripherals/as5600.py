@@ -3,25 +3,51 @@
     Date: Wed Jul 17 12:40:48 AM MDT 2024
     Description: Driver for as5600 encoder, uses a timer to get consistant data
 """
-import smbus2
+import math
 import time
+from collections import deque
+
+try:
+    import smbus2
+except ImportError:
+    smbus2 = None   #not installed, a bus such as peripherals.simulation.fake_as5600_bus must be passed to as5600
 
 if __name__ == "__main__":
     from RepeatTimer import RepeatTimer
+    from sample_buffer import sample_buffer
+    import instrumentation
 else:
     from peripherals.RepeatTimer import RepeatTimer
+    from peripherals.sample_buffer import sample_buffer
+    from peripherals import instrumentation
 
 class as5600(object):
     """
     Encoder object, must be closed when done using
     """
 
-    def __init__(self, linear_calibration = 1):
+    COUNTS = 4096           #raw angle counts per revolution
+    TARGET_STEP = 256       #counts the magnet should turn between samples, the poll interval is set from the velocity to keep this
+    ALIAS_MARGIN = 1024     #a sample this far from the predicted angle could have been unwrapped the wrong way
+    HISTORY_SECONDS = 10    #time covered by the default sample history at the fastest poll interval
+
+    def __init__(self, linear_calibration = 1, history_size = None, bus = None, start = True,
+                 min_poll_interval = 0.002, max_poll_interval = 0.01, calibration = None):
         """
         Connect to as5600, start polling timer, and set home. Define linear_calibration for accurate linear position. 
-        Run calibrate_as5600.py to get calibration factor
+        Run calibrate_as5600.py to get calibration factor.
+        calibration is a peripherals.calibration_table from a multi-point calibration, it replaces linear_calibration when set.
+        history_size is the number of timestamped samples kept, None keeps at least HISTORY_SECONDS seconds of samples
+        when polling at min_poll_interval (5000 samples at the default interval). trace_recorder and press alignment read from it.
+        bus is the i2c bus, defaults to smbus2 bus 1. peripherals.simulation.fake_as5600_bus can be used off the raspberry pi.
+        start=False does not start the polling timer, used when a peripheral_runtime polls the encoder.
+        The poll interval follows the angular velocity between min_poll_interval while moving fast and max_poll_interval when idle
         """
-        self.bus = smbus2.SMBus(1)
+        if bus == None:
+            if smbus2 == None:
+                raise RuntimeError("smbus2 is not installed, pass a bus such as peripherals.simulation.fake_as5600_bus")
+            bus = smbus2.SMBus(1)
+        self.bus = bus
 
         self.ADDRESS = 0x36
 
@@ -30,18 +56,39 @@ class as5600(object):
         self.home = 0
 
         self.linear_calibration_factor = linear_calibration
+        self.calibration = calibration
+
+        #(monotonic timestamp, raw angle, linear position) of every sample
+        if history_size == None:
+            history_size = int(math.ceil(self.HISTORY_SECONDS / min_poll_interval))
+        self.samples = sample_buffer(history_size, 2)
         
         self.set_home()
         
-        #start timer, updates position buffer every 10ms
-        self.timer = RepeatTimer(0.01, self.__update_buffer__)
-        self.timer.start()
+        #velocity of the magnet in counts per second, used to predict the next angle and choose the poll interval
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.angular_velocity = 0.0
+        self.__last_timestamp__ = None
+
+        #(start timestamp, end timestamp, counts turned) of intervals between samples where aliasing was possible
+        self.aliasing = deque(maxlen=256)
+        self.aliasing_count = 0
+
+        #start timer, updates position buffer every 10ms when idle
+        self.poll_interval = max_poll_interval
+        self.timer = None
+        if start == True:
+            self.timer = RepeatTimer(self.poll_interval, self.__update_buffer__)
+            self.timer.start()
 
     def ReadRawAngle(self):
         """
         Get the binary angular position data from as5600
         """
+        started = instrumentation.start()
         read_bytes = self.bus.read_i2c_block_data(self.ADDRESS, 0x0C, 2) #read 2 bytes from as5600 register 0x0C
+        instrumentation.stop("as5600.ReadRawAngle", started)
         return (read_bytes[0]<<8) | read_bytes[1]
 
     def get_degrees(self):
@@ -65,7 +112,73 @@ class as5600(object):
         """
         Get the current linear position of the as5600 from the buffer in inches
         """
-        return self.position * self.linear_calibration_factor
+        return self.to_inches(self.position)
+
+    def to_inches(self, position) -> float:
+        """
+        Convert a raw linear position to inches with the calibration table, or the linear calibration factor when there is no table
+        """
+        if self.calibration == None:
+            return position * self.linear_calibration_factor
+        return self.calibration.lookup(position)
+
+    def set_calibration(self, calibration):
+        """
+        Use a peripherals.calibration_table for every position, None uses the linear calibration factor
+        """
+        self.calibration = calibration
+
+    def get_latest_sample(self) -> tuple[float, int, float, float]:
+        """
+        Get the newest sample as (timestamp, raw angle, position in inches, age in seconds). None before the first sample
+        """
+        sample = self.samples.latest()
+        if sample == None:
+            return None
+        timestamp, raw_angle, position = sample
+        return timestamp, int(raw_angle), self.to_inches(position), time.monotonic() - timestamp
+
+    def get_samples(self, start, end=None) -> list[tuple[float, int, float]]:
+        """
+        Get samples between the monotonic timestamps start and end as (timestamp, raw angle, position in inches).
+        end defaults to the newest sample
+        """
+        samples = []
+        for timestamp, raw_angle, position in self.samples.get_window(start, end):
+            samples.append((timestamp, int(raw_angle), self.to_inches(position)))
+        return samples
+
+    def get_position_at(self, timestamp) -> tuple[float, float]:
+        """
+        Interpolate the position in inches at a monotonic timestamp from the stored samples.
+        Returns (position, gap), gap is the distance in seconds to the farthest sample used. None before the first sample
+        """
+        result = self.samples.interpolate(timestamp, 1)
+        if result == None:
+            return None
+        position, gap = result
+        return self.to_inches(position), gap
+
+    def get_velocity(self, window = 0.05) -> float:
+        """
+        Estimate the linear velocity in inches per second over the last window seconds of samples
+        """
+        velocity = self.samples.velocity(1, window)
+        if self.calibration == None:
+            return velocity * self.linear_calibration_factor
+        return velocity * self.calibration.slope(self.position)
+
+    def get_aliasing(self, start = None, end = None) -> list[tuple[float, float, int]]:
+        """
+        Get intervals between samples where the magnet may have turned further than could be tracked,
+        as (start timestamp, end timestamp, counts turned). Positions after these intervals can be off by a revolution.
+        start and end are monotonic timestamps, defaults to every interval still stored
+        """
+        intervals = []
+        for interval in list(self.aliasing):
+            if (start == None or interval[1] >= start) and (end == None or interval[0] <= end):
+                intervals.append(interval)
+        return intervals
 
     def set_home(self):
         """
@@ -77,17 +190,23 @@ class as5600(object):
         """
         Stop the timer and release resources
         """
-        self.timer.cancel()
+        if self.timer != None:
+            self.timer.cancel()
     
-    def __linear_position__(self):
+    def __linear_position__(self, raw_angle = None, expected_delta = 0):
         """
-        Calculate the linear position of the encoder
+        Calculate the linear position of the encoder, reads the angle when raw_angle is not given.
+        expected_delta is the change in counts predicted from the velocity
         """
+        if raw_angle == None:
+            raw_angle = self.ReadRawAngle()
         
-        #Calculate change in angle, prevent bit wrap around, assumes encoder did not rotate more and 180 degrees
-        delta = (self.ReadRawAngle() - self.ext_angle) % 4095
-        if delta > 2048:
-            delta -= 4095
+        #Calculate change in angle, prevent bit wrap around, assumes encoder did not rotate more than 180 degrees from the expected angle
+        expected_delta = int(round(expected_delta))
+        delta = (raw_angle - self.ext_angle - expected_delta) % self.COUNTS
+        if delta > self.COUNTS // 2:
+            delta -= self.COUNTS
+        delta += expected_delta
 
         #Add change to current
         self.ext_angle = self.ext_angle+delta
@@ -97,11 +216,56 @@ class as5600(object):
 
         return position - self.home
     
+    def poll(self):
+        """
+        Read the encoder once and store the sample, a peripheral_runtime calls it every poll_interval instead of the timer
+        """
+        self.__update_buffer__()
+
     def __update_buffer__(self):
         """
-        Store the linear position in the buffer
+        Store the linear position in the buffer and the sample history
         """
-        self.position = self.__linear_position__()
+        #timestamp the middle of the i2c read
+        start = time.monotonic()
+        raw_angle = self.ReadRawAngle()
+        timestamp = (start + time.monotonic()) / 2
+
+        #predict the change in angle from the velocity, lets the magnet turn more than 180 degrees between samples while accelerating slowly
+        elapsed = 0.0
+        if self.__last_timestamp__ != None:
+            elapsed = timestamp - self.__last_timestamp__
+        expected_delta = self.angular_velocity * elapsed
+
+        last_angle = self.ext_angle
+        self.position = self.__linear_position__(raw_angle, expected_delta)
+        self.samples.append(timestamp, raw_angle, self.position)
+
+        delta = self.ext_angle - last_angle
+        if elapsed > 0:
+            if abs(delta - expected_delta) > self.ALIAS_MARGIN:
+                self.aliasing.append((self.__last_timestamp__, timestamp, delta))
+                self.aliasing_count += 1
+            self.angular_velocity += 0.5 * (delta / elapsed - self.angular_velocity)
+        self.__last_timestamp__ = timestamp
+
+        self.__adapt_interval__()
+
+    def __adapt_interval__(self):
+        """
+        Poll faster as the magnet speeds up so it turns about TARGET_STEP counts between samples.
+        The interval shortens immediately and lengthens by at most a quarter per sample when slowing down
+        """
+        speed = abs(self.angular_velocity)
+        interval = self.max_poll_interval
+        if speed > 0:
+            interval = min(max(self.TARGET_STEP / speed, self.min_poll_interval), self.max_poll_interval)
+        if interval > self.poll_interval:
+            interval = min(interval, self.poll_interval * 1.25)
+
+        self.poll_interval = interval
+        if self.timer != None:
+            self.timer.interval = interval     #RepeatTimer waits for the current interval every loop
 
 
 
@@ -110,5 +274,5 @@ if __name__ == "__main__":
     while (True):
         position = encoder.get_position()
         raw_pos = encoder.get_raw_position()
-        print("Pos: %s, raw: %s" % (position, raw_pos))
+        print("Pos: %s, raw: %s, poll interval: %.1f ms, aliasing: %d" % (position, raw_pos, encoder.poll_interval * 1000, encoder.aliasing_count))
         time.sleep(1)
\ No newline at end of file
@@ -3,8 +3,13 @@
     Date: Thu Jul 25 03:34:53 PM MDT 2024
     Description: Driver for GPIO button on RPI 4 with pull-up resistor
 """
-import RPi.GPIO as GPIO
 import time
+from threading import Lock, Timer
+
+try:
+    import RPi.GPIO as GPIO
+except ImportError:
+    GPIO = None     #not running on a raspberry pi, a gpio backend must be passed to button
 
 if __name__ == "__main__":
     from RepeatTimer import RepeatTimer
@@ -13,27 +18,55 @@ else:
 
 class button():
         
-    def __init__(self, pin):
+    def __init__(self, pin, edge_detect=False, gpio=None, start=True):
+        """
+        Setup the GPIO pin with a pull-up resistor.
+        edge_detect uses GPIO event detection instead of polling the pin every 10ms.
+        gpio is the backend module, defaults to RPi.GPIO. peripherals.fake_gpio can be used off the raspberry pi.
+        start=False does not poll or detect edges, used when a peripheral_runtime drives the button
+        """
+        if gpio == None:
+            gpio = GPIO
+        if gpio == None:
+            raise RuntimeError("RPi.GPIO is not available, pass a gpio backend such as peripherals.fake_gpio")
+        self.gpio = gpio
 
         #Initialize GPIO
-        GPIO.setmode(GPIO.BOARD)
-        GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        self.gpio.setmode(self.gpio.BOARD)
+        self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
 
         #initalize variables
         self.channel = pin
         self.__button_state__ = True
         self.__prev_state__ = True
         self.__prev_time__ = time.time()
+        self.__edge_time__ = None
 
         #initalize callbakcs
         self.__callback_rise_fall__ = None
         self.__callback_rising__ = None
         self.__callback_falling__ = None
         self.debounce = 50/1000 #ms
-        
-        #start timer, updates position buffer every 10ms
-        self.timer = RepeatTimer(0.01, self.__poll_button__)
-        self.timer.start()
+
+        self.edge_detect = edge_detect
+        self.timer = None
+        self.__recheck_timer__ = None
+        self.__edge_lock__ = Lock()
+        self.__detecting__ = False      #event detection is registered on the pin, released only by stop_edge_detect
+
+        #function(delay, function, *args) that runs a debounce recheck later and returns a handle with cancel().
+        #None uses a threading Timer, a peripheral_runtime sets its event loop's call_later
+        self.call_later = None
+
+        if start == False:
+            pass
+        elif self.edge_detect == True:
+            #backend calls handle_edge from its own thread on every edge
+            self.start_edge_detect()
+        else:
+            #start timer, polls button every 10ms
+            self.timer = RepeatTimer(0.01, self.__poll_button__)
+            self.timer.start()
 
     def set_callbacks(self, rise_fall = None, rising = None, falling = None):
         """
@@ -46,15 +79,58 @@ class button():
         self.__callback_rise_fall__ = rise_fall
         self.__callback_rising__ = rising
     
-    def __poll_button__(self):
+    def start_edge_detect(self, callback = None):
+        """
+        Register GPIO event detection on the pin, the backend calls callback(channel) from its own thread on every edge.
+        callback defaults to handling the edge directly. Does nothing when already registered
+        """
+        if self.__detecting__ == True:
+            return
+        self.gpio.add_event_detect(self.channel, self.gpio.BOTH, callback=callback if callback != None else self.handle_edge)
+        self.__detecting__ = True
+
+    def stop_edge_detect(self):
+        """
+        Cancel a pending debounce recheck and release event detection on the pin, safe to call more than once
+        """
+        if self.__recheck_timer__ != None:
+            self.__recheck_timer__.cancel()
+            self.__recheck_timer__ = None
+        if self.__detecting__ == True:
+            self.gpio.remove_event_detect(self.channel)
+            self.__detecting__ = False
+
+    def get_edge_time(self) -> float:
+        """
+        Get the time.monotonic() timestamp of the last debounced edge, None before the first edge.
+        Callbacks can use it to find when the button was pressed
+        """
+        return self.__edge_time__
+
+    def poll(self) -> bool:
+        """
+        Read the button once and trigger callbacks on a debounced edge, used when edge detection is off and the
+        button is not started. Returns true when a debounced edge was detected
+        """
+        return self.__poll_button__()
+
+    def is_pressed(self) -> bool:
+        """
+        Get the debounced button state, the pin is pulled up so a pressed button reads low
+        """
+        return self.__prev_state__ == False
+
+    def __poll_button__(self, edge_time = None):
         """
         Read the current value of the button and trigger callbacks when button is pressed.
-        Needs to be called constantly to catch button edges
+        Needs to be called constantly to catch button edges. Returns true when a debounced edge was detected.
+        edge_time is when the edge happened, defaults to now
         """
-        self.__button_state__ = GPIO.input(self.channel)
+        self.__button_state__ = self.gpio.input(self.channel)
 
         #Detect button state changed with debounce
         if (self.__button_state__ != self.__prev_state__ and (time.time() - self.__prev_time__) > self.debounce ):
+            self.__edge_time__ = edge_time if edge_time != None else time.monotonic()
             
             #Trigger rising and falling edge callback
             if(self.__callback_rise_fall__ != None):
@@ -71,12 +147,38 @@ class button():
             #Store debounce info
             self.__prev_state__ = self.__button_state__
             self.__prev_time__ = time.time()
+            return True
+
+        return False
+
+    def handle_edge(self, channel, edge_time = None):
+        """
+        Called on a button edge by the GPIO backend, or by the thread a start_edge_detect callback passes edges to.
+        edge_time is the time.monotonic() time of the edge, defaults to now.
+        Edges inside the debounce time are checked again once it has passed, so the final state of a bouncing button is not missed
+        """
+        if edge_time == None:
+            edge_time = time.monotonic()
+
+        with self.__edge_lock__:
+            if self.__poll_button__(edge_time) == False and self.__button_state__ != self.__prev_state__:
+                remaining = self.debounce - (time.time() - self.__prev_time__)
+                if self.__recheck_timer__ != None:
+                    self.__recheck_timer__.cancel()
+                delay = max(remaining, 0) + 0.001
+                if self.call_later != None:
+                    self.__recheck_timer__ = self.call_later(delay, self.handle_edge, channel, edge_time)
+                else:
+                    self.__recheck_timer__ = Timer(delay, self.handle_edge, args=(channel, edge_time))
+                    self.__recheck_timer__.start()
 
     def close (self):
         """
         Release resources
         """
-        self.timer.cancel()
+        if self.timer != None:
+            self.timer.cancel()
+        self.stop_edge_detect()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,203 @@
+"""
+    Description: multi-point encoder calibration, least squares fits of raw encoder positions to distances
+                 and a lookup table that applies the fit to every encoder sample.
+                 Run "python -m peripherals.calibration_table [config file] <trace files>" to recalculate the positions of recorded traces
+"""
+import math
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None   #numpy is only needed to fit a model and for batch conversion, lookups work without it
+
+import scan_binary
+
+'''
+A model is stored as one line of text so it fits in config.csv, raw positions are counts from home:
+    polynomial <start> <end> <c_n> ... <c_0>    polynomial of u = (raw - start) / (end - start), highest power first
+    piecewise <raw>:<distance> <raw>:<distance> ...     straight lines between the points
+Both are extended past the calibrated range with the slope at the nearest end
+'''
+
+def fit_polynomial(raw_positions, distances, degree=3) -> str:
+    """
+    Least squares polynomial through the calibration points. The degree is lowered when there are too few points
+    """
+    raw, distances = __fit_inputs__(raw_positions, distances)
+    degree = max(min(degree, len(raw) - 1), 1)
+
+    start, end = float(raw.min()), float(raw.max())
+    coefficients = np.polyfit((raw - start) / (end - start), distances, degree)
+    return "polynomial %r %r " % (start, end) + " ".join(repr(float(c)) for c in coefficients)
+
+def fit_piecewise(raw_positions, distances, segments=4) -> str:
+    """
+    Least squares continuous piecewise linear fit with segments lines. Breaks are placed so each line covers about the same number of points
+    """
+    raw, distances = __fit_inputs__(raw_positions, distances)
+    segments = max(min(segments, len(raw) - 1), 1)
+
+    breaks = np.unique(np.quantile(raw, np.linspace(0, 1, segments + 1)))     #repeated points can put breaks at the same position
+    #continuous lines are a straight line plus a hinge max(raw - break, 0) at every inner break
+    scale = breaks[-1] - breaks[0]
+    columns = [np.ones_like(raw), (raw - breaks[0]) / scale]
+    for inner in breaks[1:-1]:
+        columns.append(np.maximum(raw - inner, 0) / scale)
+    weights = np.linalg.lstsq(np.column_stack(columns), distances, rcond=None)[0]
+
+    knots = []
+    for point in breaks:
+        basis = [1, (point - breaks[0]) / scale] + [max(point - inner, 0) / scale for inner in breaks[1:-1]]
+        knots.append("%r:%r" % (float(point), float(np.dot(weights, basis))))
+    return "piecewise " + " ".join(knots)
+
+def get_residuals(model, raw_positions, distances) -> list[float]:
+    """
+    Fitted distance - measured distance of every calibration point
+    """
+    table = calibration_table(model)
+    return [table.lookup(raw) - distance for raw, distance in zip(raw_positions, distances)]
+
+def recalibrate_trace(filename, table) -> int:
+    """
+    Recalculate the position column of a trace file (see trace_recorder) from its raw_position column with table.
+    The file is replaced when the new positions are written. Returns the number of rows
+    """
+    channels, header_size = scan_binary.read_header(filename)
+    values = np.fromfile(filename, dtype='<f8', offset=header_size)
+    rows = values[:len(values) - len(values) % len(channels)].reshape(-1, len(channels))   #ignore a partly written row
+
+    rows[:, channels.index("position")] = table.convert(rows[:, channels.index("raw_position")])
+
+    temporary = filename + ".tmp"
+    with open(temporary, 'wb') as file:
+        file.write(scan_binary.encode_header(channels))
+        file.write(rows.astype('<f8').tobytes())
+    os.replace(temporary, filename)
+    return len(rows)
+
+def __fit_inputs__(raw_positions, distances):
+    if np == None:
+        raise RuntimeError("numpy is not installed, it is needed to fit a calibration")
+    raw = np.asarray(raw_positions, dtype=float)
+    distances = np.asarray(distances, dtype=float)
+    if len(raw) < 2 or len(raw) != len(distances):
+        raise ValueError("need at least 2 calibration points with a distance for each")
+    if raw.min() == raw.max():
+        raise ValueError("calibration points must be at different positions")
+    return raw, distances
+
+
+class calibration_table():
+    """
+    Converts raw encoder positions to distances with a model from fit_polynomial or fit_piecewise.
+    The model is evaluated once every step counts, a lookup is one multiply and add between the nearest table entries
+    """
+
+    def __init__(self, model, scale=1, step=16):
+        """
+        model is the text of a fitted model, scale multiplies every distance (application.py flips the direction with -1).
+        Raises ValueError when the model can not be read
+        """
+        self.model = model
+        self.scale = scale
+        self.step = step
+
+        function, self.start, self.end = self.__parse__(model)
+        cells = max(int(math.ceil((self.end - self.start) / step)), 1)
+
+        #distance at the start of every cell and the slope inside it, the last entry is only used for its distance
+        self.__raws__ = [self.start + i * step for i in range(cells + 1)]
+        self.__positions__ = [function(raw) * scale for raw in self.__raws__]
+        self.__slopes__ = [(self.__positions__[i + 1] - self.__positions__[i]) / step for i in range(cells)]
+        self.__inverse_step__ = 1 / step
+        self.__last_cell__ = cells - 1
+
+    def lookup(self, raw) -> float:
+        """
+        Get the distance of a raw position
+        """
+        cell = int((raw - self.start) * self.__inverse_step__)
+        if cell < 0:
+            cell = 0
+        elif cell > self.__last_cell__:
+            cell = self.__last_cell__
+        return self.__positions__[cell] + (raw - self.__raws__[cell]) * self.__slopes__[cell]
+
+    def slope(self, raw) -> float:
+        """
+        Get the distance per count at a raw position, converts velocities
+        """
+        cell = int((raw - self.start) * self.__inverse_step__)
+        return self.__slopes__[min(max(cell, 0), self.__last_cell__)]
+
+    def convert(self, raw_positions):
+        """
+        Get the distances of many raw positions at once, a numpy array when numpy is installed
+        """
+        if np == None:
+            return [self.lookup(raw) for raw in raw_positions]
+
+        raw = np.asarray(raw_positions, dtype=float)
+        #nan positions (load cell rows of a trace) stay nan
+        cells = np.clip(np.nan_to_num((raw - self.start) * self.__inverse_step__).astype(np.int64), 0, self.__last_cell__)
+        raws = np.asarray(self.__raws__)
+        return np.asarray(self.__positions__)[cells] + (raw - raws[cells]) * np.asarray(self.__slopes__)[cells]
+
+    def __parse__(self, model):
+        """
+        Get the model as a function of raw position and the calibrated range
+        """
+        words = model.split()
+        try:
+            if len(words) >= 4 and words[0] == "polynomial":
+                start, end = float(words[1]), float(words[2])
+                coefficients = [float(word) for word in words[3:]]
+                if end <= start:
+                    raise ValueError("end must be after start")
+                def polynomial(raw):
+                    u = (raw - start) / (end - start)
+                    value = 0.0
+                    for coefficient in coefficients:
+                        value = value * u + coefficient
+                    return value
+                return polynomial, start, end
+
+            if len(words) >= 3 and words[0] == "piecewise":
+                knots = sorted(tuple(float(value) for value in word.split(":")) for word in words[1:])
+                if any(len(knot) != 2 for knot in knots):
+                    raise ValueError("points must be raw:distance")
+                if any(knots[i][0] >= knots[i + 1][0] for i in range(len(knots) - 1)):
+                    raise ValueError("points must be at different positions")
+                def piecewise(raw):
+                    for i in range(1, len(knots) - 1):
+                        if raw < knots[i][0]:
+                            break
+                    else:
+                        i = len(knots) - 1
+                    (raw_a, distance_a), (raw_b, distance_b) = knots[i - 1], knots[i]
+                    return distance_a + (raw - raw_a) * (distance_b - distance_a) / (raw_b - raw_a)
+                return piecewise, knots[0][0], knots[-1][0]
+        except ValueError as error:
+            raise ValueError("invalid calibration model '%s': %s" % (model, error))
+
+        raise ValueError("invalid calibration model '%s'" % model)
+
+
+if __name__ == "__main__":
+    import sys
+    from app_config import app_config
+
+    if len(sys.argv) < 3:
+        print("usage: python -m peripherals.calibration_table [config file] <trace files>")
+        sys.exit(1)
+
+    config = app_config(sys.argv[1])
+    if config.encoder_model != "":
+        table = calibration_table(config.encoder_model, scale=-1)
+    else:
+        table = calibration_table("piecewise 0:0 1:%r" % config.encoder_calibration, scale=-1)
+
+    for filename in sys.argv[2:]:
+        print("%s: %d rows recalibrated" % (filename, recalibrate_trace(filename, table)))
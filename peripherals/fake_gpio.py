@@ -0,0 +1,194 @@
+"""
+    Description: Stand-in for RPi.GPIO so buttons can be run and benchmarked without a raspberry pi.
+                 Pins are driven by calling press/release/set_input instead of real hardware.
+                 Run "python -m peripherals.fake_gpio" from the repository root to benchmark button modes
+"""
+import queue
+import threading
+import time
+
+#Constants used by RPi.GPIO
+BOARD = 10
+BCM = 11
+IN = 1
+OUT = 0
+HIGH = 1
+LOW = 0
+PUD_OFF = 20
+PUD_DOWN = 21
+PUD_UP = 22
+RISING = 31
+FALLING = 32
+BOTH = 33
+
+__mode__ = None
+__levels__ = {}         #pin -> current input level
+__detect__ = {}         #pin -> (edge, callback)
+__lock__ = threading.Lock()
+
+#Event callbacks run on their own thread like RPi.GPIO
+__events__ = queue.SimpleQueue()
+__event_thread__ = None
+
+
+def setmode(mode):
+    """
+    Set the pin numbering mode
+    """
+    global __mode__
+    __mode__ = mode
+
+def getmode():
+    """
+    Get the pin numbering mode
+    """
+    return __mode__
+
+def setup(channel, direction, pull_up_down=PUD_OFF, initial=LOW):
+    """
+    Setup a pin, inputs start at the level of their pull resistor
+    """
+    with __lock__:
+        if direction == IN:
+            __levels__[channel] = HIGH if pull_up_down == PUD_UP else LOW
+        else:
+            __levels__[channel] = initial
+
+def input(channel) -> int:
+    """
+    Read the level of a pin
+    """
+    return __levels__[channel]
+
+def output(channel, value):
+    """
+    Set the level of an output pin
+    """
+    set_input(channel, value)
+
+def add_event_detect(channel, edge, callback=None, bouncetime=None):
+    """
+    Call callback(channel) on a background thread when the pin has an edge
+    """
+    global __event_thread__
+    with __lock__:
+        if channel in __detect__:
+            raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+        __detect__[channel] = (edge, callback)
+        if __event_thread__ == None:
+            __event_thread__ = threading.Thread(target=__dispatch_events__, daemon=True)
+            __event_thread__.start()
+
+def remove_event_detect(channel):
+    """
+    Stop detecting edges on a pin
+    """
+    with __lock__:
+        __detect__.pop(channel, None)
+
+def cleanup(channel=None):
+    """
+    Reset pins to their default state
+    """
+    with __lock__:
+        if channel == None:
+            __levels__.clear()
+            __detect__.clear()
+        else:
+            __levels__.pop(channel, None)
+            __detect__.pop(channel, None)
+
+def set_input(channel, value):
+    """
+    Drive an input pin to a level, triggers edge detection if the level changed
+    """
+    with __lock__:
+        previous = __levels__.get(channel, HIGH)
+        __levels__[channel] = value
+        detect = __detect__.get(channel)
+
+    if detect == None or previous == value:
+        return
+
+    edge, callback = detect
+    rising = (value == HIGH)
+    if (edge == BOTH or (edge == RISING and rising) or (edge == FALLING and not rising)) and callback != None:
+        __events__.put((callback, channel))
+
+def press(channel):
+    """
+    Press a button wired with a pull-up resistor (pin goes low)
+    """
+    set_input(channel, LOW)
+
+def release(channel):
+    """
+    Release a button wired with a pull-up resistor (pin goes high)
+    """
+    set_input(channel, HIGH)
+
+def bounce(channel, value, count=4, period=0.001):
+    """
+    Toggle a pin count times before settling on value, simulates a mechanical button bouncing
+    """
+    for i in range(count):
+        set_input(channel, value if (i % 2 == 0) else 1 - value)
+        time.sleep(period)
+    set_input(channel, value)
+
+def __dispatch_events__():
+    """
+    Run edge callbacks in the order the edges happened
+    """
+    while True:
+        callback, channel = __events__.get()
+        callback(channel)
+
+
+if __name__ == "__main__":
+    from peripherals.button import button
+    import sys
+
+    PIN = 7
+    presses = 20
+    gpio = sys.modules[__name__]
+
+    for edge_detect in (False, True):
+        cleanup()
+        latencies = []
+        pressed_at = [0]
+        callback_done = threading.Event()
+
+        def on_press():
+            latencies.append(time.perf_counter() - pressed_at[0])
+            callback_done.set()
+
+        test_button = button(PIN, edge_detect=edge_detect, gpio=gpio)
+        test_button.set_callbacks(falling=on_press)
+        time.sleep(test_button.debounce * 1.2)
+
+        #press to callback latency
+        for i in range(presses):
+            callback_done.clear()
+            pressed_at[0] = time.perf_counter()
+            press(PIN)
+            callback_done.wait(1)
+            time.sleep(test_button.debounce * 1.2)
+            release(PIN)
+            time.sleep(test_button.debounce * 1.2)
+
+        #cpu used while idle
+        idle_time = 2
+        cpu_start = time.process_time()
+        time.sleep(idle_time)
+        cpu_idle = time.process_time() - cpu_start
+
+        test_button.close()
+
+        mode = "edge" if edge_detect else "poll"
+        latencies.sort()
+        print("%s: %d/%d presses, latency avg %.3f ms, max %.3f ms, idle cpu %.2f%%" % (
+            mode, len(latencies), presses,
+            1000 * sum(latencies) / max(len(latencies), 1),
+            1000 * (latencies[-1] if latencies else 0),
+            100 * cpu_idle / idle_time))
@@ -0,0 +1,205 @@
+"""
+    Description: timing of each stage from sensor read to display, kept as rolling histograms and saved as json or csv
+"""
+import csv
+import json
+import math
+import threading
+import time
+from array import array
+
+'''
+Recording is off until enable() is called, disabled stages cost one check.
+Stage names used by the application:
+    as5600.ReadRawAngle         i2c read of the encoder angle
+    openscale.parse             parsing lines received from the openscale
+    file.append                 saving one row of scan data
+    tk_indicator.update         moving an indicator bar
+    sensor_to_pixel.position    age of the encoder sample when an indicator bar moved
+    sensor_to_pixel.force       age of the openscale sample when an indicator bar moved
+'''
+enabled = False
+
+#histogram bucket upper edges in seconds, 1us doubling up to ~16s. The last bucket counts everything larger
+BUCKET_EDGES = [0.000001 * 2 ** i for i in range(25)]
+
+__histograms__ = {}
+__histograms_lock__ = threading.Lock()
+__window__ = 4096
+
+
+class rolling_histogram():
+    """
+    The most recent durations of one stage. Statistics and buckets are calculated from the last window durations
+    """
+
+    def __init__(self, window=4096):
+        self.window = window
+        self.count = 0      #durations recorded, including ones that left the window
+        self.__values__ = array('d', bytes(8 * window))
+        self.__lock__ = threading.Lock()
+
+    def record(self, seconds):
+        with self.__lock__:
+            self.__values__[self.count % self.window] = seconds
+            self.count += 1
+
+    def get_values(self) -> list[float]:
+        """
+        Get the durations in the window, oldest first
+        """
+        with self.__lock__:
+            if self.count <= self.window:
+                return self.__values__[:self.count].tolist()
+            start = self.count % self.window
+            return (self.__values__[start:] + self.__values__[:start]).tolist()
+
+    def get_buckets(self) -> list[int]:
+        """
+        Count of durations in the window at or below each edge of BUCKET_EDGES and above the last edge
+        """
+        buckets = [0] * (len(BUCKET_EDGES) + 1)
+        for value in self.get_values():
+            if value <= BUCKET_EDGES[0]:
+                buckets[0] += 1
+            else:
+                buckets[min(math.ceil(math.log2(value / BUCKET_EDGES[0])), len(BUCKET_EDGES))] += 1
+        return buckets
+
+    def get_summary(self) -> dict:
+        """
+        Get count, mean, min, percentiles and max of the durations in the window, in seconds
+        """
+        values = sorted(self.get_values())
+        if len(values) == 0:
+            return {"count": self.count, "window": 0}
+
+        def percentile(p):
+            return values[min(int(p / 100 * len(values)), len(values) - 1)]
+
+        return {
+            "count": self.count,
+            "window": len(values),
+            "mean": sum(values) / len(values),
+            "min": values[0],
+            "p50": percentile(50),
+            "p90": percentile(90),
+            "p99": percentile(99),
+            "max": values[-1],
+        }
+
+
+def enable(window=4096):
+    """
+    Start recording, window is the number of recent durations kept per stage
+    """
+    global enabled, __window__
+    __window__ = window
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+def start():
+    """
+    Start timing a stage, pass the result to stop(). Returns None when recording is disabled
+    """
+    if enabled == False:
+        return None
+    return time.perf_counter()
+
+def stop(stage, started):
+    """
+    Record the time since start() for a stage
+    """
+    if started == None:
+        return
+    record(stage, time.perf_counter() - started)
+
+def record(stage, seconds):
+    """
+    Record a duration for a stage
+    """
+    if enabled == False:
+        return
+    histogram = __histograms__.get(stage)
+    if histogram == None:
+        with __histograms_lock__:
+            histogram = __histograms__.setdefault(stage, rolling_histogram(__window__))
+    histogram.record(seconds)
+
+def record_age(stage, timestamp):
+    """
+    Record the time since a time.monotonic() timestamp, used for sensor to display latency
+    """
+    if enabled == False or timestamp == None:
+        return
+    record(stage, time.monotonic() - timestamp)
+
+def get_histogram(stage) -> rolling_histogram:
+    return __histograms__.get(stage)
+
+def get_summary() -> dict:
+    """
+    Get the summary of every stage by stage name
+    """
+    return {stage: histogram.get_summary() for stage, histogram in sorted(__histograms__.items())}
+
+def reset():
+    """
+    Remove all recorded durations
+    """
+    with __histograms_lock__:
+        __histograms__.clear()
+
+def dump_json(filename):
+    """
+    Save the summary and histogram buckets of every stage as json
+    """
+    stages = {}
+    for stage, histogram in sorted(__histograms__.items()):
+        stages[stage] = histogram.get_summary()
+        stages[stage]["buckets"] = histogram.get_buckets()
+
+    with open(filename, 'w') as file:
+        json.dump({"bucket_edges": BUCKET_EDGES, "stages": stages}, file, indent=1)
+
+def dump_csv(filename):
+    """
+    Save one row per stage, times in milliseconds followed by the count in each histogram bucket
+    """
+    statistics = ["mean", "min", "p50", "p90", "p99", "max"]
+    header = ["stage", "count", "window"] + [name + "_ms" for name in statistics]
+    header += ["le_%gms" % (edge * 1000) for edge in BUCKET_EDGES] + ["gt_%gms" % (BUCKET_EDGES[-1] * 1000)]
+
+    lines = [header]
+    for stage, histogram in sorted(__histograms__.items()):
+        summary = histogram.get_summary()
+        line = [stage, summary["count"], summary["window"]]
+        line += ["%.4f" % (summary[name] * 1000) if name in summary else "" for name in statistics]
+        lines.append(line + histogram.get_buckets())
+
+    with open(filename, 'w', newline='') as file:
+        csv.writer(file).writerows(lines)
+
+
+if __name__ == "__main__":
+    #time the simulated encoder and openscale for a few seconds, run with "python -m peripherals.instrumentation"
+    from peripherals import instrumentation     #the module the peripherals record to, not this __main__ copy
+    from peripherals import simulation
+    from peripherals.as5600 import as5600
+    from peripherals.openscale import openscale
+
+    instrumentation.enable()
+    hardware = simulation.simulated_hardware("sweep")
+    load_cell = openscale(serial_port=hardware.serial_port)
+    encoder = as5600(bus=hardware.encoder_bus)
+    time.sleep(3)
+
+    for stage, summary in instrumentation.get_summary().items():
+        print("%-24s %6d samples, p50 %.3f ms, p99 %.3f ms" % (stage, summary["count"], summary["p50"] * 1000, summary["p99"] * 1000))
+
+    encoder.close()
+    load_cell.close()
+    hardware.close()
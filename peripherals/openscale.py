@@ -1,7 +1,13 @@
-import serial
 import time
+from threading import Event, Thread
 
-from peripherals.RepeatTimer import RepeatTimer
+from peripherals.sample_buffer import sample_buffer
+from peripherals import instrumentation
+
+try:
+    import serial
+except ImportError:
+    serial = None   #pyserial not installed, a serial_port such as peripherals.simulation.fake_serial must be passed to openscale
 
 
 '''
@@ -16,84 +22,166 @@ class openscale(object):
     port = '/dev/ttyUSB0'
     BAUDRATE = 115200
 
-    serial_port = serial.Serial(port, BAUDRATE, timeout=0.1)
+    def __init__ (self, history_size = 256, port = None, serial_port = None, start = True):
+        """
+        Open the serial port and start streaming samples from the openscale. history_size is the number of timestamped samples kept.
+        port is the serial device, defaults to /dev/ttyUSB0.
+        serial_port is an already open port and replaces port, peripherals.simulation.fake_serial can be used off the raspberry pi.
+        start=False does not start the streaming thread, used when a peripheral_runtime reads the port
+        """
+        if serial_port == None:
+            if serial == None:
+                raise RuntimeError("pyserial is not installed, pass a serial_port such as peripherals.simulation.fake_serial")
+            if port != None:
+                self.port = port
+            serial_port = serial.Serial(self.port, self.BAUDRATE, timeout=0.1)
+        self.serial_port = serial_port
 
-    def __init__ (self):
         time.sleep(2) #wait for inital messages to be sent
 
         self.__force_buffer__ = 0
+        self.__unit__ = ""
+        self.__last_line__ = b''
+        self.__partial_line__ = b''
+        self.__first_sample__ = Event()     #set when the first valid line is received
+
+        #(monotonic timestamp, force, openscale timestamp) of every line received
+        self.samples = sample_buffer(history_size, 2)
 
-        #Start repeat timer, update force buffer every 60ms
-        self.timer = RepeatTimer(0.06, self.__update_buffer__)
-        self.timer.start() 
+        #Start streaming thread, reads every line sent by the openscale
+        self.__streaming__ = start
+        self.reader = None
+        if start == True:
+            self.reader = Thread(target=self.__stream__, daemon=True)
+            self.reader.start()
 
     
-    def get_binary (self) -> bytes:
+    def get_binary (self, timeout = 1) -> bytes:
         '''
-        get binary line of data from openscale over usb
+        get the newest binary line of data received from openscale over usb.
+        Waits up to timeout seconds for the first line, None if no line was received
         '''
-        #clear buffer
-        self.serial_port.reset_input_buffer()
+        if not self.__first_sample__.wait(timeout):
+            return None
+        return self.__last_line__
 
-        #loop till line is read from openscale
-        data = b''
-        while (data == b''):
-            data = self.serial_port.readline()
-
-            # Verify data
-            # valid data has 3 commas (timestamp, weight, unit,)
-            if ( (data.count(b',') == 3) and (data != None) ):
-                return bytes(data)
-
-    def get_line (self) -> list[str]:
+    def get_line (self, timeout = 1) -> list[str]:
         '''
-        returns iterable string representation of openscale data
+        returns iterable string representation of the newest openscale data.
+        Waits up to timeout seconds for the first line, None if no line was received
         '''        
-
-        #Sometimes none is returned, prevent by calling method again
-        while (True):
-            data_line = self.get_binary()
-            if (data_line != None): 
-                break
-        
-        #convert to string
-        data_line = data_line.decode('utf-8')
-
-        #convert to iterable list
-        data_list = data_line.split(',')
-
-        return data_list
+        data_line = self.get_binary(timeout)
+        if data_line == None:
+            return None
+        return data_line.decode('utf-8').split(',')
     
     def get_force (self) -> float:
         '''
         returns force on scale as a float
         '''
         return self.__force_buffer__
+
+    def get_latest_sample (self) -> tuple[float, float, float]:
+        '''
+        get the newest sample as (timestamp, force, age in seconds). None before the first sample
+        '''
+        sample = self.samples.latest()
+        if sample == None:
+            return None
+        timestamp, force, board_time = sample
+        return timestamp, force, time.monotonic() - timestamp
+    
+    def get_force_at (self, timestamp) -> tuple[float, float]:
+        '''
+        interpolate the force at a time.monotonic() timestamp from the stored samples.
+        Returns (force, gap), gap is the distance in seconds to the farthest sample used. None before the first sample
+        '''
+        return self.samples.interpolate(timestamp, 0)
     
     def get_unit (self) -> str:
         '''
         get the current unit
         '''
-        data_list = self.get_line()        
-        return data_list[2]
+        return self.__unit__
     
     def close (self):
         """
         Release resources
         """
-        self.timer.cancel()
+        self.__streaming__ = False
+        if self.reader != None:
+            self.reader.join()
+        self.serial_port.close()
     
-    def __update_buffer__(self):
+    def __stream__(self):
+        """
+        Read from the serial port until closed
+        """
+        while self.__streaming__:
+            self.__read_available__()
+
+    def __read_available__(self):
+        """
+        Read all pending bytes, waits up to the serial timeout when nothing is pending
+        """
+        data = self.serial_port.read(max(self.serial_port.in_waiting, 1))
+        if data:
+            self.__parse__(data, time.monotonic())
+
+    def read_pending(self):
         """
-        Get newest measurement and store in buffer
+        Read the bytes that are already pending without waiting, a peripheral_runtime calls it when the port has data
         """
-        data_list = self.get_line()        
-        self.__force_buffer__ = float(data_list[1])
+        waiting = self.serial_port.in_waiting
+        if waiting > 0:
+            data = self.serial_port.read(waiting)
+            if data:
+                self.__parse__(data, time.monotonic())
+
+    def __parse__(self, data: bytes, received_time):
+        """
+        Split received bytes into lines and store every valid line as a sample.
+        received_time is when the newest line arrived, earlier lines in the same read are dated using the openscale timestamps
+        """
+        started = instrumentation.start()
+        try:
+            lines = (self.__partial_line__ + data).split(b'\n')
+            self.__partial_line__ = lines.pop()     #incomplete line, finished by the next read
+
+            # valid data has 3 commas (timestamp, weight, unit,)
+            parsed = []
+            for line in lines:
+                if line.count(b',') != 3:
+                    continue
+                fields = line.split(b',')
+                try:
+                    parsed.append((float(fields[0]), float(fields[1]), line))
+                except ValueError:
+                    continue
+
+            if len(parsed) == 0:
+                return
+
+            newest_board_time = parsed[-1][0]
+            for board_time, force, line in parsed:
+                #openscale timestamps are in milliseconds
+                age = min(max((newest_board_time - board_time) / 1000, 0), 1)
+                self.samples.append(received_time - age, force, board_time)
+
+            board_time, force, line = parsed[-1]
+            self.__last_line__ = line
+            self.__unit__ = line.split(b',')[2].decode('utf-8')
+            self.__force_buffer__ = force
+            self.__first_sample__.set()
+        finally:
+            #reads without a complete line are timed too
+            instrumentation.stop("openscale.parse", started)
 
 
 if __name__ == "__main__":
     weight_sensor = openscale()
     times = []
+    start_count = weight_sensor.samples.get_count()
     
     while True:
         start_bin = time.time()
@@ -103,7 +191,6 @@ if __name__ == "__main__":
         start = time.time()
         mass = weight_sensor.get_force()
         end = time.time()
-        # print(str(mass) + "kg, " + str(end-start) + " seconds")
         print("%s kg, %.3f seconds, binary %.3f seconds" % (mass, (end-start), (end_bin - start_bin)))
 
         times.append((end-start))
@@ -112,8 +199,12 @@ if __name__ == "__main__":
             average = sum(times) / len(times)
             print("\tAverage time for 10 samples is %.3f seconds" % (average))
             print("\tTotal time: %.3f" % sum(times))
+
+            #samples streamed since the last average
+            timestamp, force, age = weight_sensor.get_latest_sample()
+            print("\t%d samples received, newest sample %.3f seconds old" % (weight_sensor.samples.get_count() - start_count, age))
             times.clear()
             time.sleep(2)
+            start_count = weight_sensor.samples.get_count()
         
-        # print(weight_sensor.get_binary())
-        # time.sleep(0.1)
\ No newline at end of file
+        time.sleep(0.1)
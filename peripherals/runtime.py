@@ -0,0 +1,220 @@
+"""
+    Description: Runs all peripherals on one asyncio event loop in a single background thread instead of a timer thread per device
+"""
+import asyncio
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Sensor values read at the same time. A new snapshot replaces the old one after every sensor update
+'''
+sensor_snapshot = namedtuple("sensor_snapshot", ["timestamp", "position", "raw_position", "force", "button_state"])
+
+
+class peripheral_runtime():
+    """
+    Polls the encoder, streams the openscale and handles button edges from one event loop.
+    Devices must be created with start=False, their getters keep working while the runtime runs
+    """
+
+    def __init__(self, encoder=None, load_cell=None, save_button=None, executor_workers=1):
+        """
+        Any device can be None. executor_workers is the number of threads used for blocking i2c reads
+        """
+        self.encoder = encoder
+        self.load_cell = load_cell
+        self.button = save_button
+
+        self.button_interval = 0.01     #button poll interval when it does not use edge detection
+        self.serial_interval = 0.01     #serial poll interval when the port has no file descriptor
+
+        self.__executor__ = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="i2c")
+        self.__loop__ = None
+        self.__thread__ = None
+        self.__tasks__ = []
+        self.__ready__ = threading.Event()
+        self.__snapshot__ = sensor_snapshot(time.monotonic(), 0.0, 0, 0.0, True)
+
+    def start(self):
+        """
+        Start the event loop thread
+        """
+        self.__thread__ = threading.Thread(target=self.__run__, name="peripheral_runtime", daemon=True)
+        self.__thread__.start()
+        self.__ready__.wait()
+        return self
+
+    def stop(self):
+        """
+        Stop reading peripherals and wait for the event loop thread to finish
+        """
+        if self.__loop__ == None:
+            return
+        self.__loop__.call_soon_threadsafe(self.__shutdown__)
+        self.__thread__.join()
+        self.__executor__.shutdown(wait=True)
+        self.__loop__ = None
+
+    def get_snapshot(self) -> sensor_snapshot:
+        """
+        Get the newest values of all sensors as one consistent snapshot
+        """
+        return self.__snapshot__
+
+    def call_soon(self, function, *args):
+        """
+        Run function on the event loop thread, safe to call from any thread
+        """
+        self.__loop__.call_soon_threadsafe(function, *args)
+
+    def __run__(self):
+        """
+        Event loop thread
+        """
+        self.__loop__ = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.__loop__)
+
+        if self.encoder != None:
+            self.__tasks__.append(self.__loop__.create_task(self.__poll_encoder__()))
+        if self.load_cell != None:
+            self.__start_serial__()
+        if self.button != None:
+            self.__start_button__()
+
+        self.__loop__.call_soon(self.__ready__.set)
+        self.__loop__.run_forever()
+
+        #finish cancelled tasks before closing
+        self.__loop__.run_until_complete(asyncio.gather(*self.__tasks__, return_exceptions=True))
+        self.__loop__.close()
+
+    def __shutdown__(self):
+        """
+        Stop all tasks and readers, runs on the event loop thread
+        """
+        for task in self.__tasks__:
+            task.cancel()
+
+        if self.load_cell != None:
+            try:
+                self.__loop__.remove_reader(self.load_cell.serial_port.fileno())
+            except (AttributeError, ValueError, OSError):
+                pass
+
+        if self.button != None:
+            #the button owns its pin, it is only released once even when the button is closed later
+            self.button.stop_edge_detect()
+            self.button.call_later = None
+
+        self.__loop__.stop()
+
+    async def __poll_encoder__(self):
+        """
+        Read the encoder in the executor every poll interval, time spent reading is taken from the wait
+        """
+        while True:
+            started = self.__loop__.time()
+            await self.__loop__.run_in_executor(self.__executor__, self.encoder.poll)
+            self.__publish__()
+            elapsed = self.__loop__.time() - started
+            await asyncio.sleep(max(self.encoder.poll_interval - elapsed, 0))
+
+    def __start_serial__(self):
+        """
+        Read the openscale when the serial port has data, falls back to polling without a file descriptor
+        """
+        try:
+            self.__loop__.add_reader(self.load_cell.serial_port.fileno(), self.__serial_ready__)
+        except (AttributeError, ValueError, OSError, NotImplementedError):
+            self.__tasks__.append(self.__loop__.create_task(self.__poll_serial__()))
+
+    def __serial_ready__(self):
+        """
+        Serial port has data to read
+        """
+        self.load_cell.read_pending()
+        self.__publish__()
+
+    async def __poll_serial__(self):
+        while True:
+            self.__serial_ready__()
+            await asyncio.sleep(self.serial_interval)
+
+    def __start_button__(self):
+        """
+        Handle button edges on the event loop, edge events from the gpio backend thread are passed to the loop.
+        Debounce rechecks are scheduled on the loop too, every button callback runs on the runtime thread
+        """
+        if self.button.edge_detect == True:
+            loop = self.__loop__
+            def on_edge(channel):
+                #timestamp on the backend thread, before waiting for the loop
+                loop.call_soon_threadsafe(self.__button_edge__, channel, time.monotonic())
+            self.button.call_later = self.__button_call_later__
+            self.button.start_edge_detect(on_edge)
+        else:
+            self.__tasks__.append(self.__loop__.create_task(self.__poll_button__()))
+
+    def __button_edge__(self, channel, edge_time):
+        self.button.handle_edge(channel, edge_time)
+        self.__publish__()
+
+    def __button_call_later__(self, delay, function, *args):
+        """
+        Run a button debounce recheck on the event loop after delay seconds, called on the loop thread
+        """
+        def recheck():
+            function(*args)
+            self.__publish__()
+        return self.__loop__.call_later(delay, recheck)
+
+    async def __poll_button__(self):
+        while True:
+            if self.button.poll():
+                self.__publish__()
+            await asyncio.sleep(self.button_interval)
+
+    def __publish__(self):
+        """
+        Replace the snapshot with the newest sensor values
+        """
+        position = 0.0
+        raw_position = 0
+        force = 0.0
+        button_state = True
+
+        if self.encoder != None:
+            position = self.encoder.get_position()
+            raw_position = self.encoder.get_raw_position()
+        if self.load_cell != None:
+            force = self.load_cell.get_force()
+        if self.button != None:
+            button_state = not self.button.is_pressed()
+
+        self.__snapshot__ = sensor_snapshot(time.monotonic(), position, raw_position, force, button_state)
+
+
+if __name__ == "__main__":
+    #run simulated peripherals on the runtime and print snapshots
+    from peripherals import simulation
+    from peripherals.as5600 import as5600
+    from peripherals.openscale import openscale
+    from peripherals.button import button
+
+    hardware = simulation.simulated_hardware("sweep")
+    load_cell = openscale(serial_port=hardware.serial_port, start=False)
+    encoder = as5600(linear_calibration=1.8122e-05, bus=hardware.encoder_bus, start=False)
+    save_button = button(7, edge_detect=True, gpio=hardware.gpio, start=False)
+    save_button.set_callbacks(falling=lambda: print("pressed"))
+    hardware.start_presses(7, period=1)
+
+    runtime = peripheral_runtime(encoder, load_cell, save_button).start()
+    print("threads: %d" % threading.active_count())
+    for i in range(5):
+        time.sleep(1)
+        print(runtime.get_snapshot())
+
+    runtime.stop()
+    hardware.close()
@@ -0,0 +1,174 @@
+"""
+    Description: Fixed size ring buffer of timestamped sensor samples, preallocated so recording a sample never allocates
+"""
+from array import array
+from threading import Lock
+
+
+class sample_buffer():
+    """
+    Stores the newest samples of a sensor. Each sample is a monotonic timestamp and a fixed number of float channels.
+    Samples must be appended in time order. Safe to append from one thread while reading from others
+    """
+
+    def __init__(self, size, channels):
+        """
+        Preallocate room for size samples with the given number of channels
+        """
+        self.size = size
+        self.channels = channels
+
+        self.__times__ = array('d', bytes(8 * size))
+        self.__values__ = [array('d', bytes(8 * size)) for i in range(channels)]
+        self.__count__ = 0      #total samples appended, next sample is stored at __count__ % size
+        self.__lock__ = Lock()
+
+    def append(self, timestamp, *values):
+        """
+        Store a sample, overwrites the oldest sample when the buffer is full
+        """
+        with self.__lock__:
+            index = self.__count__ % self.size
+            self.__times__[index] = timestamp
+            for channel in range(self.channels):
+                self.__values__[channel][index] = values[channel]
+            self.__count__ += 1
+
+    def clear(self):
+        """
+        Remove all samples
+        """
+        with self.__lock__:
+            self.__count__ = 0
+
+    def __len__(self):
+        return min(self.__count__, self.size)
+
+    def get_count(self) -> int:
+        """
+        Get the total number of samples appended, including overwritten samples
+        """
+        return self.__count__
+
+    def latest(self) -> tuple:
+        """
+        Get the newest sample as (timestamp, channel 0, channel 1, ...), None when empty
+        """
+        with self.__lock__:
+            if self.__count__ == 0:
+                return None
+            return self.__sample__((self.__count__ - 1) % self.size)
+
+    def get_window(self, start, end=None) -> list[tuple]:
+        """
+        Get all samples with start <= timestamp <= end in time order, end defaults to the newest sample
+        """
+        with self.__lock__:
+            length = min(self.__count__, self.size)
+            first = self.__search__(start, length)
+            samples = []
+            for i in range(first, length):
+                index = self.__physical__(i)
+                if end != None and self.__times__[index] > end:
+                    break
+                samples.append(self.__sample__(index))
+            return samples
+
+    def get_since(self, count) -> tuple[list[tuple], int]:
+        """
+        Get the samples appended after the total count was count, in time order.
+        Returns the samples and the new count to pass on the next call. Overwritten samples are skipped
+        """
+        with self.__lock__:
+            first = max(count, self.__count__ - self.size)
+            samples = [self.__sample__(i % self.size) for i in range(first, self.__count__)]
+            return samples, self.__count__
+
+    def interpolate(self, timestamp, channel) -> tuple[float, float]:
+        """
+        Linearly interpolate a channel at timestamp from the samples around it.
+        Returns (value, gap) where gap is the distance in seconds to the farthest sample used,
+        timestamps outside the stored samples use the closest sample. Returns None when empty
+        """
+        with self.__lock__:
+            length = min(self.__count__, self.size)
+            if length == 0:
+                return None
+
+            after = self.__search__(timestamp, length)
+            values = self.__values__[channel]
+
+            #timestamp before oldest or after newest sample
+            if after == 0 or after == length:
+                index = self.__physical__(min(after, length - 1))
+                return values[index], abs(timestamp - self.__times__[index])
+
+            index_0 = self.__physical__(after - 1)
+            index_1 = self.__physical__(after)
+            time_0 = self.__times__[index_0]
+            time_1 = self.__times__[index_1]
+
+            if time_1 == time_0:
+                return values[index_1], 0.0
+
+            fraction = (timestamp - time_0) / (time_1 - time_0)
+            value = values[index_0] + (values[index_1] - values[index_0]) * fraction
+            return value, max(timestamp - time_0, time_1 - timestamp)
+
+    def velocity(self, channel, window) -> float:
+        """
+        Estimate the rate of change of a channel per second using a least squares fit over the last window seconds.
+        Returns 0 when there are less than 2 samples
+        """
+        with self.__lock__:
+            length = min(self.__count__, self.size)
+            if length < 2:
+                return 0.0
+
+            newest = self.__times__[self.__physical__(length - 1)]
+            first = min(self.__search__(newest - window, length), length - 2)
+            values = self.__values__[channel]
+
+            #fit relative to newest sample to keep precision
+            n = 0
+            sum_t = sum_v = sum_tt = sum_tv = 0.0
+            for i in range(first, length):
+                index = self.__physical__(i)
+                t = self.__times__[index] - newest
+                v = values[index]
+                n += 1
+                sum_t += t
+                sum_v += v
+                sum_tt += t * t
+                sum_tv += t * v
+
+            denominator = n * sum_tt - sum_t * sum_t
+            if denominator == 0:
+                return 0.0
+            return (n * sum_tv - sum_t * sum_v) / denominator
+
+    def __physical__(self, logical) -> int:
+        """
+        Convert an index from the oldest stored sample to an index in the arrays
+        """
+        return (self.__count__ - min(self.__count__, self.size) + logical) % self.size
+
+    def __search__(self, timestamp, length) -> int:
+        """
+        Binary search for the first stored sample with a timestamp >= timestamp, returns length if there is none
+        """
+        low = 0
+        high = length
+        while low < high:
+            middle = (low + high) // 2
+            if self.__times__[self.__physical__(middle)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __sample__(self, index) -> tuple:
+        """
+        Get the sample stored at an index in the arrays
+        """
+        return (self.__times__[index],) + tuple(values[index] for values in self.__values__)
@@ -0,0 +1,328 @@
+"""
+    Description: Simulated hardware so the application and peripherals can be run on any linux computer.
+                 Set the environment variable ULTRASOUND_SIMULATION to a motion profile name (scan, sweep, static)
+                 to run application.py with simulated sensors.
+                 Run "python -m peripherals.simulation" from the repository root to print simulated sensor values
+"""
+import fcntl
+import math
+import os
+import random
+import select
+import struct
+import termios
+import threading
+import time
+import tty
+
+from peripherals import fake_gpio
+
+
+'''
+Motion profiles, functions of time in seconds since the simulation started.
+Encoder profiles return the extended encoder position in counts (4096 counts per revolution)
+'''
+def static_profile(value=0):
+    """
+    Value never changes
+    """
+    return lambda t: value
+
+def constant_velocity_profile(rate, start=0):
+    """
+    Value changes by rate every second
+    """
+    return lambda t: start + rate * t
+
+def sweep_profile(amplitude, period, offset=0):
+    """
+    Sine wave around offset
+    """
+    return lambda t: offset + amplitude * math.sin(2 * math.pi * t / period)
+
+def scan_profile(step, dwell, move_time, start=0):
+    """
+    Move by step over move_time seconds then hold for dwell seconds, repeats forever.
+    Matches an operator moving the probe between images during a scan
+    """
+    def profile(t):
+        period = dwell + move_time
+        steps, remainder = divmod(t, period)
+        #smooth acceleration and deceleration while moving
+        fraction = 0 if remainder < dwell else (1 - math.cos(math.pi * (remainder - dwell) / move_time)) / 2
+        return start + step * (steps + fraction)
+    return profile
+
+PROFILES = {
+    "static": lambda: (static_profile(0), static_profile(2.5)),
+    "sweep": lambda: (sweep_profile(20000, 8), sweep_profile(1.5, 3, 2.5)),
+    "scan": lambda: (scan_profile(-55000, 3, 2), sweep_profile(0.3, 5, 2.5)),
+}
+
+
+def enabled() -> bool:
+    """
+    Check if the application should use simulated hardware
+    """
+    return os.environ.get("ULTRASOUND_SIMULATION", "") not in ("", "0")
+
+def profile_name() -> str:
+    """
+    Get the motion profile selected by ULTRASOUND_SIMULATION, defaults to scan
+    """
+    name = os.environ.get("ULTRASOUND_SIMULATION", "")
+    return name if name in PROFILES else "scan"
+
+
+class fake_as5600_bus():
+    """
+    Stand-in for smbus2.SMBus with an as5600 attached. Register values are calculated from the motion profile when read
+    """
+    ADDRESS = 0x36
+
+    def __init__(self, profile=None, noise=0, magnitude=2000):
+        """
+        profile returns the extended position in counts at a time, noise adds random counts to every read
+        """
+        self.profile = profile if profile != None else static_profile(0)
+        self.noise = noise
+        self.magnitude = magnitude
+        self.start_time = time.monotonic()
+        self.reads = 0
+
+        #register address -> value, 8 bit registers
+        self.registers = {
+            0x0B: 0x20,     #STATUS, magnet detected
+            0x0C: 0x00,     #RAW ANGLE high
+            0x0D: 0x00,     #RAW ANGLE low
+            0x1B: (magnitude >> 8) & 0x0F,    #MAGNITUDE high
+            0x1C: magnitude & 0xFF,           #MAGNITUDE low
+        }
+
+    def read_i2c_block_data(self, address, register, length) -> list[int]:
+        """
+        Read length registers starting at register
+        """
+        if address != self.ADDRESS:
+            raise OSError("No device at address %s" % hex(address))
+
+        self.reads += 1
+        self.__update_registers__()
+        return [self.registers.get(register + i, 0) for i in range(length)]
+
+    def read_byte_data(self, address, register) -> int:
+        return self.read_i2c_block_data(address, register, 1)[0]
+
+    def close(self):
+        pass
+
+    def __update_registers__(self):
+        """
+        Calculate the raw angle registers from the motion profile
+        """
+        position = self.profile(time.monotonic() - self.start_time)
+        if self.noise > 0:
+            position += random.uniform(-self.noise, self.noise)
+        raw_angle = int(round(position)) % 4096
+
+        self.registers[0x0C] = raw_angle >> 8
+        self.registers[0x0D] = raw_angle & 0xFF
+
+
+class fake_openscale():
+    """
+    Emits openscale lines (timestamp,weight,unit,) on a pseudo terminal at a fixed rate.
+    Open port with pyserial or fake_serial to read them
+    """
+
+    def __init__(self, profile=None, rate=20, unit="kg"):
+        """
+        profile returns the force at a time, rate is lines per second
+        """
+        self.profile = profile if profile != None else static_profile(0)
+        self.rate = rate
+        self.unit = unit
+        self.lines_sent = 0
+        self.lines_dropped = 0
+
+        self.__master__, self.__slave__ = os.openpty()
+        tty.setraw(self.__slave__)     #no echo or line processing
+        os.set_blocking(self.__master__, False)
+        self.port = os.ttyname(self.__slave__)
+
+        self.__running__ = False
+        self.__thread__ = None
+
+    def start(self):
+        """
+        Start sending lines
+        """
+        self.__running__ = True
+        self.__thread__ = threading.Thread(target=self.__emit__, daemon=True)
+        self.__thread__.start()
+        return self
+
+    def close(self):
+        """
+        Stop sending lines and close the pseudo terminal
+        """
+        self.__running__ = False
+        if self.__thread__ != None:
+            self.__thread__.join()
+        os.close(self.__master__)
+        os.close(self.__slave__)
+
+    def __emit__(self):
+        """
+        Send one line every 1/rate seconds
+        """
+        start_time = time.monotonic()
+        next_time = start_time
+        while self.__running__:
+            elapsed = time.monotonic() - start_time
+            line = "%d,%.2f,%s,\r\n" % (elapsed * 1000, self.profile(elapsed), self.unit)
+            try:
+                os.write(self.__master__, line.encode())
+                self.lines_sent += 1
+            except BlockingIOError:
+                self.lines_dropped += 1     #nobody is reading, pseudo terminal buffer is full
+
+            next_time += 1 / self.rate
+            time.sleep(max(next_time - time.monotonic(), 0))
+
+
+class fake_serial():
+    """
+    Minimal replacement for serial.Serial on a pseudo terminal, used when pyserial is not installed
+    """
+
+    def __init__(self, port, timeout=0.1):
+        self.port = port
+        self.timeout = timeout
+        self.__fd__ = os.open(port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+
+    @property
+    def in_waiting(self) -> int:
+        """
+        Number of bytes ready to read
+        """
+        buffer = fcntl.ioctl(self.__fd__, termios.FIONREAD, struct.pack('i', 0))
+        return struct.unpack('i', buffer)[0]
+
+    def read(self, size=1) -> bytes:
+        """
+        Read up to size bytes, waits up to timeout when nothing is ready
+        """
+        ready, _, _ = select.select([self.__fd__], [], [], self.timeout)
+        if len(ready) == 0:
+            return b''
+        try:
+            return os.read(self.__fd__, size)
+        except BlockingIOError:
+            return b''
+
+    def readline(self) -> bytes:
+        """
+        Read until a newline or timeout
+        """
+        line = b''
+        while not line.endswith(b'\n'):
+            data = self.read(1)
+            if data == b'':
+                break
+            line += data
+        return line
+
+    def reset_input_buffer(self):
+        termios.tcflush(self.__fd__, termios.TCIFLUSH)
+
+    def fileno(self) -> int:
+        return self.__fd__
+
+    def close(self):
+        if self.__fd__ != None:
+            os.close(self.__fd__)
+            self.__fd__ = None
+
+
+class press_script():
+    """
+    Presses a fake_gpio button at scripted times on a background thread
+    """
+
+    def __init__(self, channel, times, hold=0.2):
+        """
+        times are seconds after start() when the button is pressed, hold is how long it is held down
+        """
+        self.channel = channel
+        self.times = sorted(times)
+        self.hold = hold
+        self.__stop__ = threading.Event()
+        self.__thread__ = None
+
+    @staticmethod
+    def every(channel, period, count, first=None, hold=0.2):
+        """
+        Press count times, period seconds apart
+        """
+        first = period if first == None else first
+        return press_script(channel, [first + period * i for i in range(count)], hold)
+
+    def start(self):
+        self.__thread__ = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+        return self
+
+    def stop(self):
+        self.__stop__.set()
+
+    def __run__(self):
+        start_time = time.monotonic()
+        for press_time in self.times:
+            if self.__stop__.wait(max(start_time + press_time - time.monotonic(), 0)):
+                return
+            fake_gpio.bounce(self.channel, fake_gpio.LOW)
+            if self.__stop__.wait(self.hold):
+                return
+            fake_gpio.bounce(self.channel, fake_gpio.HIGH)
+
+
+class simulated_hardware():
+    """
+    Everything needed to run the application without hardware, built from one named motion profile
+    """
+
+    def __init__(self, name=None, force_rate=20):
+        """
+        Create the fake devices, name is a key of PROFILES and defaults to the ULTRASOUND_SIMULATION profile
+        """
+        self.name = name if name != None else profile_name()
+        encoder_profile, force_profile = PROFILES[self.name]()
+
+        self.encoder_bus = fake_as5600_bus(encoder_profile, noise=2)
+        self.scale = fake_openscale(force_profile, rate=force_rate).start()
+        self.serial_port = fake_serial(self.scale.port)
+        self.gpio = fake_gpio
+        self.presses = None
+
+    def start_presses(self, channel, period=5, count=1000, first=2.5):
+        """
+        Press the button on channel during each hold of the scan profile
+        """
+        self.presses = press_script.every(channel, period, count, first).start()
+
+    def close(self):
+        if self.presses != None:
+            self.presses.stop()
+        self.scale.close()
+
+
+if __name__ == "__main__":
+    #print simulated sensor values
+    from peripherals.as5600 import as5600
+    hardware = simulated_hardware("sweep")
+    encoder = as5600(linear_calibration=1.8122e-05, bus=hardware.encoder_bus)
+    while True:
+        line = hardware.serial_port.readline()
+        print("position %.3f, openscale %s" % (encoder.get_position(), line))
+        time.sleep(0.5)
@@ -0,0 +1,254 @@
+"""
+    Description: offline repeatability analysis of saved scans. Scans of the same patient are compared image by image.
+                 Run "python repeatability_analysis.py [patients file] [data directory] [--output directory]"
+"""
+import argparse
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import csv_processor
+import scan_binary
+from patient import patient
+from patient_registry import patient_registry
+
+'''
+Every scan of a patient (same study and id, see patient.get_compare_data) is a session, the first session is the baseline.
+Deviations are repeat session - baseline for the same image. The within-subject standard deviation is the spread of
+an image across all sessions, the repeatability coefficient is 2.77 * within-subject sd (95% of repeat differences are smaller)
+'''
+REPEATABILITY_FACTOR = 1.96 * math.sqrt(2)
+
+def load_scan(filename) -> np.ndarray:
+    """
+    Load the position and force columns of a scan data file as an images x 2 array.
+    The binary .scan file is used when it exists, invalid or missing values are nan
+    """
+    binary_filename = scan_binary.scan_filename(filename)
+    if os.path.exists(binary_filename):
+        with scan_binary.scan_view(binary_filename) as view:
+            if view.channel_count < 2:
+                return np.full((len(view), 2), np.nan)
+            #strided views of the map are copied before it is closed
+            return np.column_stack((np.array(view.column(0), dtype=float), np.array(view.column(1), dtype=float)))
+
+    rows = []
+    for line in csv_processor.get_lines(filename):
+        row = []
+        for value in (line + ["", ""])[:2]:
+            try:
+                row.append(float(value))
+            except ValueError:
+                row.append(np.nan)
+        rows.append(row)
+    return np.array(rows, dtype=float).reshape(-1, 2)
+
+def load_scans(filenames, workers=None) -> list[np.ndarray]:
+    """
+    Load scan data files in parallel processes, same order as filenames. workers=1 loads in this process
+    """
+    if workers == 1 or len(filenames) < 2:
+        return [load_scan(filename) for filename in filenames]
+
+    if workers == None:
+        workers = os.cpu_count() or 1
+    chunksize = max(len(filenames) // (4 * workers), 1)    #fewer, larger tasks for many small files
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(load_scan, filenames, chunksize=chunksize))
+
+def find_scan_file(data_dir, a_patient: patient):
+    """
+    Get the scan data file of a patient, None if neither the csv nor the binary file exists
+    """
+    filename = os.path.join(data_dir, a_patient.to_string() + ".csv")
+    if os.path.exists(filename) or os.path.exists(scan_binary.scan_filename(filename)):
+        return filename
+    return None
+
+def group_sessions(patients: list[patient], data_dir) -> tuple[dict, list[str]]:
+    """
+    Group the scan data files of patients by patients.get_compare_data(), sessions are sorted by iteration.
+    Returns ({(study, id): [(iteration, filename)]}, patients without a scan data file)
+    """
+    groups = {}
+    missing = []
+    for a_patient in patients:
+        filename = find_scan_file(data_dir, a_patient)
+        if filename == None:
+            missing.append(a_patient.to_string())
+            continue
+        groups.setdefault(tuple(a_patient.get_compare_data()), []).append((int(a_patient.iteration), filename))
+
+    for sessions in groups.values():
+        sessions.sort()
+    return groups, missing
+
+def analyze_patient(scans: list[np.ndarray]) -> dict:
+    """
+    Compare the sessions of one patient image by image, scans are images x (position, force) arrays.
+    Sessions are cut to the shortest session so every image is compared across all sessions
+    """
+    images = min(len(scan) for scan in scans)
+    stacked = np.stack([scan[:images] for scan in scans])  #sessions x images x (position, force)
+
+    result = {
+        "sessions": len(scans),
+        "images": images,
+        "image_counts": [len(scan) for scan in scans],
+        "deviations": stacked[1:] - stacked[0],            #repeat sessions x images x (position, force)
+        "variances": None,
+    }
+
+    if len(scans) < 2 or images == 0:
+        return result
+
+    result["variances"] = sample_variance(stacked)  #images x (position, force)
+    return result
+
+def sample_variance(stacked: np.ndarray) -> np.ndarray:
+    """
+    Sample variance over the first axis ignoring nan, nan where fewer than 2 values are present.
+    Same as np.nanvar(ddof=1) without its warning for all nan columns
+    """
+    present = np.isfinite(stacked)
+    count = present.sum(axis=0)
+    mean = np.where(present, stacked, 0).sum(axis=0) / np.maximum(count, 1)
+    squares = (np.where(present, stacked - mean, 0) ** 2).sum(axis=0)
+    return np.where(count > 1, squares / np.maximum(count - 1, 1), np.nan)
+
+def finite_mean(values: np.ndarray) -> float:
+    """
+    Mean of the values that are not nan, nan when there are none. Same as np.nanmean without its empty slice warning
+    """
+    values = values[np.isfinite(values)]
+    return float(np.mean(values)) if values.size > 0 else math.nan
+
+def finite_max(values: np.ndarray) -> float:
+    """
+    Largest value that is not nan, nan when there are none
+    """
+    values = values[np.isfinite(values)]
+    return float(np.max(values)) if values.size > 0 else math.nan
+
+def summarize(deviations: np.ndarray, variances: np.ndarray) -> list[float]:
+    """
+    Summary statistics for position and force:
+    mean deviation, mean absolute deviation, rms deviation, max absolute deviation, within-subject sd, repeatability coefficient
+    """
+    summary = []
+    for channel in range(2):
+        channel_deviations = deviations[..., channel]
+        within_sd = math.sqrt(finite_mean(variances[..., channel]))
+        summary += [
+            finite_mean(channel_deviations),
+            finite_mean(np.abs(channel_deviations)),
+            math.sqrt(finite_mean(channel_deviations ** 2)),
+            finite_max(np.abs(channel_deviations)),
+            within_sd,
+            REPEATABILITY_FACTOR * within_sd,
+        ]
+    return [float(value) for value in summary]
+
+SUMMARY_HEADER = [channel + "_" + statistic for channel in ("position", "force")
+                  for statistic in ("mean_dev", "mean_abs_dev", "rms_dev", "max_abs_dev", "within_sd", "repeatability")]
+
+def analyze(patients_filename, data_dir, workers=None) -> dict:
+    """
+    Analyze every patient with more than one session.
+    Returns per image deviations, per patient summaries and per study summaries as lists of rows
+    """
+    registry = patient_registry(patients_filename, data_dir)
+    groups, missing = group_sessions(registry.get_patients(), data_dir)
+
+    #load every file in one pass so the process pool is used for the whole study
+    repeated = [(key, sessions) for key, sessions in sorted(groups.items()) if len(sessions) > 1]
+    filenames = [filename for key, sessions in repeated for iteration, filename in sessions]
+    scans = load_scans(filenames, workers)
+
+    image_rows = []
+    patient_rows = []
+    study_results = {}
+
+    index = 0
+    for (study, id), sessions in repeated:
+        patient_scans = scans[index:index + len(sessions)]
+        index += len(sessions)
+
+        result = analyze_patient(patient_scans)
+        if result["variances"] is None:
+            continue
+
+        #per image deviations of each repeat session from the baseline session
+        deviations = result["deviations"]
+        for session in range(deviations.shape[0]):
+            iteration = sessions[session + 1][0]
+            for image in range(result["images"]):
+                image_rows.append([study, id, iteration, image + 1] + deviations[session, image].tolist())
+
+        patient_rows.append([study, id, result["sessions"], result["images"]] + summarize(deviations, result["variances"]))
+
+        #pooled per study, every image of every patient counts equally
+        study_deviations, study_variances = study_results.setdefault(study, ([], []))
+        study_deviations.append(deviations.reshape(-1, 2))
+        study_variances.append(result["variances"])
+
+    study_rows = []
+    for study, (study_deviations, study_variances) in sorted(study_results.items()):
+        deviations = np.concatenate(study_deviations)
+        variances = np.concatenate(study_variances)
+        study_rows.append([study, len(study_variances), len(variances)] + summarize(deviations, variances))
+
+    return {
+        "images": image_rows,
+        "patients": patient_rows,
+        "studies": study_rows,
+        "single_session": len(groups) - len(repeated),
+        "missing": missing,
+    }
+
+def format_row(row) -> list[str]:
+    """
+    Format floats with 3 decimals for display and csv output
+    """
+    return ["%.3f" % value if isinstance(value, float) else str(value) for value in row]
+
+def print_table(header, rows):
+    """
+    Print rows as aligned columns
+    """
+    table = [header] + [format_row(row) for row in rows]
+    widths = [max(len(row[column]) for row in table) for column in range(len(header))]
+    for row in table:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Repeatability of saved scans, repeat sessions are compared to the first session of each patient")
+    parser.add_argument("patients_file", nargs="?", default="./patients.csv")
+    parser.add_argument("data_dir", nargs="?", default="./patient_scan_data/")
+    parser.add_argument("--output", help="directory to write image_deviations.csv, patient_summary.csv and study_summary.csv")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes used to load files, defaults to the cpu count")
+    args = parser.parse_args()
+
+    results = analyze(args.patients_file, args.data_dir, args.workers)
+
+    image_header = ["study", "id", "iteration", "image", "position_dev", "force_dev"]
+    patient_header = ["study", "id", "sessions", "images"] + SUMMARY_HEADER
+    study_header = ["study", "patients", "images"] + SUMMARY_HEADER
+
+    print("Patients")
+    print_table(patient_header, results["patients"])
+    print("")
+    print("Studies")
+    print_table(study_header, results["studies"])
+    print("")
+    print("%d patients with one session, %d patients without a scan data file" % (results["single_session"], len(results["missing"])))
+
+    if args.output != None:
+        csv_processor.create_directory_if_missing(args.output)
+        for name, header, rows in (("image_deviations.csv", image_header, results["images"]),
+                                   ("patient_summary.csv", patient_header, results["patients"]),
+                                   ("study_summary.csv", study_header, results["studies"])):
+            csv_processor.write_lines(os.path.join(args.output, name), [header] + [format_row(row) for row in rows])
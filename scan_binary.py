@@ -0,0 +1,264 @@
+"""
+    Description: binary scan data files with fixed width float64 columns, read through a memory map without parsing.
+                 Run "python scan_binary.py <csv file or directory>" to convert existing csv scan data files
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import csv_processor
+
+'''
+File layout, all values little endian:
+    magic       4 bytes     b'URSD'
+    version     uint16
+    channels    uint16      number of float64 values in each row
+    header size uint32      bytes before the first row, multiple of 8
+    reserved    uint32
+    names       16 bytes per channel, utf-8 padded with zeros
+    rows        channels float64 values per row, one row per image
+'''
+MAGIC = b'URSD'
+VERSION = 1
+EXTENSION = ".scan"
+NAME_SIZE = 16
+DEFAULT_CHANNELS = ("position", "force", "alignment_ms")
+
+__header__ = struct.Struct("<4sHHII")
+
+
+def scan_filename(filename) -> str:
+    """
+    Get the binary file name for a scan data file, the extension is replaced with .scan
+    """
+    return os.path.splitext(filename)[0] + EXTENSION
+
+def encode_header(channels) -> bytes:
+    """
+    Build the header for a file with the named channels
+    """
+    names = b''
+    for name in channels:
+        encoded = name.encode('utf-8')[:NAME_SIZE]
+        names += encoded + bytes(NAME_SIZE - len(encoded))
+
+    header_size = __header__.size + len(names)
+    header_size += (-header_size) % 8   #keep rows aligned to 8 bytes
+    header = __header__.pack(MAGIC, VERSION, len(channels), header_size, 0) + names
+    return header + bytes(header_size - len(header))
+
+def read_header(filename) -> tuple[list[str], int]:
+    """
+    Get the channel names and header size of a binary scan file
+    """
+    with open(filename, 'rb') as file:
+        fixed = file.read(__header__.size)
+        magic, version, channel_count, header_size, reserved = __header__.unpack(fixed)
+        if magic != MAGIC:
+            raise ValueError(filename + " is not a binary scan file")
+        if version > VERSION:
+            raise ValueError(filename + " has unsupported version " + str(version))
+
+        names = file.read(NAME_SIZE * channel_count)
+        channels = []
+        for i in range(channel_count):
+            channels.append(names[i * NAME_SIZE:(i + 1) * NAME_SIZE].rstrip(b'\0').decode('utf-8'))
+        return channels, header_size
+
+def create(filename, channels=DEFAULT_CHANNELS) -> bool:
+    """
+    Create a binary scan file with no rows. Returns false if the file already exists
+    """
+    try:
+        with open(filename, 'xb') as file:
+            file.write(encode_header(channels))
+        return True
+    except FileExistsError:
+        return False
+
+def encode_row(values, channel_count) -> bytes:
+    """
+    Pack one row, missing values are stored as nan and extra values are dropped
+    """
+    row = [float(value) for value in values[:channel_count]]
+    row += [float("nan")] * (channel_count - len(row))
+    return struct.pack("<%dd" % channel_count, *row)
+
+def append(filename, values, channel_count=len(DEFAULT_CHANNELS)) -> int:
+    """
+    Append one row of values. Returns the byte offset the row starts at
+    """
+    with open(filename, 'ab') as file:
+        offset = file.tell()
+        file.write(encode_row(values, channel_count))
+        return offset
+
+def get_row_count(filename) -> int:
+    """
+    Get the number of rows in the file without reading them
+    """
+    channels, header_size = read_header(filename)
+    return (os.path.getsize(filename) - header_size) // (8 * len(channels))
+
+def remove_row(filename, index):
+    """
+    Remove one row from the file at the index. Index starts at 1.
+    The last row is removed by truncating the file, other rows shift the following rows down
+    """
+    channels, header_size = read_header(filename)
+    row_size = 8 * len(channels)
+    row_count = (os.path.getsize(filename) - header_size) // row_size
+
+    if index < 1 or index > row_count:
+        print("unable to remove row " + str(index))
+        return
+
+    start = header_size + (index - 1) * row_size
+    with open(filename, 'r+b') as file:
+        if index < row_count:
+            file.seek(start + row_size)
+            following = file.read()
+            file.seek(start)
+            file.write(following)
+        file.truncate(header_size + (row_count - 1) * row_size)
+
+
+class scan_view():
+    """
+    Memory mapped binary scan file. Columns are zero copy views of the file, values are never parsed.
+    Call close() when done, the file can not be changed while the view is open on some systems
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.channels, self.header_size = read_header(filename)
+        self.channel_count = len(self.channels)
+
+        self.__file__ = open(filename, 'rb')
+        self.__map__ = None
+        self.__values__ = memoryview(b'').cast('d')
+        self.__views__ = []     #views of the map, released before it is closed
+
+        data_size = os.path.getsize(filename) - self.header_size
+        data_size -= data_size % (8 * self.channel_count)   #ignore a partly written row
+        if data_size > 0:
+            self.__map__ = mmap.mmap(self.__file__.fileno(), 0, access=mmap.ACCESS_READ)
+            whole = memoryview(self.__map__)
+            values = whole[self.header_size:self.header_size + data_size]
+            self.__views__ = [whole, values]
+            if sys.byteorder == 'little':
+                self.__values__ = values.cast('d')
+            else:
+                #stored little endian, swap into a copy on big endian systems
+                swapped = array('d', values.tobytes())
+                swapped.byteswap()
+                self.__values__ = memoryview(swapped)
+
+        self.rows = len(self.__values__) // self.channel_count
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, channel) -> memoryview:
+        """
+        Get every value of a channel by name or index as a strided view, index it like a list
+        """
+        if isinstance(channel, str):
+            channel = self.channels.index(channel)
+        return self.__values__[channel::self.channel_count]
+
+    def row(self, index) -> list[float]:
+        """
+        Get the values of one row, index starts at 0
+        """
+        start = index * self.channel_count
+        return self.__values__[start:start + self.channel_count].tolist()
+
+    def to_rows(self) -> list[list[float]]:
+        """
+        Copy every row into lists
+        """
+        values = self.__values__.tolist()
+        return [values[i:i + self.channel_count] for i in range(0, len(values), self.channel_count)]
+
+    def close(self):
+        """
+        Release the memory map
+        """
+        self.__values__.release()
+        for view in reversed(self.__views__):
+            view.release()
+        if self.__map__ != None:
+            try:
+                self.__map__.close()
+            except BufferError:
+                pass    #columns are still in use, the map is closed once they are garbage collected
+        self.__file__.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def get_rows(filename) -> list[list[float]]:
+    """
+    Get all rows stored in the binary scan file
+    """
+    with scan_view(filename) as view:
+        return view.to_rows()
+
+def convert_csv(csv_filename, binary_filename=None, channels=DEFAULT_CHANNELS) -> str:
+    """
+    Convert a csv scan data file to a binary scan file, the csv file is not changed.
+    Empty values are stored as nan, other values that are not numbers are stored as nan and reported.
+    Returns the binary file name, defaults to the csv name with the .scan extension
+    """
+    if binary_filename == None:
+        binary_filename = scan_filename(csv_filename)
+
+    rows = []
+    invalid = 0
+    for line_number, line in enumerate(csv_processor.get_lines(csv_filename), 1):
+        values = []
+        for value in line[:len(channels)]:
+            try:
+                values.append(float(value))
+            except ValueError:
+                values.append(float("nan"))
+                if value.strip() == '':
+                    continue    #missing value, not an error
+                if invalid == 0:
+                    print("%s line %d: invalid value '%s' stored as nan" % (csv_filename, line_number, value))
+                invalid += 1
+        rows.append(encode_row(values, len(channels)))
+
+    if invalid > 1:
+        print("%s: %d invalid values stored as nan" % (csv_filename, invalid))
+
+    #write to a temporary file first so a failed conversion does not leave a partial file
+    temporary = binary_filename + ".tmp"
+    with open(temporary, 'wb') as file:
+        file.write(encode_header(channels))
+        file.write(b''.join(rows))
+    os.replace(temporary, binary_filename)
+
+    return binary_filename
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python scan_binary.py <csv file or directory>")
+        sys.exit(1)
+
+    path = sys.argv[1]
+    if os.path.isdir(path):
+        filenames = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".csv"))
+    else:
+        filenames = [path]
+
+    for filename in filenames:
+        converted = convert_csv(filename)
+        print("%s -> %s, %d rows" % (filename, converted, get_row_count(converted)))
@@ -0,0 +1,72 @@
+"""
+    Description: append-only journal for patient scan data files, undo truncates the file instead of rewriting it
+"""
+import csv_processor
+
+class scan_journal():
+    """
+    Records the byte offset of every line appended to a scan data file.
+    Removing the last line truncates the file at its recorded offset, so undo costs the same
+    no matter how many images have been saved
+    """
+
+    def __init__(self, writer_pool: csv_processor.csv_writer_pool = None):
+        """
+        Start with no tracked files, offsets are loaded the first time a file is used.
+        Lines are written through writer_pool when given
+        """
+        self.writer_pool = writer_pool
+        self.__offsets__ = {}   #filename -> byte offset of each line
+
+    def append(self, filename, data: list):
+        """
+        Append data to the file as a new line and record where it starts
+        """
+        offsets = self.__get_offsets__(filename)
+        if self.writer_pool != None:
+            offsets.append(self.writer_pool.append(filename, data))
+        else:
+            offsets.append(csv_processor.append_csv(filename, data))
+
+    def remove(self, filename, index):
+        """
+        Remove one line of data from filename at the index. Index starts at 1.
+        The last line is removed by truncating the file, any other line falls back to a full rewrite
+        """
+        offsets = self.__get_offsets__(filename)
+
+        if (index == len(offsets)):
+            if self.writer_pool != None:
+                self.writer_pool.truncate(filename, offsets.pop())
+            else:
+                csv_processor.truncate(filename, offsets.pop())
+        else:
+            if self.writer_pool != None:
+                self.writer_pool.close(filename)
+            csv_processor.remove_line(filename, index)
+            self.forget(filename)
+
+    def get_line_count(self, filename) -> int:
+        """
+        Get the number of lines in the file
+        """
+        return len(self.__get_offsets__(filename))
+
+    def forget(self, filename):
+        """
+        Stop tracking a file, offsets are reloaded the next time it is used.
+        Call when the file is changed outside of the journal
+        """
+        self.__offsets__.pop(filename, None)
+
+    def __get_offsets__(self, filename) -> list[int]:
+        """
+        Get the recorded line offsets of a file, scans the file once if it is not tracked yet
+        """
+        offsets = self.__offsets__.get(filename)
+        if (offsets == None):
+            if self.writer_pool != None:
+                self.writer_pool.flush(filename)
+            offsets = csv_processor.get_line_offsets(filename)
+            self.__offsets__[filename] = offsets
+        return offsets
@@ -0,0 +1,7 @@
+"""
+    Description: pytest setup, modules are imported from the repository root like the application does
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
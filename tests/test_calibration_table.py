@@ -0,0 +1,52 @@
+import pytest
+
+from peripherals import calibration_table
+from peripherals.calibration_table import calibration_table as table
+
+def test_piecewise_lookup():
+    lookup = table("piecewise 0:0 100:10 200:30", step=10)
+    assert lookup.lookup(50) == pytest.approx(5)
+    assert lookup.lookup(150) == pytest.approx(20)
+    assert lookup.slope(150) == pytest.approx(0.2)
+
+    #past the calibrated range the nearest slope continues
+    assert lookup.lookup(-10) == pytest.approx(-1)
+    assert lookup.lookup(250) == pytest.approx(40)
+
+def test_polynomial_lookup_and_scale():
+    #distance = 2 * u^2 over raw 0 to 100
+    lookup = table("polynomial 0 100 2 0 0", scale=-1, step=1)
+    assert lookup.lookup(50) == pytest.approx(-0.5)
+    assert lookup.lookup(100) == pytest.approx(-2)
+
+def test_convert_matches_lookup():
+    lookup = table("piecewise 0:0 100:10 200:30", step=16)
+    raw = [-5, 0, 33.3, 99, 150, 260]
+    assert list(lookup.convert(raw)) == pytest.approx([lookup.lookup(value) for value in raw])
+
+@pytest.mark.parametrize("model", ["", "linear 0 1", "polynomial 5 5 1 0", "piecewise 0:0", "piecewise 0:0 0:1", "piecewise 0:0 a:1"])
+def test_invalid_model(model):
+    with pytest.raises(ValueError):
+        table(model)
+
+def test_fit_polynomial_recovers_curve():
+    pytest.importorskip("numpy")
+    raw = [0, 100, 250, 400, 600, 800, 1000]
+    distances = [0.5 + 0.01 * r + 2e-6 * r * r for r in raw]
+
+    model = calibration_table.fit_polynomial(raw, distances, degree=2)
+    assert max(abs(error) for error in calibration_table.get_residuals(model, raw, distances)) < 1e-3
+
+def test_fit_piecewise_recovers_lines():
+    pytest.importorskip("numpy")
+    raw = [0, 100, 200, 300, 400, 500, 600, 700, 800]
+    distances = [r * 0.1 if r <= 400 else 40 + (r - 400) * 0.05 for r in raw]
+
+    model = calibration_table.fit_piecewise(raw, distances, segments=2)
+    assert model.startswith("piecewise ")
+    assert max(abs(error) for error in calibration_table.get_residuals(model, raw, distances)) < 1e-6
+
+def test_fit_needs_two_positions():
+    pytest.importorskip("numpy")
+    with pytest.raises(ValueError):
+        calibration_table.fit_polynomial([5, 5], [0, 1])
@@ -0,0 +1,62 @@
+import copy
+
+from Custom_tk_widgets.fuzzy_index import fuzzy_index
+
+RECORDS = [
+    ["MSK", "00123", "1", "2", "3", "4", "001"],
+    ["KNEE", "123", "1", "1", "1", "1", "001"],
+    ["MSKA", "001", "1", "1", "1", "1", "001"],
+    ["ACL", "456", "2", "2", "2", "2", "001"],
+]
+
+def test_ranking():
+    index = fuzzy_index(RECORDS)
+    #exact field before prefix before substring
+    assert index.filter("123") == [1, 0]
+    assert index.filter("msk") == [0, 2]
+    assert index.filter("sk") == [0, 2]
+
+def test_every_word_must_match():
+    index = fuzzy_index(RECORDS)
+    assert index.filter("mska 001") == [2]
+    assert index.filter("msk 00123") == [0]
+    assert index.filter("knee 456") == []
+    assert index.filter("") == [0, 1, 2, 3]
+
+def test_typo_only_without_prefix_match():
+    index = fuzzy_index(RECORDS)
+    assert index.filter("kene") == [1]     #swapped letters
+    assert index.filter("acll") == [3]     #extra letter
+    assert index.filter("mks") == [0]      #transposed letters of msk
+    assert index.filter("mkas") == []      #two changes
+    assert index.filter("kne") == [1]      #prefix matches are not mixed with typos
+
+def test_comma_separated_strings():
+    index = fuzzy_index(["MSK,00123,001", "KNEE,123,001"])
+    assert index.filter("knee,123") == [1]
+
+def test_set_values_matches_new_index():
+    index = fuzzy_index(RECORDS)
+    changes = [
+        RECORDS[:1] + [["HIP", "777", "1", "1", "1", "1", "001"]] + RECORDS[1:],
+        RECORDS[2:],
+        RECORDS[::-1],
+        [],
+        RECORDS,
+    ]
+    for values in changes:
+        index.set_values(values)
+        fresh = fuzzy_index(values)
+        assert len(index) == len(values)
+        for query in ("msk", "123", "hip", "kene", "1", "001 2"):
+            assert index.filter(query) == fresh.filter(query)
+
+def test_add():
+    index = fuzzy_index(RECORDS)
+    index.add(["MSK", "999", "1", "1", "1", "1", "001"])
+    assert index.filter("msk") == [0, 4, 2]
+    assert len(index) == 5
+
+def test_copy():
+    index = fuzzy_index(RECORDS)
+    assert copy.copy(index).filter("msk") == [0, 2]
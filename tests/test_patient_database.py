@@ -0,0 +1,65 @@
+import math
+
+import csv_processor
+from patient import patient
+from patient_database import patient_database
+
+HEADER = ["Study","ID","Leg_Pos","Scanner_Pos","Foot_Pos", "Angle_Pos", "Iteration"]
+
+def open_database(tmp_path, migrate_from=None):
+    return patient_database(str(tmp_path / "patients.db"), str(tmp_path / "data") + "/", migrate_from)
+
+def test_migrate_csv(tmp_path, capsys):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    patients_file = str(tmp_path / "patients.csv")
+    csv_processor.write_lines(patients_file, [HEADER,
+        ["MSK", "002", "1", "1", "1", "1", "001"],
+        ["ACL", "001", "2", "2", "2", "2", "001"],
+        ["MSK", "002", "3", "3", "3", "3", "001"],     #same study, id and iteration as the first line
+        ["MSK", "002", "1", "1", "1", "1", "003"],     #no scan data file
+    ])
+    csv_processor.write_lines(str(data_dir / "MSK_002_001.csv"), [["1.5", "2.5", "0.1"], ["3.0", "", "0.2"]])
+
+    database = open_database(tmp_path, migrate_from=patients_file)
+
+    assert "duplicate patient MSK_002_001 not migrated" in capsys.readouterr().out
+    assert database.get_patients_ui() == ["ACL,001,001", "MSK,002,001", "MSK,002,003"]
+    migrated = database.get_patients()[1]
+    assert migrated.get_data()[2] == "1"
+    rows = database.get_patient_scan_data(migrated)
+    assert rows[0] == [1.5, 2.5, 0.1]
+    assert rows[1][0] == 3.0 and math.isnan(rows[1][1])
+
+    #an existing database is not migrated again
+    database.connection.close()
+    assert open_database(tmp_path, migrate_from=patients_file).get_patient_count() == 3
+
+def test_add_patient_iteration_after_skipped(tmp_path):
+    database = open_database(tmp_path)
+    with database.connection:
+        for iteration in (1, 2):
+            existing = patient("MSK", "002", "1", "1", "1", "1")
+            existing.set_iteration(iteration * 2)    #iterations 2 and 4, the second count gives 4 which is already used
+            database.__insert_patient__(existing)
+
+    first = database.add_patient(patient("MSK", "002", "1", "1", "1", "1"))
+    second = database.add_patient(patient("MSK", "002", "1", "1", "1", "1"))
+    assert (first.iteration, second.iteration) == ("003", "005")
+    assert database.add_patient(patient("ACL", "001", "1", "1", "1", "1")).iteration == "001"
+
+def test_remove_scan_data_renumbers(tmp_path):
+    database = open_database(tmp_path)
+    a_patient = database.add_patient(patient("MSK", "001", "1", "1", "1", "1"))
+    for image in range(1, 5):
+        database.save_patient_scan_data(a_patient, [image, image * 10, 0])
+
+    database.remove_patient_scan_data(a_patient, 2)
+    assert [row[0] for row in database.get_patient_scan_data(a_patient)] == [1.0, 3.0, 4.0]
+
+    #the next saved row follows the renumbered rows
+    database.save_patient_scan_data(a_patient, [5, 50, 0])
+    database.remove_patient_scan_data(a_patient, 4)
+    assert [row[0] for row in database.get_patient_scan_data(a_patient)] == [1.0, 3.0, 4.0]
+    images = [row[0] for row in database.connection.execute("SELECT image FROM scan_rows ORDER BY image")]
+    assert images == [1, 2, 3]
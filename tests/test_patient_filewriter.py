@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+import csv_processor
+import scan_binary
+from patient import patient
+from patient_filewriter import patient_filewriter
+
+@pytest.fixture(params=["csv", "binary"])
+def scan_format(request):
+    return request.param
+
+@pytest.fixture
+def paused(monkeypatch):
+    """
+    Hold the worker on its first csv append (adding the patient) until the event is set, later operations stay queued
+    """
+    release = threading.Event()
+    append_csv = csv_processor.append_csv
+    def blocked_append(filename, data):
+        if threading.current_thread().name == "patient_filewriter":
+            release.wait(5)
+        return append_csv(filename, data)
+    monkeypatch.setattr(csv_processor, "append_csv", blocked_append)
+    yield release
+    release.set()
+
+def open_writer(tmp_path, scan_format, writer_pool=None):
+    return patient_filewriter(str(tmp_path / "patients.csv"), str(tmp_path / "data") + "/", journal_scan_data=True,
+                              writer_pool=writer_pool, scan_format=scan_format, write_behind=True)
+
+def start_patient(writer) -> patient:
+    new_patient = writer.add_patient(patient("MSK", "001", "1", "2", "3", "4"))
+    writer.create_patient_file(new_patient)
+    return new_patient
+
+def read_disk(a_patient, scan_format) -> list[list]:
+    if scan_format == "binary":
+        return scan_binary.get_rows(scan_binary.scan_filename(a_patient.filename))
+    return csv_processor.get_lines(a_patient.filename)
+
+def expected_rows(scan_format, rows) -> list[list]:
+    if scan_format == "binary":
+        return [list(row) for row in rows]
+    return [["%.2f" % value for value in row] for row in rows]
+
+def test_operations_run_in_order(tmp_path, scan_format):
+    pool = csv_processor.csv_writer_pool(flush_every=0)
+    writer = open_writer(tmp_path, scan_format, pool)
+    a_patient = start_patient(writer)
+    for image in range(1, 5):
+        writer.save_patient_scan_data(a_patient, [image + 0.125, image * 10.0, 0.5])
+    writer.remove_patient_scan_data(a_patient, 4)   #last row
+    writer.remove_patient_scan_data(a_patient, 1)   #first row
+    writer.save_patient_scan_data(a_patient, [9.0, 90.0, 0.5])
+    writer.close()
+
+    assert read_disk(a_patient, scan_format) == expected_rows(scan_format, [[2.125, 20.0, 0.5], [3.125, 30.0, 0.5], [9.0, 90.0, 0.5]])
+    assert csv_processor.get_lines(str(tmp_path / "patients.csv"))[1] == ["MSK", "001", "1", "2", "3", "4", "001"]
+
+def test_reads_come_from_memory_while_writes_are_queued(tmp_path, scan_format, paused):
+    writer = open_writer(tmp_path, scan_format)
+    a_patient = start_patient(writer)
+    writer.save_patient_scan_data(a_patient, [1.2345, 10.0, 0.5])
+    writer.save_patient_scan_data(a_patient, [2.0, 20.0, 0.5])
+    writer.save_patient_scan_data(a_patient, [3.0, 30.0, 0.5])
+    writer.remove_patient_scan_data(a_patient, 3)
+
+    #nothing is written yet, the worker is still adding the patient
+    rows = writer.get_patient_scan_data(a_patient)
+    assert rows == expected_rows(scan_format, [[1.2345, 10.0, 0.5], [2.0, 20.0, 0.5]])
+
+    #read back exactly what is written to disk
+    paused.set()
+    writer.close()
+    assert read_disk(a_patient, scan_format) == rows
+
+def test_flush_waits_for_queued_writes(tmp_path, scan_format, paused):
+    writer = open_writer(tmp_path, scan_format)
+    a_patient = start_patient(writer)
+    writer.save_patient_scan_data(a_patient, [1.0, 10.0, 0.5])
+    assert csv_processor.get_lines(str(tmp_path / "patients.csv")) == [["Study","ID","Leg_Pos","Scanner_Pos","Foot_Pos", "Angle_Pos", "Iteration"]]
+
+    timer = threading.Timer(0.1, paused.set)
+    timer.start()
+    writer.flush()
+    assert paused.is_set()
+    assert read_disk(a_patient, scan_format) == expected_rows(scan_format, [[1.0, 10.0, 0.5]])
+    writer.close()
+
+def test_failed_write_raised_once(tmp_path, scan_format, capsys):
+    writer = open_writer(tmp_path, scan_format)
+    a_patient = start_patient(writer)
+    writer.flush()
+
+    #the data file already exists, creating it again fails on the worker
+    writer.create_patient_file(a_patient)
+    writer.save_patient_scan_data(a_patient, [1.0, 10.0, 0.5])
+    with pytest.raises(FileExistsError):
+        writer.flush()
+    assert "failed" in capsys.readouterr().out
+    writer.flush()
+
+    #rows are read from the file after a failure
+    assert writer.get_patient_scan_data(a_patient) == read_disk(a_patient, scan_format)
+
+    writer.create_patient_file(a_patient)
+    with pytest.raises(FileExistsError):
+        writer.close()
+    writer.close()
@@ -0,0 +1,47 @@
+import csv_processor
+from patient import patient
+from patient_registry import patient_registry
+
+HEADER = ["Study","ID","Leg_Pos","Scanner_Pos","Foot_Pos", "Angle_Pos", "Iteration"]
+
+def write_patients(filename, rows):
+    csv_processor.write_lines(str(filename), [HEADER] + rows)
+
+def test_patients_sorted_by_study_and_id(tmp_path):
+    write_patients(tmp_path / "patients.csv", [
+        ["msk", "002", "1", "1", "1", "1", "001"],
+        ["ACL", "010", "1", "1", "1", "1", "001"],
+        ["MSK", "001", "1", "1", "1", "1", "001"],
+        ["acl", "010", "2", "2", "2", "2", "002"],
+    ])
+    registry = patient_registry(str(tmp_path / "patients.csv"), str(tmp_path) + "/")
+
+    #case insensitive, equal keys stay in file order
+    assert registry.get_patients_ui() == ("ACL,010,001", "acl,010,002", "MSK,001,001", "msk,002,001")
+
+def test_insert_matches_reload(tmp_path):
+    filename = str(tmp_path / "patients.csv")
+    write_patients(filename, [["MSK", "001", "1", "1", "1", "1", "001"], ["KNEE", "005", "1", "1", "1", "1", "001"]])
+    registry = patient_registry(filename, str(tmp_path) + "/")
+
+    new_patient = patient("KNEE", "005", "2", "2", "2", "2")
+    new_patient.set_iteration(registry.get_iteration_count(new_patient) + 1)
+    registry.insert(new_patient)
+    csv_processor.append_csv(filename, new_patient.get_data())
+
+    assert registry.get_patients_ui() == patient_registry(filename, str(tmp_path) + "/").get_patients_ui()
+    assert registry.get_iteration_count(new_patient) == 2
+
+def test_get_patients_shared_until_insert(tmp_path):
+    write_patients(tmp_path / "patients.csv", [["MSK", "001", "1", "1", "1", "1", "001"]])
+    registry = patient_registry(str(tmp_path / "patients.csv"), str(tmp_path) + "/")
+
+    patients = registry.get_patients()
+    assert registry.get_patients() is patients
+
+    new_patient = patient("ACL", "001", "1", "1", "1", "1")
+    new_patient.set_iteration(1)
+    registry.insert(new_patient)
+    assert registry.get_patients() is not patients
+    assert len(registry.get_patients()) == 2
+    assert len(patients) == 1
@@ -0,0 +1,55 @@
+import pytest
+
+from peripherals.sample_buffer import sample_buffer
+
+def filled(count, size=4):
+    buffer = sample_buffer(size, 2)
+    for i in range(count):
+        buffer.append(float(i), i * 10.0, -i)
+    return buffer
+
+def test_empty():
+    buffer = sample_buffer(4, 1)
+    assert len(buffer) == 0
+    assert buffer.latest() == None
+    assert buffer.interpolate(1.0, 0) == None
+    assert buffer.velocity(0, 1.0) == 0.0
+
+def test_wraparound_keeps_newest():
+    buffer = filled(10)
+    assert len(buffer) == 4
+    assert buffer.get_count() == 10
+    assert buffer.latest() == (9.0, 90.0, -9.0)
+    assert [sample[0] for sample in buffer.get_window(0)] == [6.0, 7.0, 8.0, 9.0]
+    assert [sample[0] for sample in buffer.get_window(6.5, 8.0)] == [7.0, 8.0]
+
+def test_get_since_skips_overwritten():
+    buffer = filled(3)
+    samples, count = buffer.get_since(0)
+    assert [sample[0] for sample in samples] == [0.0, 1.0, 2.0]
+
+    for i in range(3, 10):
+        buffer.append(float(i), i * 10.0, -i)
+    samples, count = buffer.get_since(count)
+    assert [sample[0] for sample in samples] == [6.0, 7.0, 8.0, 9.0]
+    assert buffer.get_since(count) == ([], 10)
+
+def test_interpolate_across_wrap():
+    buffer = filled(6)     #stored 2..5, the oldest sample is in the middle of the arrays
+    assert buffer.interpolate(3.25, 0) == pytest.approx((32.5, 0.75))
+    assert buffer.interpolate(4.5, 1) == pytest.approx((-4.5, 0.5))
+
+    #outside the stored samples the closest sample is used
+    assert buffer.interpolate(0.0, 0) == (20.0, 2.0)
+    assert buffer.interpolate(7.0, 0) == (50.0, 2.0)
+
+def test_velocity():
+    buffer = filled(10, size=8)
+    assert buffer.velocity(0, 3.0) == pytest.approx(10.0)
+    assert buffer.velocity(1, 100.0) == pytest.approx(-1.0)
+
+def test_clear():
+    buffer = filled(6)
+    buffer.clear()
+    assert len(buffer) == 0
+    assert buffer.get_window(0) == []
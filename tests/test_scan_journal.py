@@ -0,0 +1,54 @@
+import pytest
+
+import csv_processor
+from scan_journal import scan_journal
+
+@pytest.fixture(params=["direct", "pooled"])
+def journal(request):
+    if request.param == "direct":
+        yield scan_journal()
+    else:
+        pool = csv_processor.csv_writer_pool(flush_every=0)
+        yield scan_journal(pool)
+        pool.close()
+
+def get_lines(journal, filename):
+    if journal.writer_pool != None:
+        journal.writer_pool.flush(filename)
+    return csv_processor.get_lines(filename)
+
+def test_remove_last_line_truncates(tmp_path, journal):
+    filename = str(tmp_path / "scan.csv")
+    csv_processor.write_lines(filename, [["Image", "Position"]])
+
+    for image in range(1, 4):
+        journal.append(filename, [image, image * 1.5])
+    assert journal.get_line_count(filename) == 4
+
+    journal.remove(filename, 4)
+    journal.remove(filename, 3)
+    assert get_lines(journal, filename) == [["Image", "Position"], ["1", "1.5"]]
+
+    #appending after a truncate continues from the cut
+    journal.append(filename, [2, 9.0])
+    assert get_lines(journal, filename) == [["Image", "Position"], ["1", "1.5"], ["2", "9.0"]]
+
+def test_remove_middle_line_rewrites(tmp_path, journal):
+    filename = str(tmp_path / "scan.csv")
+    csv_processor.write_lines(filename, [["Image"], ["1"], ["2"], ["3"]])
+
+    journal.remove(filename, 2)
+    assert get_lines(journal, filename) == [["Image"], ["2"], ["3"]]
+
+    #offsets are reloaded after the rewrite so the last line still truncates correctly
+    assert journal.get_line_count(filename) == 3
+    journal.remove(filename, 3)
+    assert get_lines(journal, filename) == [["Image"], ["2"]]
+
+def test_offsets_match_existing_file(tmp_path):
+    filename = str(tmp_path / "scan.csv")
+    csv_processor.write_lines(filename, [["Image"], ["1"], ["2"]])
+
+    journal = scan_journal()
+    journal.remove(filename, 3)
+    assert csv_processor.get_lines(filename) == [["Image"], ["1"]]
@@ -0,0 +1,97 @@
+"""
+    Description: passes events from sensor threads to the tkinter main loop
+"""
+import queue
+import time
+
+class tk_event_queue():
+    """
+    Sensor threads post functions to the queue, the tkinter main loop runs them in batches using after().
+    Tkinter widgets must only be used from the main loop, sensor callbacks post instead of calling the ui directly.
+    Records queue depth and the time from post to handling
+    """
+
+    def __init__(self, root, interval=10, batch_size=64):
+        """
+        interval is the number of milliseconds between checks of the queue, at most batch_size events are handled per check
+        """
+        self.root = root
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self.__queue__ = queue.SimpleQueue()
+        self.__after_id__ = None
+
+        self.reset_stats()
+
+    def post(self, function, *args):
+        """
+        Run function(*args) on the tkinter main loop. Safe to call from any thread, never blocks
+        """
+        self.__queue__.put((time.monotonic(), function, args))
+
+    def start(self):
+        """
+        Start handling events, must be called from the main loop thread
+        """
+        if self.__after_id__ == None:
+            self.__after_id__ = self.root.after(self.interval, self.__drain__)
+
+    def stop(self):
+        """
+        Stop handling events, events still in the queue are handled if started again
+        """
+        if self.__after_id__ != None:
+            self.root.after_cancel(self.__after_id__)
+            self.__after_id__ = None
+
+    def get_depth(self) -> int:
+        """
+        Get the number of events waiting to be handled
+        """
+        return self.__queue__.qsize()
+
+    def get_stats(self) -> dict:
+        """
+        Get the number of handled events, largest queue depth and post to handling latency in seconds
+        """
+        mean_latency = self.__total_latency__ / self.handled if self.handled > 0 else 0.0
+        return {
+            "handled": self.handled,
+            "depth": self.get_depth(),
+            "max_depth": self.max_depth,
+            "mean_latency": mean_latency,
+            "max_latency": self.max_latency,
+        }
+
+    def reset_stats(self):
+        self.handled = 0
+        self.max_depth = 0
+        self.max_latency = 0.0
+        self.__total_latency__ = 0.0
+
+    def __drain__(self):
+        """
+        Handle a batch of events, runs on the main loop
+        """
+        self.max_depth = max(self.max_depth, self.__queue__.qsize())
+
+        for i in range(self.batch_size):
+            try:
+                posted_time, function, args = self.__queue__.get_nowait()
+            except queue.Empty:
+                break
+
+            latency = time.monotonic() - posted_time
+            self.__total_latency__ += latency
+            self.max_latency = max(self.max_latency, latency)
+            self.handled += 1
+
+            #one failing event does not stop the queue
+            try:
+                function(*args)
+            except Exception as error:
+                print("event " + getattr(function, "__name__", str(function)) + " failed")
+                print(error)
+
+        self.__after_id__ = self.root.after(self.interval, self.__drain__)
@@ -0,0 +1,113 @@
+"""
+    Description: records every encoder and load cell sample during a scan to a binary trace file on a background thread
+"""
+import math
+import threading
+import time
+
+import scan_binary
+
+class trace_recorder():
+    """
+    Streams the full sensor trajectory of a scan to a binary scan file (see scan_binary).
+    Samples are collected from the sensors' fixed size sample buffers on a background thread and written in batches,
+    the caller is never blocked by disk writes. Each row is one sample of one sensor, the other sensor's columns are nan
+    """
+
+    CHANNELS = ("time", "position", "raw_position", "force")
+
+    def __init__(self, encoder, load_cell, flush_interval=0.25):
+        """
+        flush_interval is the number of seconds between writes, the sample buffers must hold at least this long of samples
+        """
+        self.encoder = encoder
+        self.load_cell = load_cell
+        self.flush_interval = flush_interval
+
+        self.filename = None
+        self.rows_written = 0
+        self.dropped_samples = 0     #samples overwritten in a sample buffer before they were collected
+
+        self.__start_time__ = 0
+        self.__encoder_count__ = 0
+        self.__force_count__ = 0
+        self.__stop__ = threading.Event()
+        self.__thread__ = None
+        self.__file__ = None
+
+    def is_recording(self) -> bool:
+        return self.__thread__ != None
+
+    def start(self, filename):
+        """
+        Start recording to a new trace file, samples from before start are not recorded
+        """
+        if self.is_recording():
+            self.stop()
+
+        scan_binary.create(filename, self.CHANNELS)
+        self.filename = filename
+        self.__file__ = open(filename, 'ab')
+        self.rows_written = 0
+        self.dropped_samples = 0
+
+        self.__start_time__ = time.monotonic()
+        self.__encoder_count__ = self.encoder.samples.get_count()
+        self.__force_count__ = self.load_cell.samples.get_count()
+
+        self.__stop__.clear()
+        self.__thread__ = threading.Thread(target=self.__run__, name="trace_recorder", daemon=True)
+        self.__thread__.start()
+
+    def stop(self):
+        """
+        Stop recording, remaining samples are written before the trace file is closed
+        """
+        if not self.is_recording():
+            return
+        self.__stop__.set()
+        self.__thread__.join()
+        self.__thread__ = None
+
+    def __run__(self):
+        """
+        Collect and write samples every flush_interval until stopped
+        """
+        while not self.__stop__.wait(self.flush_interval):
+            self.__write_samples__()
+
+        self.__write_samples__()
+        self.__file__.close()
+        self.__file__ = None
+
+    def __write_samples__(self):
+        """
+        Write every sample recorded since the last write, sorted by time
+        """
+        nan = math.nan
+        to_inches = self.encoder.to_inches
+
+        encoder_samples, encoder_count = self.encoder.samples.get_since(self.__encoder_count__)
+        force_samples, force_count = self.load_cell.samples.get_since(self.__force_count__)
+
+        self.dropped_samples += (encoder_count - self.__encoder_count__) - len(encoder_samples)
+        self.dropped_samples += (force_count - self.__force_count__) - len(force_samples)
+        self.__encoder_count__ = encoder_count
+        self.__force_count__ = force_count
+
+        #openscale samples can be dated before they were received, samples from before start are skipped
+        rows = []
+        for timestamp, raw_angle, position in encoder_samples:
+            if timestamp >= self.__start_time__:
+                rows.append((timestamp - self.__start_time__, to_inches(position), position, nan))
+        for timestamp, force, board_time in force_samples:
+            if timestamp >= self.__start_time__:
+                rows.append((timestamp - self.__start_time__, nan, nan, force))
+
+        if len(rows) == 0:
+            return
+
+        rows.sort(key=lambda row: row[0])
+        self.__file__.write(b''.join(scan_binary.encode_row(row, len(self.CHANNELS)) for row in rows))
+        self.__file__.flush()
+        self.rows_written += len(rows)